@@ -25,11 +25,12 @@ def main():
     # App title and brief introduction
     st.title("Future Data AI Agent")
     
-    # Load sample financial data
-    financial_data = load_data()
+    # Render sidebar and get selected page and reporting period
+    # (rendered first so that "Refresh Data" takes effect on this run)
+    selected_page, reporting_period = render_sidebar()
     
-    # Render sidebar and get selected page
-    selected_page = render_sidebar()
+    # Load the shared financial data, reported as of the selected period
+    financial_data = load_data().at_period(reporting_period)
     
     # Render the appropriate dashboard based on user selection
     if selected_page == "Performance Analysis":
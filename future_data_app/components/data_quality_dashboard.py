@@ -32,7 +32,7 @@ def render_data_quality_dashboard(data):
         st.metric(
             label="Overall Data Quality",
             value=f"{quality_metrics['overall_score']}%",
-            delta=f"{quality_metrics['overall_score_change']}%"
+            delta=f"{quality_metrics['overall_score_change']}%" if quality_metrics['overall_score_change'] is not None else None
         )
     
     with col2:
@@ -58,16 +58,18 @@ def render_data_quality_dashboard(data):
     
     with col1:
         st.image("data_quality.png", use_column_width=True)
-
+    
     
     with col2:
         # Data quality score gauge chart
+        # No delta without a previous period to compare with
+        has_previous = quality_metrics['previous_score'] is not None
         fig = go.Figure(go.Indicator(
-            mode="gauge+number+delta",
+            mode="gauge+number+delta" if has_previous else "gauge+number",
             value=quality_metrics['overall_score'],
             domain={'x': [0, 1], 'y': [0, 1]},
             title={'text': "Overall Data Quality Score"},
-            delta={'reference': quality_metrics['previous_score']},
+            delta={'reference': quality_metrics['previous_score']} if has_previous else None,
             gauge={
                 'axis': {'range': [0, 100]},
                 'bar': {'color': "#00C853"},
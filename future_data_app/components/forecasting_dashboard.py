@@ -209,11 +209,13 @@ def render_forecasting_dashboard(data):
                 help="Adjust operational costs"
             )
             
+            # Centered on the period's average rate from the FX rate table
+            base_fx_rate = round(data["metrics"]["fx_rate"] or 1.10, 2)
             fx_rate = st.slider(
                 "EUR/USD FX Rate",
-                min_value=1.00,
-                max_value=1.20,
-                value=1.10,
+                min_value=round(base_fx_rate - 0.10, 2),
+                max_value=round(base_fx_rate + 0.10, 2),
+                value=base_fx_rate,
                 step=0.01,
                 help="Adjust foreign exchange rate"
             )
@@ -12,11 +12,151 @@ import numpy as np
 import os
 from utils.financial_analysis import (
     calculate_yoy_performance,
+    SIGNIFICANT_VARIANCE_PCT,
     calculate_actual_vs_forecast,
     identify_top_performers,
     get_profitability_analysis
 )
 from utils.openai_helper import generate_performance_explanation
+from utils.cache import dataset_cache
+from utils.fx_translation import currency_symbol
+
+# Second axis of the profitability heatmap: ledger dimension and label
+HEATMAP_AXES = {
+    "Entity_ID": "Region",
+    "Cost_Center": "Cost Center"
+}
+
+@dataset_cache()
+def build_yoy_figure(data):
+    """
+    Build the year-over-year growth chart, cached per dataset fingerprint
+    """
+    yoy_data = calculate_yoy_performance(data)
+    
+    fig = px.bar(
+        yoy_data,
+        x="category",
+        y="percent_change",
+        color="percent_change",
+        color_continuous_scale=["red", "yellow", "green"],
+        range_color=[-15, 15],
+        title="Year-over-Year Growth by Category",
+        labels={"percent_change": "% Change", "category": "Category"}
+    )
+    
+    fig.update_layout(height=400)
+    
+    return fig
+
+@dataset_cache()
+def build_actual_vs_forecast_figure(data):
+    """
+    Build the actual vs. forecast chart, cached per dataset fingerprint
+    """
+    actual_vs_forecast = calculate_actual_vs_forecast(data)
+    
+    # Create figure
+    fig = go.Figure()
+    
+    # Add bars for actual and forecast
+    fig.add_trace(
+        go.Bar(
+            x=actual_vs_forecast["category"],
+            y=actual_vs_forecast["actual"],
+            name="Actual",
+            marker_color="#00C853"
+        )
+    )
+    
+    fig.add_trace(
+        go.Bar(
+            x=actual_vs_forecast["category"],
+            y=actual_vs_forecast["forecast"],
+            name="Forecast",
+            marker_color="#0A2463"
+        )
+    )
+    
+    # Add variance line
+    fig.add_trace(
+        go.Scatter(
+            x=actual_vs_forecast["category"],
+            y=actual_vs_forecast["variance_pct"],
+            name="Variance %",
+            yaxis="y2",
+            line=dict(color="red", width=2)
+        )
+    )
+    
+    # Update layout for dual y-axis
+    fig.update_layout(
+        title="Actual vs. Forecast by Category",
+        yaxis=dict(title=f"Amount ({currency_symbol(data.reporting_currency).strip()})"),
+        yaxis2=dict(
+            title="Variance %",
+            overlaying="y",
+            side="right"
+        ),
+        height=400,
+        barmode="group",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    
+    return fig
+
+@dataset_cache()
+def build_performers_figure(data, reverse=False):
+    """
+    Build the top (or bottom, with reverse=True) 5 products chart, cached per dataset fingerprint
+    """
+    products = identify_top_performers(data, top=5, reverse=reverse)
+    
+    if reverse:
+        color_scale = ["red", "yellow"]
+        range_color = [min(products["profit_margin"]), 15]
+        title = "Bottom 5 Products by Profit Margin"
+    else:
+        color_scale = ["yellow", "green"]
+        range_color = [0, max(products["profit_margin"])]
+        title = "Top 5 Products by Profit Margin"
+    
+    fig = px.bar(
+        products,
+        x="name",  # Using the correct column name
+        y="profit_margin",
+        color="profit_margin",
+        color_continuous_scale=color_scale,
+        range_color=range_color,
+        title=title,
+        labels={"profit_margin": "Profit Margin (%)", "name": "Product"}
+    )
+    
+    fig.update_layout(height=350)
+    
+    return fig
+
+@dataset_cache()
+def build_profitability_heatmap(data, second_axis="Entity_ID"):
+    """
+    Build the product profitability heatmap, cached per dataset fingerprint and second axis
+    """
+    profitability_data = get_profitability_analysis(data, second_axis=second_axis)
+    axis_label = HEATMAP_AXES[second_axis]
+    
+    fig = px.imshow(
+        profitability_data["heatmap_data"],
+        labels=dict(x=axis_label, y="Product Category", color="Profit Margin (%)"),
+        x=profitability_data["regions"],
+        y=profitability_data["categories"],
+        color_continuous_scale="RdYlGn",
+        aspect="auto",
+        title=f"Product Profitability by {axis_label}"
+    )
+    
+    fig.update_layout(height=500)
+    
+    return fig
 
 def render_performance_dashboard(data):
     """
@@ -32,7 +172,8 @@ def render_performance_dashboard(data):
         st.image("financial.png",  use_column_width=True)
     
     with col2:
-        # Key performance indicators
+        # Key performance indicators, in the reporting currency
+        symbol = currency_symbol(data.reporting_currency)
         kpi1, kpi2, kpi3 = st.columns(3)
         
         yoy_revenue_growth = data['metrics']['yoy_revenue_growth']
@@ -52,7 +193,7 @@ def render_performance_dashboard(data):
         cash_flow = data['metrics']['operating_cash_flow']
         kpi3.metric(
             label="Operating Cash Flow",
-            value=f"€{cash_flow/1000000:.1f}M",
+            value=f"{symbol}{cash_flow/1000000:.1f}M",
             delta=f"{(cash_flow - data['metrics']['previous_cash_flow'])/1000000:.1f}M"
         )
     
@@ -72,18 +213,7 @@ def render_performance_dashboard(data):
         yoy_data = calculate_yoy_performance(data)
         
         # YoY chart
-        fig = px.bar(
-            yoy_data,
-            x="category",
-            y="percent_change",
-            color="percent_change",
-            color_continuous_scale=["red", "yellow", "green"],
-            range_color=[-15, 15],
-            title="Year-over-Year Growth by Category",
-            labels={"percent_change": "% Change", "category": "Category"}
-        )
-        
-        fig.update_layout(height=400)
+        fig = build_yoy_figure(data)
         st.plotly_chart(fig, use_container_width=True)
         
         # YoY data table
@@ -101,58 +231,12 @@ def render_performance_dashboard(data):
             # Actual vs. Forecast chart
             actual_vs_forecast = calculate_actual_vs_forecast(data)
             
-            # Create figure
-            fig = go.Figure()
-            
-            # Add bars for actual and forecast
-            fig.add_trace(
-                go.Bar(
-                    x=actual_vs_forecast["category"],
-                    y=actual_vs_forecast["actual"],
-                    name="Actual",
-                    marker_color="#00C853"
-                )
-            )
-            
-            fig.add_trace(
-                go.Bar(
-                    x=actual_vs_forecast["category"],
-                    y=actual_vs_forecast["forecast"],
-                    name="Forecast",
-                    marker_color="#0A2463"
-                )
-            )
-            
-            # Add variance line
-            fig.add_trace(
-                go.Scatter(
-                    x=actual_vs_forecast["category"],
-                    y=actual_vs_forecast["variance_pct"],
-                    name="Variance %",
-                    yaxis="y2",
-                    line=dict(color="red", width=2)
-                )
-            )
-            
-            # Update layout for dual y-axis
-            fig.update_layout(
-                title="Actual vs. Forecast by Category",
-                yaxis=dict(title="Amount (€)"),
-                yaxis2=dict(
-                    title="Variance %",
-                    overlaying="y",
-                    side="right"
-                ),
-                height=400,
-                barmode="group",
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-            )
-            
+            fig = build_actual_vs_forecast_figure(data)
             st.plotly_chart(fig, use_container_width=True)
             
             # Explanation of significant variances
             st.subheader("Significant Variances")
-            variance_table = actual_vs_forecast[actual_vs_forecast["variance_pct"].abs() > 5]
+            variance_table = actual_vs_forecast[actual_vs_forecast["variance_pct"].abs() > SIGNIFICANT_VARIANCE_PCT]
             
             if not variance_table.empty:
                 st.dataframe(
@@ -161,7 +245,7 @@ def render_performance_dashboard(data):
                     use_container_width=True
                 )
             else:
-                st.info("No significant variances found (threshold: ±5%)")
+                st.info(f"No significant variances found (threshold: ±{SIGNIFICANT_VARIANCE_PCT}%)")
         except Exception as e:
             st.error(f"Unable to display Actual vs. Forecast analysis. Please contact your administrator.")
             st.info("Using static sample data for demonstration purposes.")
@@ -218,55 +302,23 @@ def render_performance_dashboard(data):
             
             with col1:
                 st.subheader("Top Performing Products")
-                top_products = identify_top_performers(data, top=5)
-                
-                fig = px.bar(
-                    top_products,
-                    x="name",  # Using the correct column name
-                    y="profit_margin",
-                    color="profit_margin",
-                    color_continuous_scale=["yellow", "green"],
-                    range_color=[0, max(top_products["profit_margin"])],
-                    title="Top 5 Products by Profit Margin",
-                    labels={"profit_margin": "Profit Margin (%)", "name": "Product"}
-                )
-                
-                fig.update_layout(height=350)
+                fig = build_performers_figure(data)
                 st.plotly_chart(fig, use_container_width=True)
             
             with col2:
                 st.subheader("Bottom Performing Products")
-                bottom_products = identify_top_performers(data, top=5, reverse=True)
-                
-                fig = px.bar(
-                    bottom_products,
-                    x="name",  # Using the correct column name
-                    y="profit_margin",
-                    color="profit_margin",
-                    color_continuous_scale=["red", "yellow"],
-                    range_color=[min(bottom_products["profit_margin"]), 15],
-                    title="Bottom 5 Products by Profit Margin",
-                    labels={"profit_margin": "Profit Margin (%)", "name": "Product"}
-                )
-                
-                fig.update_layout(height=350)
+                fig = build_performers_figure(data, reverse=True)
                 st.plotly_chart(fig, use_container_width=True)
             
-            # Profitability heatmap
+            # Profitability heatmap, by region (entity) or drilled into cost centers
             st.subheader("Product Profitability Heatmap")
-            profitability_data = get_profitability_analysis(data)
-            
-            fig = px.imshow(
-                profitability_data["heatmap_data"],
-                labels=dict(x="Region", y="Product Category", color="Profit Margin (%)"),
-                x=profitability_data["regions"],
-                y=profitability_data["categories"],
-                color_continuous_scale="RdYlGn",
-                aspect="auto",
-                title="Product Profitability by Region"
+            second_axis = st.radio(
+                "Break down by:",
+                options=list(HEATMAP_AXES),
+                format_func=HEATMAP_AXES.get,
+                horizontal=True
             )
-            
-            fig.update_layout(height=500)
+            fig = build_profitability_heatmap(data, second_axis)
             st.plotly_chart(fig, use_container_width=True)
             
             # Product drill-down selector
@@ -284,14 +336,17 @@ def render_performance_dashboard(data):
                 col1, col2 = st.columns(2)
                 
                 with col1:
-                    st.metric("Revenue", f"€{product_data['revenue']/1000000:.2f}M")
+                    st.metric("Revenue", f"{symbol}{product_data['revenue']/1000000:.2f}M")
                     st.metric("Profit Margin", f"{product_data['profit_margin']:.1f}%")
                     st.metric("YoY Growth", f"{product_data['yoy_growth']:.1f}%")
                 
                 with col2:
-                    st.metric("Cost", f"€{product_data['cost']/1000000:.2f}M")
+                    st.metric("Cost", f"{symbol}{product_data['cost']/1000000:.2f}M")
                     st.metric("Market Share", f"{product_data['market_share']:.1f}%")
-                    st.metric("Customer Satisfaction", f"{product_data['customer_satisfaction']:.1f}/5.0")
+                    
+                    # Not part of the consolidation export: only shown when a source provides it
+                    if pd.notna(product_data["customer_satisfaction"]):
+                        st.metric("Customer Satisfaction", f"{product_data['customer_satisfaction']:.1f}/5.0")
                 
                 if product_data['profit_margin'] < 10:
                     st.warning(f"""
@@ -384,7 +439,7 @@ def render_performance_dashboard(data):
     # AI Insights tab
     with tabs[3]:
         st.subheader("AI-Generated Performance Insights")
-
+        
         # Check if API key is available        
         if st.button("Generate AI Analysis"):
             if "OPENAI_API_KEY" not in os.environ or not os.environ["OPENAI_API_KEY"] or os.environ["OPENAI_API_KEY"] == "your-api-key-here":
@@ -447,7 +502,7 @@ def render_performance_dashboard(data):
                 # Examples of how to improve further
                 st.subheader("Opportunities for Improvement")
                 st.markdown(sample_analysis["opportunities"])
-                
+            
             else:
                 with st.spinner("Analyzing financial performance..."):
                     # Generate performance explanation using OpenAI
@@ -5,10 +5,12 @@
 
 
 import streamlit as st
+from utils.data_processor import load_data, refresh_data
+from utils.ledger_schema import format_period
 
 def render_sidebar():
     """
-    Renders the sidebar navigation and returns the selected page
+    Renders the sidebar navigation and returns the selected page and reporting period
     """
     st.sidebar.image("attached_assets/logo-transparent.png", 
                      width=200)
@@ -34,16 +36,20 @@ def render_sidebar():
         ["Anaplan", "OneStream", "Oracle Hyperion", "SAP BPC", "IBM Planning Analytics"]
     )
     
-    # Time period selection
-    reporting_period = st.sidebar.selectbox(
-        "Reporting Period",
-        ["Q4 2023", "Q3 2023", "Q2 2023", "Q1 2023", "FY 2022"]
-    )
+    # Time period selection, filled in once the (possibly refreshed) data is loaded
+    reporting_period_slot = st.sidebar.empty()
     
-    # Simulated data refresh button
+    # Data refresh button - invalidates the dataset shared by all sessions
     if st.sidebar.button("Refresh Data"):
+        refresh_data()
         st.sidebar.success("Data refreshed successfully!")
     
+    # Periods of the data, latest first
+    reporting_period = reporting_period_slot.selectbox(
+        "Reporting Period",
+        [format_period(period) for period in reversed(load_data().periods)]
+    )
+    
     # Display data health score
     st.sidebar.metric(
         label="Data Health Score", 
@@ -60,5 +66,5 @@ def render_sidebar():
         For assistance, contact support@futuredata.ai
         """)
     
-    return selected_page
+    return selected_page, reporting_period
 
@@ -7,309 +7,273 @@
 import pandas as pd
 import numpy as np
 
-def generate_sample_financial_data():
+# Plain pandas frames in the export schemas, as a CPM system would deliver them
+# (categorical dimensions, amounts in currency units); the app normalizes them
+# like any export
+
+# Calendar-year quarters, the period frequency of the consolidation export
+PERIOD_FREQUENCY = "Q-DEC"
+
+# Accounts, cost centers, products and currencies of the consolidation export
+LEDGER_ACCOUNTS = ["Revenue", "COGS", "Operating Expenses", "Net Income", "Assets", "Liabilities", "Equity"]
+LEDGER_COST_CENTERS = ["Sales", "Marketing", "R&D", "Finance", "Operations"]
+LEDGER_PRODUCTS = ["Product A", "Product B", "Product C", "Service X", "Service Y"]
+LEDGER_CURRENCIES = ["EUR", "GBP", "USD"]
+
+# Rates to EUR the sample FX rates move around
+SAMPLE_EUR_RATES = {"EUR": 1.0, "GBP": 1.16, "USD": 0.91}
+
+# Direct holdings of the sample group: Subsidiary C is held through A and B
+SAMPLE_OWNERSHIP = [
+    ("ParentCo", "Subsidiary A", 1.0),
+    ("ParentCo", "Subsidiary B", 0.8),
+    ("Subsidiary B", "Subsidiary C", 0.7),
+    ("Subsidiary A", "Subsidiary C", 0.1)
+]
+
+def _quarters(n_periods, last_period="2023Q2"):
     """
-    Generate sample financial data for demonstration purposes
-    In a real scenario, this data would come from the CPM system
+    Build consecutive quarterly periods ending at the given quarter
     """
-    np.random.seed(42)  # For reproducibility
-    
-    # Define time periods
-    periods = ["2021-Q3", "2021-Q4", "2022-Q1", "2022-Q2", 
-              "2022-Q3", "2022-Q4", "2023-Q1", "2023-Q2"]
-    
-    # Define product categories
-    categories = ["Product A", "Product B", "Product C", "Product D", "Product E", 
-                 "Services", "Maintenance", "Licensing", "Consulting"]
-    
-    # Generate revenue data
-    revenue_data = []
-    
-    # Base revenue values per category (millions)
-    base_revenues = {
-        "Product A": 25,
-        "Product B": 18,
-        "Product C": 15,
-        "Product D": 12,
-        "Product E": 10,
-        "Services": 8,
-        "Maintenance": 7,
-        "Licensing": 6,
-        "Consulting": 4
-    }
-    
-    # Generate data for each period and category with growth trend
-    for i, period in enumerate(periods):
-        for category in categories:
-            # Add some growth and seasonality
-            growth_factor = 1 + (i * 0.01) + np.random.normal(0, 0.02)
-            
-            # Add seasonality - Q4 higher, Q1 lower
-            if period.endswith("Q4"):
-                seasonality = 1.1
-            elif period.endswith("Q1"):
-                seasonality = 0.95
-            else:
-                seasonality = 1.0
-            
-            amount = base_revenues[category] * growth_factor * seasonality * 1000000  # Convert to actual value
-            
-            revenue_data.append({
-                "period": period,
-                "category": category,
-                "amount": amount
-            })
-    
-    revenue_df = pd.DataFrame(revenue_data)
-    
-    # Generate cost data
-    cost_data = []
-    
-    # Define cost categories
-    cost_categories = ["COGS", "R&D", "Sales & Marketing", "G&A", "Operations"]
-    
-    # Base cost as percentage of revenue for each category
-    cost_percentages = {
-        "COGS": 0.42,
-        "R&D": 0.12,
-        "Sales & Marketing": 0.15,
-        "G&A": 0.08,
-        "Operations": 0.05
-    }
+    return pd.period_range(end=last_period, periods=n_periods, freq=PERIOD_FREQUENCY)
+
+def _dimension_names(base_names, count, prefix):
+    """
+    Take the first names from a base list, extending it with generated names when needed
+    """
+    names = list(base_names[:count])
+    names.extend(f"{prefix} {i + 1}" for i in range(len(names), count))
     
-    # Calculate total revenue by period
-    total_revenue_by_period = revenue_df.groupby("period")["amount"].sum().to_dict()
+    return names
+
+def _product_currency_codes(n_products):
+    """
+    Currency (code in LEDGER_CURRENCIES) every product line is invoiced in, the
+    sample currencies in turn; shared by the ledger and the intercompany lines
+    so that an intercompany line lands on a balance of its own currency
+    """
+    return np.arange(n_products) % len(LEDGER_CURRENCIES)
+
+def _entity_names(n_entities):
+    """
+    Build entity names: a parent company followed by its subsidiaries
+    """
+    subsidiaries = [
+        f"Subsidiary {chr(ord('A') + i)}" if i < 26 else f"Subsidiary {i + 1}"
+        for i in range(n_entities - 1)
+    ]
     
-    # Generate cost data
-    for period in periods:
-        period_revenue = total_revenue_by_period[period]
-        
-        for cost_category in cost_categories:
-            base_percentage = cost_percentages[cost_category]
-            # Add some variability to the cost percentage
-            actual_percentage = base_percentage + np.random.normal(0, 0.01)
-            
-            amount = period_revenue * actual_percentage
-            
-            cost_data.append({
-                "period": period,
-                "category": cost_category,
-                "amount": amount
-            })
-    
-    cost_df = pd.DataFrame(cost_data)
-    
-    # Generate product data
-    product_data = []
-    
-    product_names = [
-        "Enterprise Server X1", "Enterprise Server X2", "Cloud Storage Basic",
-        "Cloud Storage Premium", "Security Suite Pro", "Security Suite Enterprise",
-        "Networking Basic", "Networking Advanced", "Mobile Solution A",
-        "Mobile Solution B", "Database Standard", "Database Enterprise",
-        "Analytics Basic", "Analytics Premium", "Development Tools",
-        "Integration Suite", "Support Basic", "Support Premium",
-        "Professional Services", "Training Services"
+    return ["ParentCo"] + subsidiaries
+
+def generate_sample_ledger(n_entities=4, n_periods=8, n_categories=5, n_products=5, seed=42):
+    """
+    Generate a synthetic consolidation ledger with the export schema
+    (Entity_ID, Account, Period, Cost_Center, Product, Amount, Currency)
+    
+    One row is produced for every entity x period x account x cost center (category)
+    x product combination, so the row count is 7 * product of the four counts
+    Rows come out in ledger sort order (entity, period, account); dimensions are
+    categoricals and Amount is float64 in currency units. Every product line is
+    booked in one currency
+    Everything is generated with NumPy array operations, which keeps
+    production-size ledgers (10M+ rows) down to a few seconds
+    """
+    rng = np.random.default_rng(seed)
+    
+    # Dimension values
+    entities = _entity_names(n_entities)
+    periods = _quarters(n_periods)
+    cost_centers = _dimension_names(LEDGER_COST_CENTERS, n_categories, "Cost Center")
+    products = _dimension_names(LEDGER_PRODUCTS, n_products, "Product")
+    
+    # Revenue per entity x period x cost center x product cell, built by broadcasting
+    # entity size, product base level, cost center weight, growth trend and seasonality
+    entity_scale = rng.uniform(0.5, 1.5, n_entities)[:, None, None, None]
+    product_base = rng.lognormal(np.log(250000), 0.4, n_products)[None, None, None, :]
+    cost_center_weight = rng.uniform(0.6, 1.4, n_categories)[None, None, :, None]
+    
+    growth_trend = 1 + np.arange(n_periods) * 0.01
+    quarter_numbers = np.asarray(periods.quarter)
+    seasonality = np.select([quarter_numbers == 4, quarter_numbers == 1], [1.1, 0.95], 1.0)
+    period_factor = (growth_trend * seasonality)[None, :, None, None]
+    
+    cell_shape = (n_entities, n_periods, n_categories, n_products)
+    revenue = (
+        entity_scale * product_base * cost_center_weight * period_factor
+        * rng.normal(1.0, 0.05, cell_shape)
+    )
+    
+    # Derive the remaining accounts from revenue so that the ledger is internally consistent
+    cogs = revenue * rng.uniform(0.35, 0.50, cell_shape)
+    operating_expenses = revenue * rng.uniform(0.15, 0.30, cell_shape)
+    net_income = revenue - cogs - operating_expenses
+    assets = revenue * rng.uniform(1.5, 2.5, cell_shape)
+    liabilities = assets * rng.uniform(0.4, 0.6, cell_shape)
+    equity = assets - liabilities
+    
+    # Stack the accounts into entity x period x account x cost center x product order
+    amounts = np.stack(
+        [revenue, cogs, operating_expenses, net_income, assets, liabilities, equity],
+        axis=2
+    )
+    
+    # Dimension columns are built from integer codes, never from Python strings per row
+    ledger_shape = amounts.shape
+    dimensions = [
+        ("Entity_ID", entities),
+        ("Period", periods),
+        ("Account", LEDGER_ACCOUNTS),
+        ("Cost_Center", cost_centers),
+        ("Product", products)
     ]
     
-    for i, name in enumerate(product_names):
-        # Generate synthetic product data
-        revenue = np.random.uniform(2.0, 30.0) * 1000000  # Between 2M and 30M
-        cost = revenue * np.random.uniform(0.5, 0.85)  # Cost is 50-85% of revenue
-        profit = revenue - cost
-        profit_margin = (profit / revenue) * 100
+    ledger = {}
+    
+    for axis, (column, values) in enumerate(dimensions):
+        axis_shape = [1] * len(ledger_shape)
+        axis_shape[axis] = len(values)
         
-        product_data.append({
-            "id": i + 1,
-            "name": name,
-            "revenue": revenue,
-            "cost": cost,
-            "profit_margin": profit_margin,
-            "yoy_growth": np.random.uniform(-5.0, 25.0),  # YoY growth between -5% and 25%
-            "market_share": np.random.uniform(1.0, 15.0),  # Market share between 1% and 15%
-            "customer_satisfaction": np.random.uniform(3.0, 4.8),  # Customer satisfaction between 3.0 and 4.8
-            "raw_material_increase": np.random.uniform(5.0, 25.0) if profit_margin < 15 else 0  # Raw material increase for low-margin products
-        })
-    
-    product_df = pd.DataFrame(product_data)
-    
-    # Generate geographic data
-    geo_data = []
-    
-    regions = ["North America", "Europe", "Asia Pacific", "Latin America", "Middle East", "Africa"]
-    
-    for region in regions:
-        # Generate synthetic geographic data
-        revenue = np.random.uniform(5.0, 80.0) * 1000000  # Between 5M and 80M
-        cost = revenue * np.random.uniform(0.55, 0.80)  # Cost is 55-80% of revenue
+        code_dtype = np.min_scalar_type(len(values))
+        codes = np.arange(len(values), dtype=code_dtype).reshape(axis_shape)
+        codes = np.broadcast_to(codes, ledger_shape).reshape(-1)
         
-        geo_data.append({
-            "region": region,
-            "revenue": revenue,
-            "cost": cost,
-            "growth": np.random.uniform(-2.0, 15.0)  # Growth between -2% and 15%
-        })
-    
-    geo_df = pd.DataFrame(geo_data)
-    
-    # Generate forecast data with proper structure for all periods
-    forecast_data = []
-    
-    # For all periods, create forecast data with some deviation from actual
-    for period in periods:
-        for category in categories:
-            # Find the actual revenue for this category in this period
-            # Handle potential missing values using a fallback
-            matching_rows = revenue_df[(revenue_df["period"] == period) & (revenue_df["category"] == category)]
-            if len(matching_rows) > 0:
-                actual = matching_rows["amount"].values[0]
-            else:
-                actual = 1000000  # Default value if missing
-            
-            # Generate a forecast with some deviation from actual
-            forecast_amount = actual * np.random.uniform(0.85, 1.15)
-            
-            forecast_data.append({
-                "period": period,
-                "category": category,
-                "amount": forecast_amount
-            })
-    
-    forecast_df = pd.DataFrame(forecast_data)
-    
-    # Generate data quality metrics
-    data_quality = {
-        "overall_score": 92,
-        "previous_score": 87,
-        "completeness": 95,
-        "accuracy": 90,
-        "consistency": 89,
-        "timeliness": 94,
-        "critical_issues": 2,
-        "data_sources": ["Anaplan", "SAP", "Excel", "PowerBI"],
-        "anomalies": [
-            {
-                "entity": "Revenue",
-                "field": "Amount",
-                "value": "€1,000",
-                "expected": "€1,000,000",
-                "severity": "High",
-                "description": "Order of magnitude error detected. Revenue value is 1000x smaller than expected."
-            },
-            {
-                "entity": "Cost of Sales",
-                "field": "Category",
-                "value": "Missing",
-                "expected": "COGS",
-                "severity": "Medium",
-                "description": "Cost category is missing for some entries in the Asia Pacific region."
-            },
-            {
-                "entity": "FX Rates",
-                "field": "EUR/USD",
-                "value": "1.02, 1.08, 1.06",
-                "expected": "Consistent Rate",
-                "severity": "High",
-                "description": "Inconsistent FX rates used across different departments."
-            }
-        ],
-        "validation_results": [
-            {
-                "check": "Revenue Completeness",
-                "status": "Passed",
-                "description": "All revenue entries are complete for the reporting period."
-            },
-            {
-                "check": "Cost Allocation",
-                "status": "Warning",
-                "description": "15% of cost entries are missing proper department allocation."
-            },
-            {
-                "check": "Balance Sheet Reconciliation",
-                "status": "Passed",
-                "description": "Balance sheet accounts are reconciled within threshold."
-            },
-            {
-                "check": "Intercompany Eliminations",
-                "status": "Failed",
-                "description": "Intercompany transactions not fully eliminated in consolidation."
-            },
-            {
-                "check": "Currency Translation",
-                "status": "Warning",
-                "description": "Some subsidiaries using inconsistent currency translation methods."
-            },
-            {
-                "check": "Segment Reporting",
-                "status": "Passed",
-                "description": "Segment reporting is consistent with management reporting."
-            }
-        ]
-    }
+        ledger[column] = pd.Categorical.from_codes(codes, categories=values)
+    
+    ledger["Amount"] = amounts.reshape(-1).round(2)
     
-    # Calculate key metrics
-    current_revenue = revenue_df[revenue_df["period"] == "2023-Q2"]["amount"].sum()
-    previous_revenue = revenue_df[revenue_df["period"] == "2022-Q2"]["amount"].sum()
-    
-    current_costs = cost_df[cost_df["period"] == "2023-Q2"]["amount"].sum()
-    previous_costs = cost_df[cost_df["period"] == "2022-Q2"]["amount"].sum()
-    
-    current_ebitda = current_revenue - current_costs
-    previous_ebitda = previous_revenue - previous_costs
-    
-    yoy_revenue_growth = ((current_revenue - previous_revenue) / previous_revenue) * 100
-    ebitda_margin = (current_ebitda / current_revenue) * 100
-    previous_ebitda_margin = (previous_ebitda / previous_revenue) * 100
-    
-    # Top and bottom products
-    top_product = product_df.sort_values("profit_margin", ascending=False).iloc[0]["name"]
-    bottom_product = product_df.sort_values("profit_margin", ascending=True).iloc[0]["name"]
-    
-    # Operating cash flow (estimated as 80% of EBITDA)
-    operating_cash_flow = current_ebitda * 0.8
-    previous_cash_flow = previous_ebitda * 0.8
-    
-    # Net income (estimated as 65% of EBITDA)
-    net_income = current_ebitda * 0.65
-    previous_net_income = previous_ebitda * 0.65
-    
-    # Calculate forecast metrics
-    forecast_revenue_growth = 7.5  # Forecast 7.5% annual growth
-    forecast_ebitda_margin = 18.0  # Forecast 18% EBITDA margin
-    forecast_roi = 12.5  # Forecast 12.5% ROI
-    
-    # Assemble all data
-    return {
-        "financial_data": {
-            "revenue": revenue_df,
-            "costs": cost_df
-        },
-        "products": product_df,
-        "geographic": geo_df,
-        "forecast": forecast_df,
-        "data_quality": data_quality,
-        "metrics": {
-            "revenue": current_revenue,
-            "previous_revenue": previous_revenue,
-            "ebitda": current_ebitda,
-            "previous_ebitda": previous_ebitda,
-            "yoy_revenue_growth": yoy_revenue_growth,
-            "ebitda_margin": ebitda_margin,
-            "previous_ebitda_margin": previous_ebitda_margin,
-            "top_product": top_product,
-            "bottom_product": bottom_product,
-            "operating_cash_flow": operating_cash_flow,
-            "previous_cash_flow": previous_cash_flow,
-            "net_income": net_income,
-            "previous_net_income": previous_net_income,
-            "tax_rate": 25.0,  # Assumed tax rate
-            "fx_rate": 1.10,   # Assumed FX rate (EUR/USD)
-            "market_conditions": "Moderate growth with inflationary pressure"
-        },
-        "forecast": {
-            "revenue_growth": forecast_revenue_growth,
-            "ebitda_margin": forecast_ebitda_margin,
-            "roi": forecast_roi
-        }
+    currency_codes = np.broadcast_to(_product_currency_codes(n_products), ledger_shape).reshape(-1)
+    ledger["Currency"] = pd.Categorical.from_codes(currency_codes, categories=LEDGER_CURRENCIES)
+    
+    return pd.DataFrame(ledger)
+
+def generate_sample_intercompany_lines(n_transactions=2000, n_entities=4, n_periods=8, seed=42,
+                                       mismatch_rate=0.002, missing_rate=0.001):
+    """
+    Generate intercompany transactions between the parent company and its subsidiaries
+    in the intercompany export schema (ledger columns plus Counterparty)
+    
+    Every transaction books revenue and a receivable (Assets) at the seller and
+    COGS and a payable (Liabilities) at the buyer, each against the other entity,
+    in the currency of the product line (as in the sample ledger).
+    The lines are part of what the entities book: add them to their ledger
+    (intercompany.book_intercompany_lines) before they are matched and eliminated.
+    As in a real close, a few buyer bookings differ from the seller's
+    (mismatch_rate) or have not been booked yet (missing_rate)
+    """
+    rng = np.random.default_rng(seed)
+    
+    entities = _entity_names(n_entities)
+    periods = _quarters(n_periods)
+    
+    # The parent company sells to a subsidiary or buys from one
+    subsidiary = rng.integers(1, n_entities, n_transactions)
+    parent_sells = rng.random(n_transactions) < 0.6
+    seller = np.where(parent_sells, 0, subsidiary)
+    buyer = np.where(parent_sells, subsidiary, 0)
+    
+    period = rng.integers(0, n_periods, n_transactions)
+    cost_center = rng.integers(0, len(LEDGER_COST_CENTERS), n_transactions)
+    product = rng.integers(0, len(LEDGER_PRODUCTS), n_transactions)
+    currency = _product_currency_codes(len(LEDGER_PRODUCTS))[product]
+    
+    seller_amount = rng.lognormal(np.log(50000), 0.8, n_transactions).round(2)
+    buyer_amount = seller_amount.copy()
+    
+    mismatched = rng.random(n_transactions) < mismatch_rate
+    buyer_amount[mismatched] = (buyer_amount[mismatched] * rng.uniform(0.9, 1.1, mismatched.sum())).round(2)
+    booked = rng.random(n_transactions) >= missing_rate
+    
+    # Seller lines (revenue, receivable) then the booked buyer lines (COGS, payable)
+    sides = [
+        (seller, buyer, "Revenue", seller_amount, slice(None)),
+        (seller, buyer, "Assets", seller_amount, slice(None)),
+        (buyer, seller, "COGS", buyer_amount, booked),
+        (buyer, seller, "Liabilities", buyer_amount, booked)
+    ]
+    
+    columns = {"Entity_ID": [], "Counterparty": [], "Account": [], "Period": [], "Cost_Center": [], "Product": [], "Amount": [], "Currency": []}
+    
+    for entity, counterparty, account, amount, rows in sides:
+        columns["Entity_ID"].append(entity[rows])
+        columns["Counterparty"].append(counterparty[rows])
+        columns["Account"].append(np.full(len(amount[rows]), LEDGER_ACCOUNTS.index(account)))
+        columns["Period"].append(period[rows])
+        columns["Cost_Center"].append(cost_center[rows])
+        columns["Product"].append(product[rows])
+        columns["Amount"].append(amount[rows])
+        columns["Currency"].append(currency[rows])
+    
+    dimension_values = {
+        "Entity_ID": entities,
+        "Counterparty": entities,
+        "Account": LEDGER_ACCOUNTS,
+        "Period": periods,
+        "Cost_Center": LEDGER_COST_CENTERS,
+        "Product": LEDGER_PRODUCTS,
+        "Currency": LEDGER_CURRENCIES
     }
+    
+    lines = {}
+    
+    for column, values in columns.items():
+        values = np.concatenate(values)
+        lines[column] = values if column == "Amount" else pd.Categorical.from_codes(values, categories=dimension_values[column])
+    
+    return pd.DataFrame(lines)
+
+def generate_sample_ownership():
+    """
+    Direct holdings of the sample group (SAMPLE_OWNERSHIP) in the ownership
+    export schema (Owner, Entity_ID, Share)
+    """
+    return pd.DataFrame(SAMPLE_OWNERSHIP, columns=["Owner", "Entity_ID", "Share"])
 
+def generate_sample_fx_rates(periods, reporting_currency="EUR", seed=42):
+    """
+    Generate average and closing rates of the sample currencies for the given periods,
+    in the FX rate table schema (Period, Currency, Average_Rate, Closing_Rate)
+    Rates to EUR follow a small random walk around SAMPLE_EUR_RATES, the closing
+    rate deviating slightly from the average; they are then converted to the
+    reporting currency, which must be one of the sample currencies
+    """
+    currencies = list(SAMPLE_EUR_RATES)
+    
+    if reporting_currency not in SAMPLE_EUR_RATES:
+        raise ValueError(
+            f"No sample FX rates for reporting currency {reporting_currency}: sample rates cover "
+            f"{', '.join(currencies)}; set FX_RATES_PATH to an FX rate table for other currencies"
+        )
+    
+    rng = np.random.default_rng(seed)
+    periods = pd.PeriodIndex(sorted(periods), freq=PERIOD_FREQUENCY)
+    
+    # Period x currency rates to EUR, EUR itself staying at 1
+    drift = np.cumsum(rng.normal(0, 0.015, (len(periods), len(currencies))), axis=0)
+    drift[:, currencies.index("EUR")] = 0
+    average = np.array(list(SAMPLE_EUR_RATES.values())) * np.exp(drift)
+    closing = average * np.exp(rng.normal(0, 0.01, average.shape))
+    closing[:, currencies.index("EUR")] = 1.0
+    
+    # Cross through EUR to the reporting currency
+    reporting = currencies.index(reporting_currency)
+    average = average / average[:, [reporting]]
+    closing = closing / closing[:, [reporting]]
+    
+    return pd.DataFrame({
+        "Period": np.repeat(periods, len(currencies)),
+        "Currency": np.tile(currencies, len(periods)),
+        "Average_Rate": average.reshape(-1).round(6),
+        "Closing_Rate": closing.reshape(-1).round(6)
+    })
+
+def generate_sample_forecast_ledger(ledger, seed=42):
+    """
+    Forecast ledger of a ledger with amounts in currency units: the same lines,
+    every amount off the actual by up to 15% either way
+    """
+    rng = np.random.default_rng(seed)
+    
+    forecast = ledger.copy()
+    forecast["Amount"] = (ledger["Amount"].to_numpy(dtype=np.float64) * rng.uniform(0.85, 1.15, len(ledger))).round(2)
+    
+    return forecast
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# The app imports its packages (utils, data, components) from the app directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.sample_financial_data import generate_sample_intercompany_lines, generate_sample_ledger
+from utils.intercompany import normalize_intercompany_lines
+from utils.ledger_schema import normalize_ledger
+
+@pytest.fixture(scope="session")
+def ledger():
+    """
+    Small sample ledger in ledger sort order (4 entities x 8 quarters x 7 accounts x 3 cost centers x 4 products)
+    """
+    return normalize_ledger(generate_sample_ledger(n_entities=4, n_periods=8, n_categories=3, n_products=4, seed=7))
+
+@pytest.fixture(scope="session")
+def journal(ledger):
+    """
+    Journal lines of the sample ledger: every balance split into 1 to 5 lines, shuffled,
+    with the periods as export labels ("2023-Q2")
+    """
+    rng = np.random.default_rng(7)
+    counts = rng.integers(1, 6, len(ledger))
+    rows = np.repeat(np.arange(len(ledger)), counts)
+    
+    lines = ledger.iloc[rows].reset_index(drop=True).astype(str)
+    lines["Period"] = lines["Period"].str.replace("Q", "-Q")
+    lines["Amount"] = rng.uniform(-1000, 1000, len(lines)).round(2)
+    
+    return lines.sample(frac=1, random_state=7).reset_index(drop=True)
+
+@pytest.fixture(scope="session")
+def fx_rates(ledger):
+    """
+    Rates of the sample currencies to EUR over the ledger periods, moving every quarter
+    """
+    from utils.fx_translation import FxRates
+    
+    periods = ledger["Period"].cat.remove_unused_categories().cat.categories
+    steps = np.arange(len(periods))
+    rates = pd.DataFrame({
+        "Period": np.repeat(periods, 3),
+        "Currency": np.tile(["EUR", "GBP", "USD"], len(periods)),
+        "Average_Rate": np.column_stack([np.ones(len(periods)), 1.16 + 0.01 * steps, 0.91 - 0.005 * steps]).reshape(-1),
+        "Closing_Rate": np.column_stack([np.ones(len(periods)), 1.17 + 0.01 * steps, 0.90 - 0.005 * steps]).reshape(-1)
+    })
+    
+    return FxRates(rates, "EUR")
+
+@pytest.fixture(scope="session")
+def ownership():
+    """
+    Parent holding A outright and 80% of B, and C held 70% by B and 10% by A
+    """
+    from utils.consolidation import OwnershipStructure
+    
+    return OwnershipStructure(pd.DataFrame({
+        "Owner": ["ParentCo", "ParentCo", "Subsidiary B", "Subsidiary A"],
+        "Entity_ID": ["Subsidiary A", "Subsidiary B", "Subsidiary C", "Subsidiary C"],
+        "Share": [1.0, 0.8, 0.7, 0.1]
+    }))
+
+@pytest.fixture(scope="session")
+def intercompany_lines():
+    """
+    Intercompany transactions between the sample entities, a few mismatched or one-sided
+    """
+    lines = generate_sample_intercompany_lines(n_transactions=300, seed=7, mismatch_rate=0.02, missing_rate=0.02)
+    
+    return normalize_intercompany_lines(lines)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import numpy as np
+import pandas as pd
+import pytest
+from utils.cache import dataset_cache, value_fingerprint
+
+class _Dataset:
+    fingerprint = "dataset"
+
+def test_defaults_share_one_entry():
+    calls = []
+    
+    @dataset_cache()
+    def count(data, column="a", window=4):
+        calls.append((column, window))
+        return len(calls)
+    
+    data = _Dataset()
+    
+    assert count(data) == count(data, "a") == count(data, window=4) == count(data, "a", 4)
+    assert count(data, "b") != count(data)
+    assert len(calls) == 2
+
+def test_results_are_copies():
+    @dataset_cache()
+    def frame(data):
+        return {"frame": pd.DataFrame({"amount": [1.0, 2.0]})}
+    
+    data = _Dataset()
+    result = frame(data)
+    result["frame"].loc[0, "amount"] = 100.0
+    
+    assert frame(data)["frame"]["amount"].tolist() == [1.0, 2.0]
+
+def test_hits_share_the_cached_data():
+    @dataset_cache()
+    def tables(data):
+        return {"frame": pd.DataFrame({"amount": [1.0, 2.0]}), "grid": np.ones((2, 2))}
+    
+    data = _Dataset()
+    first, second = tables(data), tables(data)
+    
+    assert np.shares_memory(first["frame"]["amount"].to_numpy(), second["frame"]["amount"].to_numpy())
+    assert second["grid"] is first["grid"]
+    
+    with pytest.raises(ValueError, match="read-only"):
+        second["grid"][0, 0] = 5.0
+
+def test_frame_fingerprint_follows_content():
+    frame = pd.DataFrame({"period": pd.Categorical(["a", "b"]), "amount": [1.0, 2.0]})
+    
+    assert value_fingerprint(frame) == value_fingerprint(frame.copy())
+    assert value_fingerprint(frame) != value_fingerprint(frame.assign(amount=[1.0, 2.5]))
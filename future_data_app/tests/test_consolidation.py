@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import numpy as np
+import pandas as pd
+import pytest
+from utils.consolidation import IncrementalConsolidation, OwnershipStructure, consolidate_group
+from utils.data_processor import build_financial_data
+from utils.ledger_schema import LEDGER_COLUMNS, amount_values, conform_ledger, parse_periods
+
+def test_effective_ownership_through_chains(ownership):
+    frame = ownership.frame().set_index("entity")
+    
+    # C: 80% x 70% through B plus 100% x 10% through A
+    assert frame.loc["Subsidiary C", "effective_share"] == pytest.approx(0.66)
+    assert frame.loc["Subsidiary B", "nci_share"] == pytest.approx(0.2)
+    assert frame["controlled"].all()
+
+@pytest.mark.parametrize("shares", [
+    [("ParentCo", "Subsidiary A", 1.2)],
+    [("ParentCo", "Subsidiary A", 0.7), ("Subsidiary B", "Subsidiary A", 0.5)],
+    [("Subsidiary A", "Subsidiary B", 1.0), ("Subsidiary B", "Subsidiary A", 1.0)]
+])
+def test_invalid_ownership_is_rejected(shares):
+    with pytest.raises(ValueError):
+        OwnershipStructure(pd.DataFrame(shares, columns=["Owner", "Entity_ID", "Share"]))
+
+def test_consolidate_group_splits_the_ledger_totals(ledger, fx_rates, ownership):
+    data = build_financial_data(ledger, fx_rates=fx_rates, ownership=ownership)
+    group = consolidate_group(data).set_index(["Period", "Account"])
+    
+    # Every sample entity is controlled: the totals are the translated ledger's
+    expected = amount_values(data.ledger.groupby(["Period", "Account"], observed=True)["Amount"].sum())
+    np.testing.assert_allclose(group["total"].to_numpy(), expected.reindex(group.index).to_numpy())
+    np.testing.assert_allclose(
+        (group["attributable_to_parent"] + group["non_controlling_interest"]).to_numpy(),
+        group["total"].to_numpy(),
+        atol=0.011
+    )
+    assert (group["non_controlling_interest"].abs() > 0).any()
+
+def _booked_ledger(ledger, intercompany_lines):
+    """
+    Ledger with the intercompany lines booked in, as the entities submit it
+    """
+    return pd.concat([conform_ledger(ledger), conform_ledger(intercompany_lines[LEDGER_COLUMNS])], ignore_index=True)
+
+def _assert_same_totals(incremental, data):
+    expected = consolidate_group(data)
+    totals = incremental.totals()
+    
+    pd.testing.assert_frame_equal(
+        totals.set_index(["Period", "Account"]).sort_index(),
+        expected.set_index(["Period", "Account"]).sort_index(),
+        check_exact=True,
+        check_index_type=False,
+        check_categorical=False
+    )
+
+def test_incremental_totals_equal_consolidate_group(ledger, intercompany_lines, fx_rates, ownership):
+    booked = _booked_ledger(ledger, intercompany_lines)
+    data = build_financial_data(booked, fx_rates=fx_rates, intercompany_lines=intercompany_lines, ownership=ownership)
+    incremental = IncrementalConsolidation(booked, fx_rates, intercompany_lines, ownership)
+    
+    _assert_same_totals(incremental, data)
+
+def test_resubmission_matches_a_full_rebuild(ledger, intercompany_lines, fx_rates, ownership):
+    booked = _booked_ledger(ledger, intercompany_lines)
+    incremental = IncrementalConsolidation(booked, fx_rates, intercompany_lines, ownership)
+    
+    # Subsidiary B restates 2023-Q1 and drops its intercompany lines of the period
+    period = parse_periods(["2023-Q1"])[0]
+    in_partition = (booked["Entity_ID"] == "Subsidiary B").to_numpy() & (booked["Period"] == period).to_numpy()
+    ic_in_partition = (intercompany_lines["Entity_ID"] == "Subsidiary B").to_numpy() & (intercompany_lines["Period"] == period).to_numpy()
+    
+    # Booked lines of the partition other than the intercompany ones, restated by 10%
+    restated = booked.iloc[:len(ledger)][in_partition[:len(ledger)]].copy()
+    restated["Amount"] = (restated["Amount"] * 1.1).round().astype(restated["Amount"].dtype)
+    
+    incremental.resubmit("Subsidiary B", "2023-Q1", restated, intercompany_lines.iloc[:0])
+    
+    rebuilt_ledger = pd.concat([booked[~in_partition], restated], ignore_index=True)
+    rebuilt_lines = intercompany_lines[~ic_in_partition].reset_index(drop=True)
+    data = build_financial_data(rebuilt_ledger, fx_rates=fx_rates, intercompany_lines=rebuilt_lines, ownership=ownership)
+    
+    _assert_same_totals(incremental, data)
+
+def test_restated_intercompany_lines_update_the_counterparties(ledger, intercompany_lines, fx_rates, ownership):
+    booked = _booked_ledger(ledger, intercompany_lines)
+    incremental = IncrementalConsolidation(booked, fx_rates, intercompany_lines, ownership)
+    
+    # Subsidiary B restates its 2023-Q1 intercompany balances by half, so they no longer match
+    period = parse_periods(["2023-Q1"])[0]
+    in_partition = (booked["Entity_ID"] == "Subsidiary B").to_numpy() & (booked["Period"] == period).to_numpy()
+    ic_in_partition = (intercompany_lines["Entity_ID"] == "Subsidiary B").to_numpy() & (intercompany_lines["Period"] == period).to_numpy()
+    
+    restated_booked = booked.copy()
+    restated_lines = intercompany_lines.copy()
+    restated_booked.iloc[len(ledger):, restated_booked.columns.get_loc("Amount")] = np.where(
+        ic_in_partition, restated_lines["Amount"] * 3 // 2, restated_lines["Amount"]
+    )
+    restated_lines.loc[ic_in_partition, "Amount"] = restated_lines.loc[ic_in_partition, "Amount"] * 3 // 2
+    
+    changed = incremental.resubmit("Subsidiary B", "2023-Q1", restated_booked[in_partition], restated_lines[ic_in_partition])
+    
+    # The eliminations of the counterparties in the period are recomputed with it
+    assert {entity for entity, _ in changed} - {"Subsidiary B"}
+    assert {changed_period for _, changed_period in changed} == {period}
+    
+    data = build_financial_data(restated_booked, fx_rates=fx_rates, intercompany_lines=restated_lines, ownership=ownership)
+    
+    _assert_same_totals(incremental, data)
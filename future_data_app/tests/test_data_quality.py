@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import copy
+import numpy as np
+import pytest
+from data.sample_financial_data import generate_sample_fx_rates
+from utils.data_processor import build_financial_data
+from utils.data_quality import assess_ledger_quality, currency_translation_validation
+
+def test_translation_passes_with_a_rate_for_every_currency(ledger, fx_rates):
+    result = currency_translation_validation(ledger, fx_rates)
+    
+    assert result["status"] == "Passed"
+    assert "GBP, USD translated to EUR" in result["description"]
+
+def test_translation_fails_on_a_missing_rate(ledger, fx_rates):
+    incomplete = copy.deepcopy(fx_rates)
+    incomplete.rates[1, ledger["Period"].cat.codes.max(), incomplete.currencies.get_loc("USD")] = np.nan
+    
+    result = currency_translation_validation(ledger, incomplete)
+    
+    assert result["status"] == "Failed"
+    assert result["description"].endswith("2023-Q2 USD.")
+
+def test_lines_without_a_rate_are_left_out_and_reported(ledger, fx_rates):
+    incomplete = copy.deepcopy(fx_rates)
+    incomplete.rates[1, ledger["Period"].cat.codes.max(), incomplete.currencies.get_loc("USD")] = np.nan
+    
+    data = build_financial_data(ledger, fx_rates=incomplete)
+    checks = {result["check"]: result for result in data["data_quality"]["validation_results"]}
+    
+    # Only the USD balance sheet lines of the last quarter lack a (closing) rate
+    untranslated = (
+        (ledger["Period"] == ledger["Period"].max())
+        & (ledger["Currency"] == "USD")
+        & ledger["Account"].isin(["Assets", "Liabilities", "Equity"])
+    )
+    assert len(data.ledger) == len(ledger) - untranslated.sum()
+    assert checks["Currency Translation"]["status"] == "Failed"
+    assert checks["Currency Translation"]["description"].startswith(f"{untranslated.sum():,} lines left out")
+
+def test_untranslated_ledger_is_flagged(ledger):
+    checks = {result["check"]: result for result in assess_ledger_quality(ledger)["validation_results"]}
+    
+    assert checks["Currency Translation"]["status"] == "Warning"
+
+def test_sample_rates_reject_an_unknown_reporting_currency(ledger):
+    with pytest.raises(ValueError, match="No sample FX rates for reporting currency CHF"):
+        generate_sample_fx_rates(ledger["Period"].unique(), reporting_currency="CHF")
+
+def test_previous_score_is_measured_up_to_the_previous_period(ledger):
+    quality = assess_ledger_quality(ledger)
+    
+    # The last quarter reported by two entities only: the score drops against the previous one
+    late = (ledger["Period"] == ledger["Period"].max()) & ledger["Entity_ID"].isin(["Subsidiary A", "Subsidiary B"])
+    partial = assess_ledger_quality(ledger[~late])
+    
+    assert quality["previous_score"] == partial["previous_score"]
+    assert partial["timeliness"] == 50
+    assert partial["overall_score"] < partial["previous_score"]
+
+def test_a_single_period_has_no_previous_score(ledger):
+    single = ledger[ledger["Period"] == ledger["Period"].max()]
+    
+    assert assess_ledger_quality(single)["previous_score"] is None
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import pytest
+from utils.data_processor import build_financial_data
+from utils.dataset import FinancialDataset, calculate_key_metrics
+
+@pytest.fixture(scope="module")
+def dataset(ledger, fx_rates):
+    return build_financial_data(ledger, fx_rates=fx_rates)
+
+@pytest.mark.parametrize("period", [None, "2022-Q3"])
+def test_ledger_index_and_tables_give_the_same_metrics(dataset, period):
+    view = dataset.at_period(period) if period else dataset
+    arguments = [view.revenue, view.costs, view.products, view.current_period, view.previous_period]
+    
+    from_index = calculate_key_metrics(*arguments, ledger_index=view.ledger_index)
+    from_tables = calculate_key_metrics(*arguments)
+    
+    for metric in ["revenue", "previous_revenue", "ebitda", "previous_ebitda"]:
+        assert from_index[metric] == from_tables[metric]
+    
+    assert view["metrics"]["revenue"] == from_tables["revenue"]
+
+def test_metrics_follow_the_tables_of_a_dataset_not_built_from_its_ledger(dataset):
+    # Tables scaled apart from the ledger: the headline numbers must describe the tables
+    revenue = dataset.revenue.assign(amount=dataset.revenue["amount"] * 2)
+    data = FinancialDataset(revenue, dataset.costs, dataset.products, dataset.geographic, ledger=dataset.ledger)
+    
+    expected = calculate_key_metrics(revenue, dataset.costs, dataset.products, data.current_period, data.previous_period)
+    
+    assert data["metrics"]["revenue"] == pytest.approx(expected["revenue"])
+    assert data["metrics"]["revenue"] == pytest.approx(2 * dataset["metrics"]["revenue"])
+
+def test_period_views_share_the_members_of_the_full_dataset(ledger, fx_rates):
+    data = build_financial_data(ledger, fx_rates=fx_rates)
+    view = data.at_period("2022-Q3")
+    
+    assert view.data_quality is data.__dict__["data_quality"]
+    assert view.ledger_index is data.__dict__["ledger_index"]
+    assert view.content_fingerprint == data.__dict__["content_fingerprint"]
+    
+    # A second call (as on every rerun) returns the same view, metrics included
+    metrics = view.metrics
+    
+    assert data.at_period("2022-Q3") is view
+    assert data.at_period("2022-Q3").metrics is metrics
+    assert view.at_period("2023-Q1").bitmap_index is data.bitmap_index
+    assert view.fingerprint != data.at_period("2023-Q1").fingerprint
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import numpy as np
+import pandas as pd
+import pytest
+from utils.data_processor import build_financial_data
+from utils.financial_analysis import analyze_product_margin_drivers, calculate_actual_vs_forecast, calculate_margin_bridge
+
+@pytest.fixture(scope="module")
+def dataset(ledger):
+    # Product C books costs only; Product B has no revenue in 2023Q1
+    revenue = ledger["Account"] == "Revenue"
+    cost_only = revenue & (
+        (ledger["Product"] == "Product C")
+        | ((ledger["Product"] == "Product B") & (ledger["Period"] == pd.Period("2023Q1")))
+    )
+    return build_financial_data(ledger[~cost_only].reset_index(drop=True))
+
+def test_effects_add_up_to_the_profit_change(dataset):
+    bridge = calculate_margin_bridge(dataset)
+    effects = bridge["volume_effect"] + bridge["mix_effect"] + bridge["price_effect"]
+    
+    assert {"Product B", "Product C"} <= set(bridge["product"])
+    np.testing.assert_allclose(effects.to_numpy(), bridge["profit_change"].to_numpy(), rtol=1e-9, atol=1e-6)
+    
+    cost_only = bridge[bridge["product"] == "Product C"]
+    assert (cost_only["profit_change"] != 0).all()
+    np.testing.assert_allclose(cost_only["price_effect"].to_numpy(), cost_only["profit_change"].to_numpy())
+
+def test_drivers_are_looked_up_by_product(dataset):
+    for product in dataset["products"]["name"]:
+        drivers = analyze_product_margin_drivers(dataset, product)
+        
+        assert list(drivers["name"]) == ["Volume/Scale", "Product Mix", "Pricing Strategy"]
+    
+    assert analyze_product_margin_drivers(dataset, "Unknown Product").empty
+
+def test_forecast_variances_are_explained_by_their_largest_entity_variance(ledger):
+    # The forecast halves the latest Product A revenue of Subsidiary A and matches everything else
+    forecast_ledger = ledger.copy()
+    short = (
+        (ledger["Account"] == "Revenue")
+        & (ledger["Product"] == "Product A")
+        & (ledger["Entity_ID"] == "Subsidiary A")
+        & (ledger["Period"] == ledger["Period"].max())
+    )
+    forecast_ledger.loc[short, "Amount"] = forecast_ledger.loc[short, "Amount"] // 2
+    
+    comparison = calculate_actual_vs_forecast(build_financial_data(ledger, forecast_ledger)).set_index("category")
+    
+    assert comparison.loc["Product A", "explanation"].startswith("Above forecast by")
+    assert "largest entity variance: Subsidiary A" in comparison.loc["Product A", "explanation"]
+    assert (comparison.drop("Product A")["explanation"] == "In line with forecast").all()
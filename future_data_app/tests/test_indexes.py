@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import numpy as np
+import pandas as pd
+import pytest
+from utils.bitmap_index import Bitmap, BitmapIndex
+from utils.ledger_index import LedgerIndex
+from utils.ledger_schema import amount_values, parse_periods
+from utils.olap_cube import LedgerCube
+
+def _mask_sum(ledger, mask):
+    """
+    Reference total of the masked ledger rows, in currency units
+    """
+    return amount_values(ledger.loc[mask, "Amount"]).sum()
+
+def _mask(ledger, filters):
+    mask = np.ones(len(ledger), dtype=bool)
+    
+    for dimension, values in filters.items():
+        values = values if isinstance(values, list) else [values]
+        
+        if dimension == "Period":
+            values = parse_periods(values)
+        
+        mask &= ledger[dimension].isin(values).to_numpy()
+    
+    return mask
+
+@pytest.mark.parametrize("dimensions, filters", [
+    (["Period"], None),
+    (["Entity_ID", "Account"], None),
+    (["Product"], {"Account": "Revenue", "Period": ["2023-Q1", "2023-Q2"]}),
+    ([], {"Entity_ID": "Subsidiary B"})
+])
+def test_cube_matches_groupby(ledger, dimensions, filters):
+    cube = LedgerCube(ledger)
+    result = cube.aggregate(dimensions, filters)
+    selected = ledger[_mask(ledger, filters or {})]
+    
+    if dimensions:
+        expected = amount_values(selected.groupby(dimensions, observed=True)["Amount"].sum())
+        pd.testing.assert_series_equal(
+            result.set_index(dimensions)["amount"].sort_index(),
+            expected.sort_index(),
+            check_names=False
+        )
+    else:
+        assert result["amount"].iloc[0] == pytest.approx(amount_values(selected["Amount"]).sum())
+
+def test_cube_drilldown_reuses_the_coarser_query(ledger):
+    cube = LedgerCube(ledger)
+    by_entity = cube.aggregate(["Entity_ID"])
+    by_entity_account = cube.drilldown(["Entity_ID"], "Account")
+    
+    rolled_up = by_entity_account.groupby("Entity_ID", observed=True)["amount"].sum()
+    
+    np.testing.assert_allclose(rolled_up.to_numpy(), by_entity.set_index("Entity_ID")["amount"].to_numpy())
+
+@pytest.mark.parametrize("selection", [
+    {"period": "2023-Q2"},
+    {"entity": "Subsidiary A"},
+    {"entity": ["ParentCo", "Subsidiary C"], "period": "2022-Q4", "account": ["COGS", "Operating Expenses"]},
+    {"period": "2030-Q1"}
+])
+def test_ledger_index_matches_masks(ledger, selection):
+    index = LedgerIndex(ledger)
+    columns = {"entity": "Entity_ID", "period": "Period", "account": "Account"}
+    mask = _mask(ledger, {columns[key]: value for key, value in selection.items()})
+    
+    assert index.sum(**selection) == pytest.approx(_mask_sum(ledger, mask))
+    pd.testing.assert_frame_equal(index.select(**selection), ledger[mask])
+
+@pytest.mark.parametrize("filters", [
+    {"Account": "Revenue"},
+    {"Account": ["Revenue", "COGS"], "Currency": "EUR", "Period": "2023-Q2"},
+    {"Entity_ID": "Subsidiary C", "Product": "Product B", "Cost_Center": "Sales"},
+    {"Product": "Unknown"}
+])
+def test_bitmap_index_matches_masks(ledger, filters):
+    index = BitmapIndex(ledger)
+    mask = _mask(ledger, filters)
+    
+    assert index.count(filters) == mask.sum()
+    assert index.sum(filters) == pytest.approx(_mask_sum(ledger, mask))
+    np.testing.assert_array_equal(index.match(filters).rows(), np.flatnonzero(mask))
+
+@pytest.mark.parametrize("mask", [np.zeros(0, dtype=bool), np.zeros(10, dtype=bool), np.zeros(1000, dtype=bool)])
+def test_bitmap_of_an_empty_mask_is_empty(mask):
+    bitmap = Bitmap.from_mask(mask)
+    
+    assert bitmap.is_empty
+    assert bitmap.size == 0
+    assert len(bitmap.rows()) == 0
+
+@pytest.mark.parametrize("filters", [{}, {"Entity_ID": "ParentCo"}, {"Account": "Revenue", "Period": "2023-Q2"}])
+def test_bitmap_index_of_an_empty_ledger(ledger, filters):
+    index = BitmapIndex(ledger.iloc[:0])
+    
+    assert index.count(filters) == 0
+    assert index.sum(filters) == 0
+    assert index.select(filters).empty
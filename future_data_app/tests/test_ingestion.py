@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+from utils import ingestion
+
+@pytest.fixture
+def workbook_path(tmp_path, monkeypatch):
+    """
+    Two-sheet workbook, with the ledger cache in a temporary directory
+    """
+    monkeypatch.setattr(ingestion, "LEDGER_CACHE_DIR", str(tmp_path / "cache"))
+    
+    workbook = Workbook()
+    exposures = workbook.active
+    exposures.title = "Exposures"
+    exposures.append(["Counterparty", "Rating", "Exposure"])
+    
+    for i in range(40):
+        exposures.append([f"Customer {i}", "AAB"[i % 3], 1000.0 * i])
+    
+    ratings = workbook.create_sheet("Ratings")
+    ratings.append(["Rating", "PD"])
+    ratings.append(["A", 0.01])
+    ratings.append(["B", 0.05])
+    
+    path = tmp_path / "credit_risk.xlsx"
+    workbook.save(path)
+    
+    return str(path)
+
+def test_worker_processes_read_the_same_sheets(workbook_path):
+    parallel = ingestion.read_excel_workbook(workbook_path, max_workers=2)
+    serial = ingestion.read_excel_workbook(workbook_path, max_workers=1)
+    
+    assert list(parallel) == ["Exposures", "Ratings"]
+    
+    for sheet_name in serial:
+        pd.testing.assert_frame_equal(parallel[sheet_name], serial[sheet_name])
+
+def test_workbook_cache_has_its_own_format_version(workbook_path):
+    sheets = ingestion.load_excel_workbook(workbook_path, max_workers=1)
+    cached = ingestion.load_excel_workbook(workbook_path, max_workers=1)
+    
+    assert os.listdir(ingestion.LEDGER_CACHE_DIR) == [
+        f"{ingestion.file_content_hash(workbook_path)}-sheets-v{ingestion.WORKBOOK_CACHE_FORMAT}"
+    ]
+    
+    for sheet_name in sheets:
+        pd.testing.assert_frame_equal(cached[sheet_name], sheets[sheet_name])
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import pandas as pd
+from utils.data_processor import build_financial_data
+from utils.intercompany import book_intercompany_lines, eliminate_intercompany
+from utils.ledger_schema import is_ledger_sorted, sum_amounts
+
+def _by_account(ledger):
+    return sum_amounts(ledger["Amount"], [ledger["Account"]])
+
+def test_matched_balances_are_eliminated_within_tolerance(intercompany_lines):
+    result = eliminate_intercompany(intercompany_lines, tolerance=5.0)
+    reconciliation = result["reconciliation"]
+    matched = reconciliation["status"] == "Matched"
+    
+    assert matched.any() and (~matched).any()
+    assert (reconciliation.loc[matched, "difference"].abs() <= 5.0).all()
+    assert len(result["residuals"]) == (~matched).sum()
+    
+    # Every line of a matched balance is reversed: revenue with its receivable, COGS with its payable
+    eliminated = _by_account(result["eliminations"])
+    assert eliminated["Revenue"] == eliminated["Assets"] < 0
+    assert eliminated["COGS"] == eliminated["Liabilities"] < 0
+
+def test_eliminations_remove_booked_amounts_only(ledger, intercompany_lines):
+    booked = book_intercompany_lines(ledger, intercompany_lines)
+    data = build_financial_data(booked, intercompany_lines=intercompany_lines)
+    
+    # Booking keeps one line per ledger grain, in ledger sort order
+    assert is_ledger_sorted(booked)
+    assert not booked.duplicated([column for column in booked.columns if column != "Amount"]).any()
+    
+    # What is left on top of the entities' own ledger is the unmatched intercompany lines
+    unmatched = pd.concat([intercompany_lines, data.intercompany["eliminations"]], ignore_index=True)
+    difference = _by_account(data.ledger).sub(_by_account(ledger), fill_value=0)
+    expected = _by_account(unmatched).reindex(difference.index, fill_value=0)
+    
+    pd.testing.assert_series_equal(difference, expected, check_names=False, check_categorical=False, check_index_type=False)
+    assert (difference >= 0).all()
+
+def test_booking_keeps_lines_with_a_missing_dimension(ledger, intercompany_lines):
+    lines = intercompany_lines.head(2).copy()
+    lines.loc[0, "Cost_Center"] = None
+    
+    booked = book_intercompany_lines(ledger, lines)
+    
+    assert booked["Cost_Center"].isna().sum() == 1
+    assert booked["Amount"].sum() == ledger["Amount"].sum() + lines["Amount"].sum()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from utils import journal_aggregation
+from utils.journal_aggregation import SpillingAggregator, aggregate_journal, load_journal_ledger
+from utils.ledger_schema import (
+    LEDGER_COLUMNS,
+    LEDGER_DIMENSIONS,
+    amount_values,
+    format_period,
+    is_ledger_sorted,
+    to_minor_units
+)
+
+def _by_labels(ledger):
+    """
+    Amounts of a ledger in minor units, indexed by the export labels of its dimensions
+    """
+    labels = ledger[LEDGER_DIMENSIONS].astype(str)
+    
+    if isinstance(ledger["Period"].dtype, pd.CategoricalDtype):
+        labels["Period"] = [format_period(period) for period in ledger["Period"]]
+    
+    amounts = to_minor_units(amount_values(ledger["Amount"]))
+    
+    return pd.Series(amounts, index=pd.MultiIndex.from_frame(labels)).groupby(level=LEDGER_DIMENSIONS).sum()
+
+@pytest.mark.parametrize("extension", [".csv", ".parquet"])
+@pytest.mark.parametrize("memory_budget", [1 << 30, 4096])
+def test_aggregate_journal_matches_groupby(tmp_path, journal, extension, memory_budget):
+    path = str(tmp_path / f"journal{extension}")
+    
+    if extension == ".csv":
+        journal.to_csv(path, index=False)
+    else:
+        journal.to_parquet(path)
+    
+    ledger = aggregate_journal(path, memory_budget=memory_budget, chunksize=1000, spill_dir=str(tmp_path / "spill"))
+    
+    assert list(ledger.columns) == LEDGER_COLUMNS
+    assert is_ledger_sorted(ledger)
+    pd.testing.assert_series_equal(_by_labels(ledger), _by_labels(journal))
+    
+    # Spill files are removed once the roll-up is done
+    if os.path.exists(tmp_path / "spill"):
+        assert os.listdir(tmp_path / "spill") == []
+
+def test_spilling_aggregator_spills_and_repartitions(tmp_path):
+    rng = np.random.default_rng(3)
+    codes = rng.integers(0, 40, (len(LEDGER_DIMENSIONS), 50000)).astype(np.int32)
+    amounts = rng.integers(-10000, 10000, 50000)
+    
+    aggregator = SpillingAggregator(memory_budget=2048, spill_dir=str(tmp_path), n_partitions=4)
+    
+    for start in range(0, len(amounts), 5000):
+        aggregator.add(codes[:, start:start + 5000], amounts[start:start + 5000])
+    
+    blocks = list(aggregator.results())
+    result = pd.Series(
+        np.concatenate([block[1] for block in blocks]),
+        index=pd.MultiIndex.from_arrays(list(np.concatenate([block[0] for block in blocks], axis=1)))
+    )
+    expected = pd.Series(amounts).groupby(list(codes)).sum()
+    
+    assert aggregator.spilled_rows > 0
+    assert result.index.is_unique
+    pd.testing.assert_series_equal(result.sort_index(), expected, check_names=False, check_index_type=False)
+    assert os.listdir(tmp_path) == []
+
+def test_load_journal_ledger_caches_the_roll_up(tmp_path, journal, monkeypatch):
+    monkeypatch.setattr(journal_aggregation, "LEDGER_CACHE_DIR", str(tmp_path))
+    path = str(tmp_path / "journal.csv")
+    journal.to_csv(path, index=False)
+    
+    first = load_journal_ledger(path)
+    cached = [name for name in os.listdir(tmp_path) if name.endswith("-journal.feather")]
+    
+    assert len(cached) == 1
+    pd.testing.assert_frame_equal(load_journal_ledger(path), first)
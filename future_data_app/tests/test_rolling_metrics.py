@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import numpy as np
+import pandas as pd
+import pytest
+from utils.data_processor import build_financial_data
+from utils.rolling_metrics import calculate_rolling_metrics, get_rolling_windows
+
+@pytest.fixture(scope="module")
+def dataset(ledger):
+    return build_financial_data(ledger)
+
+def test_ttm_is_the_sum_of_four_quarters(dataset):
+    metrics = calculate_rolling_metrics(dataset, "Entity_ID")
+    
+    for _, series in metrics.groupby("Entity_ID", observed=True):
+        expected = series["revenue"].rolling(4).sum().to_numpy()
+        np.testing.assert_allclose(series["ttm_revenue"].to_numpy(), expected, equal_nan=True)
+
+def test_a_new_quarter_leaves_the_cached_windows_unchanged(dataset):
+    before = calculate_rolling_metrics(dataset)
+    windows = get_rolling_windows(dataset)
+    
+    quarter = pd.DataFrame({"revenue": [1000.0], "ebitda": [250.0]}, index=["NewCo"])
+    updated = windows.with_quarter(windows.periods[-1] + 1, quarter)
+    frame = updated.frame("Entity_ID")
+    
+    assert len(frame) == (len(windows.periods) + 1) * (len(windows.series) + 1)
+    assert frame["Entity_ID"].iloc[-1] == "NewCo"
+    assert updated.fingerprint != windows.fingerprint
+    pd.testing.assert_frame_equal(calculate_rolling_metrics(dataset), before)
+    pd.testing.assert_frame_equal(get_rolling_windows(dataset, "Entity_ID", 4).frame("Entity_ID"), before)
+
+def test_adding_the_last_quarter_matches_a_full_rebuild(ledger, dataset):
+    last = ledger["Period"].max()
+    earlier = build_financial_data(ledger[ledger["Period"] != last].reset_index(drop=True))
+    
+    expected = calculate_rolling_metrics(dataset)
+    quarter = expected[expected["period"] == last].set_index("Entity_ID")[["revenue", "ebitda"]]
+    updated = get_rolling_windows(earlier).with_quarter(last, quarter)
+    
+    pd.testing.assert_frame_equal(
+        updated.frame("Entity_ID").sort_values(["period", "Entity_ID"], ignore_index=True),
+        expected.sort_values(["period", "Entity_ID"], ignore_index=True),
+        check_categorical=False
+    )
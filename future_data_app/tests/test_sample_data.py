@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import subprocess
+import sys
+import numpy as np
+from data.sample_financial_data import generate_sample_fx_rates, generate_sample_ledger, generate_sample_ownership
+from utils.data_processor import build_sample_financial_data, calculate_variances
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_sample_data_does_not_import_the_app():
+    imported = subprocess.run(
+        [sys.executable, "-c", "import sys, data.sample_financial_data; print(sorted(m for m in sys.modules if m.split('.')[0] == 'utils'))"],
+        cwd=APP_DIR, capture_output=True, text=True, check=True
+    )
+    
+    assert imported.stdout.strip() == "[]"
+
+def test_sample_generators_return_export_frames():
+    ledger = generate_sample_ledger(n_entities=2, n_periods=2, n_categories=1, n_products=1)
+    rates = generate_sample_fx_rates(ledger["Period"].unique())
+    
+    assert ledger["Amount"].dtype == np.float64
+    assert list(rates.columns) == ["Period", "Currency", "Average_Rate", "Closing_Rate"]
+    assert list(generate_sample_ownership().columns) == ["Owner", "Entity_ID", "Share"]
+
+def test_sample_dataset_is_built_from_its_ledger():
+    data = build_sample_financial_data()
+    revenue = data.revenue
+    
+    assert data.tables_from_ledger
+    assert data.metrics["revenue"] == revenue.loc[revenue["period"] == data.current_period, "amount"].sum().round(2)
+
+def test_sample_forecast_is_within_its_noise_of_the_group_actuals():
+    data = build_sample_financial_data()
+    variances = calculate_variances(data.revenue, data.forecast_lines, keys=["period", "category"])
+    
+    assert variances["variance_pct"].abs().max() <= 100 * 0.15 / 0.85
+
+def test_sample_intercompany_lines_land_on_existing_balances():
+    quality = build_sample_financial_data().data_quality
+    checks = {result["check"]: result["status"] for result in quality["validation_results"]}
+    
+    assert quality["consistency"] == 100
+    assert checks["Duplicate Lines"] == "Passed"
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import threading
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from utils.ledger_schema import LEDGER_DIMENSIONS, sum_amounts
+
+# Rows per bitmap word
+WORD_BITS = 64
+
+# Sets of fewer rows than this fraction are kept as sorted row positions (uint32, 32 bits
+# per row) rather than packed bits (1 bit per row), whichever is smaller, as in roaring bitmaps
+SPARSE_FRACTION = 1 / 32
+
+def _popcount(words):
+    """
+    Number of set bits in an array of uint64 words
+    """
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    
+    return int(np.unpackbits(words.view(np.uint8)).sum(dtype=np.int64))
+
+class Bitmap:
+    """
+    Set of ledger rows, stored either as sorted row positions (sparse) or as a
+    packed bit array of 64 rows per uint64 word (dense)
+    
+    Dense sets only store the words between the first and last set bit, with
+    start the word offset of the first one. Ledgers are sorted by entity, period
+    and account, so the bitmaps of those values are short spans and an AND only
+    touches the words where both spans overlap. An AND with a sparse set only
+    tests the bits of its positions.
+    """
+    
+    def __init__(self, n_rows, positions=None, words=None, start=0):
+        self.n_rows = n_rows
+        self.positions = positions
+        self.words = words
+        self.start = start
+    
+    @classmethod
+    def empty(cls, n_rows):
+        return cls(n_rows, positions=np.zeros(0, dtype=np.uint32))
+    
+    @classmethod
+    def from_positions(cls, positions, n_rows):
+        """
+        Set of the given sorted row positions, packed into bits when that is smaller
+        """
+        if len(positions) == 0:
+            return cls.empty(n_rows)
+        
+        if len(positions) < n_rows * SPARSE_FRACTION:
+            return cls(n_rows, positions=positions.astype(np.uint32, copy=False))
+        
+        start = int(positions[0]) // WORD_BITS
+        words = np.zeros(int(positions[-1]) // WORD_BITS + 1 - start, dtype=np.uint64)
+        positions = positions.astype(np.uint64)
+        np.bitwise_or.at(words, (positions // WORD_BITS - start).astype(np.intp), np.uint64(1) << (positions % WORD_BITS))
+        
+        return cls(n_rows, words=words, start=start)
+    
+    @classmethod
+    def from_mask(cls, mask):
+        """
+        Set of the rows of a boolean mask
+        """
+        if not mask.any():
+            return cls.empty(len(mask))
+        
+        if np.count_nonzero(mask) < len(mask) * SPARSE_FRACTION:
+            return cls(len(mask), positions=np.flatnonzero(mask).astype(np.uint32))
+        
+        n_words = -(-len(mask) // WORD_BITS)
+        packed = np.zeros(n_words * 8, dtype=np.uint8)
+        packed[:-(-len(mask) // 8)] = np.packbits(mask, bitorder="little")
+        words = packed.view(np.uint64)
+        
+        # Trim to the span of non-zero words
+        non_zero = np.flatnonzero(words)
+        
+        return cls(len(mask), words=words[non_zero[0]:non_zero[-1] + 1].copy(), start=int(non_zero[0]))
+    
+    @property
+    def is_sparse(self):
+        return self.positions is not None
+    
+    @property
+    def is_empty(self):
+        """
+        Whether nothing is stored (a dense set can still be all zero bits)
+        """
+        return len(self.positions if self.is_sparse else self.words) == 0
+    
+    @property
+    def stop(self):
+        return self.start + len(self.words)
+    
+    def contains(self, positions):
+        """
+        Boolean array: which of the given row positions are in the set
+        """
+        if self.is_sparse:
+            found = np.searchsorted(self.positions, positions)
+            found[found == len(self.positions)] = 0
+            
+            return (self.positions[found] == positions) if len(self.positions) else np.zeros(len(positions), dtype=bool)
+        
+        word_index = positions.astype(np.int64) // WORD_BITS - self.start
+        in_span = (word_index >= 0) & (word_index < len(self.words))
+        words = self.words[np.where(in_span, word_index, 0)] if len(self.words) else np.zeros(len(positions), dtype=np.uint64)
+        bits = (words >> (positions.astype(np.uint64) % WORD_BITS)) & np.uint64(1)
+        
+        return in_span & (bits == 1)
+    
+    def __and__(self, other):
+        if self.is_sparse or other.is_sparse:
+            sparse, other = (self, other) if self.is_sparse else (other, self)
+            
+            return Bitmap(self.n_rows, positions=sparse.positions[other.contains(sparse.positions)])
+        
+        start = max(self.start, other.start)
+        stop = min(self.stop, other.stop)
+        
+        if start >= stop:
+            return Bitmap.empty(self.n_rows)
+        
+        words = self.words[start - self.start:stop - self.start] & other.words[start - other.start:stop - other.start]
+        
+        return Bitmap(self.n_rows, words=words, start=start)
+    
+    def __or__(self, other):
+        if self.is_empty:
+            return other
+        
+        if other.is_empty:
+            return self
+        
+        if self.is_sparse and other.is_sparse:
+            # Merge of two sorted arrays; values of one dimension never overlap
+            positions = np.sort(np.concatenate([self.positions, other.positions]))
+            positions = positions[np.concatenate([[True], positions[1:] != positions[:-1]])]
+            
+            return Bitmap.from_positions(positions, self.n_rows)
+        
+        if self.is_sparse or other.is_sparse:
+            sparse, dense = (self, other) if self.is_sparse else (other, self)
+            positions = sparse.positions.astype(np.uint64)
+            start = min(dense.start, int(positions[0]) // WORD_BITS)
+            stop = max(dense.stop, int(positions[-1]) // WORD_BITS + 1)
+            
+            words = np.zeros(stop - start, dtype=np.uint64)
+            words[dense.start - start:dense.stop - start] = dense.words
+            np.bitwise_or.at(words, (positions // WORD_BITS - start).astype(np.intp), np.uint64(1) << (positions % WORD_BITS))
+            
+            return Bitmap(self.n_rows, words=words, start=start)
+        
+        start = min(self.start, other.start)
+        words = np.zeros(max(self.stop, other.stop) - start, dtype=np.uint64)
+        words[self.start - start:self.stop - start] = self.words
+        words[other.start - start:other.stop - start] |= other.words
+        
+        return Bitmap(self.n_rows, words=words, start=start)
+    
+    def count(self):
+        """
+        Number of rows in the set
+        """
+        if self.is_sparse:
+            return len(self.positions)
+        
+        return _popcount(self.words)
+    
+    @cached_property
+    def size(self):
+        """
+        Number of rows in the set, counted once (a bitmap is not modified once built)
+        """
+        return self.count()
+    
+    def rows(self):
+        """
+        Row positions of the set, in ascending order
+        """
+        if self.is_sparse:
+            return self.positions.astype(np.intp)
+        
+        bits = np.unpackbits(self.words.view(np.uint8), bitorder="little")
+        
+        return np.flatnonzero(bits) + self.start * WORD_BITS
+
+class BitmapIndex:
+    """
+    Bitmap index over the dimension columns of a ledger
+    
+    One bitmap per dimension value, built from the dictionary codes on first use
+    and kept, so every later filter on the value reuses it. A filter
+    {dimension: value(s)} is the AND over dimensions of the OR of their values,
+    evaluated from the most selective dimension: once the running set is sparse,
+    the remaining dimensions only test its positions against their bitmaps. Any
+    combination of entity, account, period, cost center, product and currency
+    filters is resolved this way before a single row is materialized.
+    """
+    
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.codes = {dimension: ledger[dimension].cat.codes.to_numpy() for dimension in LEDGER_DIMENSIONS}
+        self.categories = {dimension: ledger[dimension].cat.categories for dimension in LEDGER_DIMENSIONS}
+        
+        self._bitmaps = {}
+        self._lookups = {}
+        self._lock = threading.Lock()
+    
+    def _value_codes(self, dimension, values):
+        """
+        Codes of the filter values of a dimension (values not in the ledger are ignored)
+        Looked up in a dict per dimension, as filters only hold a few values
+        """
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        lookup = self._lookups.get(dimension)
+        
+        if lookup is None:
+            labels = self.categories[dimension]
+            
+            # Periods are looked up by their "2023Q2" label
+            if dimension == "Period":
+                labels = labels.astype(str)
+            
+            lookup = self._lookups.setdefault(dimension, dict(zip(labels, range(len(labels)))))
+        
+        if dimension == "Period":
+            values = [str(value).replace("-", "") for value in values]
+        
+        return sorted({lookup[value] for value in values if value in lookup})
+    
+    def bitmap(self, dimension, code):
+        """
+        Bitmap of the rows whose dimension has the given code
+        """
+        key = (dimension, int(code))
+        bitmap = self._bitmaps.get(key)
+        
+        if bitmap is None:
+            codes = self.codes[dimension]
+            bitmap = Bitmap.from_mask(codes == np.asarray(code, dtype=codes.dtype))
+            
+            with self._lock:
+                bitmap = self._bitmaps.setdefault(key, bitmap)
+        
+        return bitmap
+    
+    def match(self, filters):
+        """
+        Bitmap of the rows matching every filter (filters as {dimension: value(s)})
+        """
+        n_rows = len(self.ledger)
+        
+        if not filters:
+            return Bitmap.from_mask(np.ones(n_rows, dtype=bool))
+        
+        # Bitmaps of the selected values of each dimension, most selective dimension first
+        selections = sorted(
+            (
+                [self.bitmap(dimension, code) for code in self._value_codes(dimension, values)]
+                for dimension, values in filters.items()
+            ),
+            key=lambda bitmaps: sum(bitmap.size for bitmap in bitmaps)
+        )
+        
+        result = Bitmap.empty(n_rows)
+        
+        for bitmap in selections[0]:
+            result = result | bitmap
+        
+        for bitmaps in selections[1:]:
+            if result.is_empty:
+                break
+            
+            if result.is_sparse:
+                # Keep the positions found in any value of the dimension
+                found = np.zeros(len(result.positions), dtype=bool)
+                
+                for bitmap in bitmaps:
+                    found |= bitmap.contains(result.positions)
+                
+                result = Bitmap(n_rows, positions=result.positions[found])
+            else:
+                matched = Bitmap.empty(n_rows)
+                
+                for bitmap in bitmaps:
+                    matched = matched | bitmap
+                
+                result = result & matched
+        
+        return result
+    
+    def count(self, filters):
+        """
+        Number of ledger rows matching the filters
+        """
+        return self.match(filters).count()
+    
+    def select(self, filters):
+        """
+        Ledger rows matching the filters
+        """
+        return self.ledger.iloc[self.match(filters).rows()]
+    
+    def sum(self, filters):
+        """
+        Total amount of the rows matching the filters, in currency units
+        """
+        amounts = self.ledger["Amount"].to_numpy()
+        
+        return sum_amounts(pd.Series(amounts[self.match(filters).rows()]))
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import json
+import hashlib
+import inspect
+import threading
+import functools
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Results persisted by dataset_cache(persist=True), shared by every worker of the
+# same user on the machine (the directory is created readable by its owner only)
+RESULT_CACHE_DIR = os.environ.get(
+    "RESULT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "results")
+)
+
+def column_fingerprint(values):
+    """
+    Hash one column over its underlying buffers
+    Categoricals hash their categories and integer codes, numeric columns their raw values
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(values.dtype).encode())
+    
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        digest.update(column_fingerprint(pd.Series(values.cat.categories)).encode())
+        digest.update(np.ascontiguousarray(values.cat.codes.to_numpy()).data)
+    elif isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufcmM":
+        digest.update(np.ascontiguousarray(values.to_numpy()).data)
+    else:
+        digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().data)
+    
+    return digest.hexdigest()
+
+def frame_fingerprint(frame):
+    """
+    Hash a DataFrame from its column names and per-column fingerprints
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(list(frame.columns)).encode())
+    
+    # A default RangeIndex carries no information beyond the row count
+    if isinstance(frame.index, pd.RangeIndex):
+        digest.update(repr(frame.index).encode())
+    else:
+        digest.update(pd.util.hash_pandas_object(frame.index).to_numpy().data)
+    
+    for column in frame.columns:
+        digest.update(column_fingerprint(frame[column]).encode())
+    
+    return digest.hexdigest()
+
+def value_fingerprint(value):
+    """
+    Hash an arbitrary value used as a cache key component
+    """
+    if hasattr(value, "fingerprint"):
+        return value.fingerprint
+    
+    if isinstance(value, pd.DataFrame):
+        return frame_fingerprint(value)
+    
+    if isinstance(value, (pd.Series, pd.Index)):
+        return column_fingerprint(pd.Series(value))
+    
+    if isinstance(value, np.ndarray):
+        return hashlib.blake2b(np.ascontiguousarray(value).data, digest_size=16).hexdigest()
+    
+    if isinstance(value, dict):
+        items = sorted((repr(key), value_fingerprint(item)) for key, item in value.items())
+        return hashlib.blake2b(repr(items).encode(), digest_size=16).hexdigest()
+    
+    if isinstance(value, (list, tuple)):
+        items = [value_fingerprint(item) for item in value]
+        return hashlib.blake2b(repr(items).encode(), digest_size=16).hexdigest()
+    
+    return hashlib.blake2b(repr(value).encode(), digest_size=16).hexdigest()
+
+def _freeze(value):
+    """
+    Make the numpy arrays of a result read-only before it is cached
+    """
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _freeze(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _freeze(item)
+    
+    return value
+
+def _share(value):
+    """
+    Hand out a cached result without copying its data
+    Frames and series are returned as shallow copies, which copy-on-write turns
+    into real copies only when the caller modifies them; containers are rebuilt so
+    that adding or replacing entries does not reach the cache, and (read-only)
+    arrays and scalars are shared as they are
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    
+    if isinstance(value, dict):
+        return {key: _share(item) for key, item in value.items()}
+    
+    if isinstance(value, list):
+        return [_share(item) for item in value]
+    
+    if isinstance(value, tuple):
+        return tuple(_share(item) for item in value)
+    
+    return value
+
+def dataset_cache(maxsize=128, persist=False):
+    """
+    Memoize a function whose first argument is a dataset
+    
+    Results are keyed on the dataset fingerprint and the remaining arguments,
+    bound to the signature with their defaults applied (so f(data) and
+    f(data, default) share an entry), so a reload of identical data keeps hitting
+    the same entries. Entries are kept per process (least recently used ones
+    evicted past maxsize); with persist=True they are also written to
+    RESULT_CACHE_DIR as JSON so that every worker can reuse them, which requires
+    JSON-serializable results.
+    
+    Cached results are shared rather than copied on every call: frames and
+    series come back as copy-on-write shallow copies and numpy arrays as
+    read-only, so callers may modify frames (and must copy arrays to modify them)
+    without affecting other sessions or later calls.
+    """
+    def decorator(func):
+        results = OrderedDict()
+        lock = threading.Lock()
+        signature = inspect.signature(func)
+        
+        @functools.wraps(func)
+        def wrapper(data, *args, **kwargs):
+            arguments = signature.bind(data, *args, **kwargs)
+            arguments.apply_defaults()
+            
+            key = value_fingerprint([
+                func.__module__,
+                func.__qualname__,
+                value_fingerprint(data),
+                list(arguments.arguments.items())[1:]
+            ])
+            
+            with lock:
+                if key in results:
+                    results.move_to_end(key)
+                    return _share(results[key])
+            
+            result_path = os.path.join(RESULT_CACHE_DIR, f"{key}.json")
+            
+            if persist and os.path.exists(result_path):
+                with open(result_path, "r", encoding="utf-8") as cached:
+                    result = json.load(cached)
+            else:
+                result = func(data, *args, **kwargs)
+                
+                if persist:
+                    # Write to a temporary file first so that other workers never read a partial result
+                    os.makedirs(RESULT_CACHE_DIR, mode=0o700, exist_ok=True)
+                    temporary_path = f"{result_path}.{os.getpid()}.tmp"
+                    
+                    with open(temporary_path, "w", encoding="utf-8") as cached:
+                        json.dump(result, cached)
+                    
+                    os.replace(temporary_path, result_path)
+            
+            with lock:
+                results[key] = _freeze(result)
+                
+                while len(results) > maxsize:
+                    results.popitem(last=False)
+            
+            return _share(result)
+        
+        def cache_clear():
+            with lock:
+                results.clear()
+        
+        wrapper.cache_clear = cache_clear
+        
+        return wrapper
+    
+    return decorator
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import numpy as np
+import pandas as pd
+from utils.cache import dataset_cache, value_fingerprint
+from utils.ledger_schema import (
+    amount_values,
+    dimension_dtype,
+    encode_amounts,
+    encode_dimension,
+    format_period,
+    parse_periods,
+    sum_amounts,
+    to_minor_units
+)
+
+# Top entity of the group, whose shareholders the group totals are attributable to
+PARENT_ENTITY = os.environ.get("PARENT_ENTITY", "ParentCo")
+
+# Columns of an ownership table: the share of Entity_ID held directly by Owner (0 to 1)
+OWNERSHIP_COLUMNS = ["Owner", "Entity_ID", "Share"]
+
+# An entity is controlled, and consolidated line by line, when the parent and the
+# entities it controls together hold more than this share of it
+CONTROL_THRESHOLD = 0.5
+
+class OwnershipStructure:
+    """
+    Direct and effective ownership of the group entities
+    
+    Direct holdings form the matrix A (A[i, j]: share of entity j held by entity i),
+    indexed by the entity dictionary codes so that a ledger's Entity_ID codes gather
+    from it directly. Effective (direct plus indirect) holdings through every chain
+    of subsidiaries are A + A^2 + ... = (I - A)^-1 - I, obtained with one linear solve,
+    which stays fast for hundreds of entities.
+    
+    - effective: matrix of effective holdings
+    - group_share: effective share of the parent in each entity (1 for the parent)
+    - controlled: entities the parent controls, directly or through controlled entities
+    """
+    
+    def __init__(self, shares, parent=PARENT_ENTITY):
+        self.shares = shares
+        self.parent = parent
+        
+        owners = encode_dimension(shares["Owner"], "Entity_ID").codes
+        entities = encode_dimension(shares["Entity_ID"], "Entity_ID").codes
+        parent_code = encode_dimension([parent], "Entity_ID").codes[0]
+        n_entities = len(dimension_dtype("Entity_ID").categories)
+        
+        values = shares["Share"].to_numpy(dtype=np.float64)
+        
+        if ((values < 0) | (values > 1)).any() or (owners == entities).any():
+            raise ValueError("Ownership shares must be between 0 and 1 and held in other entities")
+        
+        direct = np.zeros((n_entities, n_entities))
+        np.add.at(direct, (owners, entities), values)
+        
+        if (direct.sum(axis=0) > 1 + 1e-9).any():
+            raise ValueError("More than 100% of an entity is held: " + ", ".join(
+                dimension_dtype("Entity_ID").categories[direct.sum(axis=0) > 1 + 1e-9]
+            ))
+        
+        # (I - A)^-1 - I: the holdings through chains of every length
+        identity = np.eye(n_entities)
+        
+        try:
+            self.effective = np.linalg.solve(identity - direct, identity) - identity
+        except np.linalg.LinAlgError:
+            raise ValueError("Circular ownership without outside shareholders")
+        
+        self.direct = direct
+        self.parent_code = parent_code
+        
+        self.group_share = self.effective[parent_code].copy()
+        self.group_share[parent_code] = 1.0
+        
+        # Control spreads down the chain: an entity is controlled when the controlled
+        # entities together hold more than CONTROL_THRESHOLD of it
+        controlled = np.zeros(n_entities, dtype=bool)
+        controlled[parent_code] = True
+        
+        for _ in range(n_entities):
+            expanded = controlled | (controlled @ direct > CONTROL_THRESHOLD)
+            
+            if (expanded == controlled).all():
+                break
+            
+            controlled = expanded
+        
+        self.controlled = controlled
+    
+    @property
+    def fingerprint(self):
+        return value_fingerprint([self.shares, self.parent])
+    
+    def frame(self, entities=None):
+        """
+        Ownership of the parent in each entity (every entity with a holding by default):
+        direct and effective share, control, and the non-controlling interest share
+        """
+        categories = dimension_dtype("Entity_ID").categories
+        
+        if entities is None:
+            codes = np.flatnonzero((self.direct.sum(axis=0) > 0) | (np.arange(len(categories)) == self.parent_code))
+        else:
+            codes = categories.get_indexer(list(entities))
+            codes = codes[codes >= 0]
+        
+        return pd.DataFrame({
+            "entity": categories.take(codes),
+            "direct_share": np.where(codes == self.parent_code, 1.0, self.direct[self.parent_code, codes]),
+            "effective_share": self.group_share[codes],
+            "controlled": self.controlled[codes],
+            "nci_share": np.where(self.controlled[codes], 1 - self.group_share[codes], 0.0)
+        })
+
+def read_ownership(path, parent=PARENT_ENTITY):
+    """
+    Read an ownership table export (Owner, Entity_ID, Share)
+    """
+    shares = pd.read_csv(
+        path,
+        usecols=OWNERSHIP_COLUMNS,
+        dtype={"Owner": "category", "Entity_ID": "category", "Share": "float64"}
+    )
+    
+    return OwnershipStructure(shares, parent)
+
+def wholly_owned(entities, parent=PARENT_ENTITY):
+    """
+    Ownership of a group where the parent holds every other entity outright
+    """
+    subsidiaries = [entity for entity in entities if entity != parent]
+    
+    return OwnershipStructure(
+        pd.DataFrame({"Owner": [parent] * len(subsidiaries), "Entity_ID": subsidiaries, "Share": 1.0}),
+        parent
+    )
+
+@dataset_cache()
+def consolidate_group(data, dimensions=("Period", "Account"), ownership=None):
+    """
+    Group totals of the (translated) ledger with the non-controlling interest
+    
+    Controlled entities are consolidated in full; the total of each line splits
+    into the part attributable to the parent's shareholders (the parent's
+    effective share) and the non-controlling interest (the rest). Entities the
+    group does not control are left out. The ownership percentages are gathered
+    by Entity_ID code and applied to the cube's entity-level aggregate in one
+    vectorized pass, then summed by dimensions.
+    
+    Uses the dataset's ownership structure unless one is given. Returns one row
+    per combination of dimensions: total, attributable_to_parent and
+    non_controlling_interest
+    """
+    ownership = ownership if ownership is not None else data.ownership
+    dimensions = list(dimensions)
+    columns = dimensions + ["total", "attributable_to_parent", "non_controlling_interest"]
+    
+    if data.cube is None or ownership is None:
+        return pd.DataFrame(columns=columns)
+    
+    lines = data.cube.aggregate(["Entity_ID"] + [dimension for dimension in dimensions if dimension != "Entity_ID"])
+    
+    # Shares by entity code; entities added to the dictionary after the structure was built are not held
+    codes = lines["Entity_ID"].cat.codes.to_numpy()
+    known = (codes >= 0) & (codes < len(ownership.group_share))
+    codes = np.where(known, codes, 0)
+    controlled = known & ownership.controlled[codes]
+    group_share = np.where(controlled, ownership.group_share[codes], 0.0)
+    
+    amounts = lines["amount"].to_numpy()
+    split = pd.DataFrame({
+        "total": np.where(controlled, amounts, 0.0),
+        "attributable_to_parent": amounts * group_share,
+        "non_controlling_interest": np.where(controlled, amounts * (1 - group_share), 0.0)
+    })
+    
+    if not dimensions:
+        return pd.DataFrame({column: [sum_amounts(split[column])] for column in split.columns})
+    
+    keys = [lines[dimension] for dimension in dimensions]
+    
+    return pd.DataFrame({
+        column: sum_amounts(split[column], keys)
+        for column in split.columns
+    }).reset_index()
+
+# Grain of the partition aggregates: accounts and currencies of an (entity, period) partition
+PARTITION_GRAIN = ["Entity_ID", "Period", "Account", "Currency"]
+
+def _aggregate_partitions(lines):
+    """
+    Ledger lines summed to PARTITION_GRAIN, as a ledger-schema frame (Amount in the
+    ledger's representation) on the current dictionaries
+    """
+    from utils.olap_cube import LedgerCube
+    
+    aggregate = LedgerCube(lines).aggregate(PARTITION_GRAIN)
+    partitions = {
+        column: pd.Categorical.from_codes(aggregate[column].cat.codes, dtype=dimension_dtype(column))
+        for column in PARTITION_GRAIN
+    }
+    partitions["Amount"] = encode_amounts(aggregate["amount"], pd.api.types.is_integer_dtype(lines["Amount"].dtype))
+    
+    return pd.DataFrame(partitions)
+
+def _split_partitions(frame):
+    """
+    Rows of a frame by (entity, period) partition
+    """
+    return {
+        (str(entity), period): rows.reset_index(drop=True)
+        for (entity, period), rows in frame.groupby(["Entity_ID", "Period"], observed=True)
+    }
+
+class IncrementalConsolidation:
+    """
+    Group totals kept up to date one (entity, period) partition at a time
+    
+    The booked ledger is translated line by line, as in the full build, and
+    aggregated once per partition (accounts and currencies of an entity in a
+    period); so are the elimination entries of the intercompany balances, which
+    are matched period by period. Each partition's contribution to the group
+    totals (eliminated and split by the ownership shares) is kept, and the
+    totals are the sum of the contributions.
+    
+    When an entity resubmits a period, resubmit() translates and re-aggregates
+    that partition only. Its intercompany balances are re-matched for that
+    period only, which can change the eliminations of its counterparties in that
+    period; only the partitions whose aggregates changed are recomputed, and
+    their old contribution is swapped for the new one in the period totals.
+    Amounts are kept in minor units and the ownership split is rounded at the
+    same grain as consolidate_group (entity, period and account), so the totals
+    match consolidate_group on the equivalent dataset exactly.
+    
+    This is a standalone API for sources that deliver resubmissions one entity
+    and period at a time. The dashboard's load_data() and refresh_data() reread
+    the full export and rebuild the dataset instead, and consolidate_group gives
+    its totals.
+    """
+    
+    def __init__(self, ledger, fx_rates=None, intercompany_lines=None, ownership=None, tolerance=None):
+        from utils.intercompany import INTERCOMPANY_TOLERANCE
+        
+        self.fx_rates = fx_rates
+        self.minor_units = pd.api.types.is_integer_dtype(ledger["Amount"].dtype)
+        self.tolerance = INTERCOMPANY_TOLERANCE if tolerance is None else tolerance
+        self.ownership = ownership if ownership is not None else wholly_owned(
+            ledger["Entity_ID"].cat.remove_unused_categories().cat.categories.astype(str)
+        )
+        
+        # One grouped pass over the ledger; every later update is per partition
+        self._booked = _split_partitions(self._translated_partitions(ledger))
+        self._intercompany = _split_partitions(intercompany_lines) if intercompany_lines is not None else {}
+        self._eliminated = {}
+        self._matches = {}
+        
+        for period in sorted({period for _, period in self._intercompany}):
+            self._match_period(period)
+        
+        self._contributions = {}
+        self._totals = {}
+        
+        for key in set(self._booked) | set(self._eliminated):
+            self._merge(key)
+    
+    def _translated_partitions(self, lines):
+        """
+        Lines translated one by one (each rounded to the minor unit, as translate_ledger
+        does for the full ledger) and then summed to PARTITION_GRAIN
+        """
+        if self.fx_rates is not None:
+            from utils.fx_translation import translate_ledger
+            lines = translate_ledger(lines, self.fx_rates)
+        
+        return _aggregate_partitions(lines)
+    
+    def _match_period(self, period):
+        """
+        Match the intercompany balances of one period and keep their elimination
+        entries per partition; returns the partitions whose eliminations changed
+        """
+        from utils.intercompany import eliminate_intercompany
+        
+        lines = [rows for (_, line_period), rows in self._intercompany.items() if line_period == period]
+        previous = {key: rows for key, rows in self._eliminated.items() if key[1] == period}
+        
+        for key in previous:
+            del self._eliminated[key]
+        
+        if lines:
+            result = eliminate_intercompany(pd.concat(lines, ignore_index=True), self.tolerance)
+            self._matches[period] = result
+            
+            if not result["eliminations"].empty:
+                self._eliminated.update(_split_partitions(self._translated_partitions(result["eliminations"])))
+        else:
+            self._matches.pop(period, None)
+        
+        current = {key: rows for key, rows in self._eliminated.items() if key[1] == period}
+        
+        return {
+            key for key in set(previous) | set(current)
+            if key not in previous or key not in current or not previous[key].equals(current[key])
+        }
+    
+    def _contribution(self, key):
+        """
+        Eliminated amounts of a partition by account, split by the ownership
+        shares as consolidate_group does: total, attributable_to_parent and
+        non_controlling_interest, each rounded per account
+        """
+        parts = [self._booked[key]] if key in self._booked else []
+        parts += [self._eliminated[key]] if key in self._eliminated else []
+        lines = pd.concat(parts, ignore_index=True)
+        by_account = lines.groupby("Account", observed=True)["Amount"].sum()
+        
+        code = dimension_dtype("Entity_ID").categories.get_indexer([key[0]])[0]
+        controlled = 0 <= code < len(self.ownership.controlled) and self.ownership.controlled[code]
+        share = self.ownership.group_share[code] if controlled else 0.0
+        
+        # Same expressions as consolidate_group on the currency-unit amounts
+        amounts = amount_values(by_account)
+        split = pd.DataFrame({
+            "total": amounts if controlled else amounts * 0,
+            "attributable_to_parent": amounts * share,
+            "non_controlling_interest": amounts * (1 - share) if controlled else amounts * 0
+        })
+        
+        if self.minor_units:
+            split = split.apply(to_minor_units)
+        
+        return split
+    
+    def _merge(self, key):
+        """
+        Swap the contribution of a partition in its period totals
+        """
+        period = key[1]
+        previous = self._contributions.pop(key, None)
+        totals = self._totals.get(period)
+        
+        if previous is not None:
+            totals = totals.sub(previous, fill_value=0)
+        
+        if key in self._booked or key in self._eliminated:
+            contribution = self._contribution(key)
+            self._contributions[key] = contribution
+            totals = contribution if totals is None else totals.add(contribution, fill_value=0)
+        
+        self._totals[period] = totals
+    
+    def resubmit(self, entity, period, lines, intercompany_lines=None):
+        """
+        Replace the ledger lines of one entity and period (and, when given, its
+        intercompany lines) and bring the group totals up to date
+        Returns the partitions that were recomputed
+        """
+        key = (str(entity), parse_periods([str(period)])[0])
+        
+        for frame in [lines, intercompany_lines]:
+            if frame is not None and len(frame) and not (
+                (frame["Entity_ID"].astype(str) == key[0]).all() and (frame["Period"] == key[1]).all()
+            ):
+                raise ValueError(f"Resubmitted lines must all belong to {key[0]} {format_period(key[1])}")
+        
+        changed = {key}
+        
+        if len(lines):
+            self._booked[key] = self._translated_partitions(lines)
+        else:
+            self._booked.pop(key, None)
+        
+        if intercompany_lines is not None:
+            if len(intercompany_lines):
+                self._intercompany[key] = intercompany_lines.reset_index(drop=True)
+            else:
+                self._intercompany.pop(key, None)
+            
+            changed |= self._match_period(key[1])
+        
+        for changed_key in changed:
+            self._merge(changed_key)
+        
+        return sorted(changed)
+    
+    def totals(self):
+        """
+        Group totals by period and account in currency units: total,
+        attributable_to_parent and non_controlling_interest
+        """
+        columns = ["Period", "Account", "total", "attributable_to_parent", "non_controlling_interest"]
+        frames = [
+            totals.rename_axis("Account").reset_index().assign(Period=period)
+            for period, totals in sorted(self._totals.items())
+            if totals is not None
+        ]
+        
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        
+        totals = pd.concat(frames, ignore_index=True)
+        
+        # Minor units may have been widened to float64 by the merges; they are still whole
+        if self.minor_units:
+            for column in columns[2:]:
+                totals[column] = amount_values(totals[column].round().astype(np.int64))
+        
+        totals["Period"] = encode_dimension(totals["Period"], "Period")
+        totals["Account"] = encode_dimension(totals["Account"], "Account")
+        
+        return totals[columns].sort_values(["Period", "Account"], ignore_index=True)
+    
+    def residuals(self):
+        """
+        Intercompany balances left unmatched, over every period
+        """
+        frames = [result["residuals"] for _, result in sorted(self._matches.items())]
+        
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
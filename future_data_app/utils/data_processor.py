@@ -4,101 +4,615 @@
 # In[ ]:
 
 
+import os
+import itertools
+import threading
 import pandas as pd
 import numpy as np
-from data.sample_financial_data import generate_sample_financial_data
+import streamlit as st
+from data import sample_financial_data
+from data.sample_financial_data import (
+    generate_sample_forecast_ledger,
+    generate_sample_fx_rates,
+    generate_sample_intercompany_lines,
+    generate_sample_ledger,
+    generate_sample_ownership
+)
+from utils.ingestion import load_consolidation_ledger, load_excel_workbook, read_intercompany_csv
+from utils.dataset import FinancialDataset, comparison_period
+from utils.cache import dataset_cache
+from utils.consolidation import OwnershipStructure, read_ownership, wholly_owned
+from utils.data_quality import assess_ledger_quality
+from utils.fx_translation import REPORTING_CURRENCY, FxRates, calculate_translation_adjustment, read_fx_rates, translate_ledger
+from utils.intercompany import apply_eliminations, book_intercompany_lines, eliminate_intercompany, normalize_intercompany_lines
+from utils.journal_aggregation import load_journal_ledger
+from utils.ledger_schema import (
+    COST_ACCOUNTS,
+    PERIOD_DTYPE,
+    REVENUE_ACCOUNT,
+    amount_values,
+    conform_ledger,
+    normalize_ledger,
+    sort_ledger,
+    sum_amounts
+)
+from utils.olap_cube import LedgerCube
+
+# Consolidation CSV export to load instead of the sample data (sample data if unset)
+FINANCIAL_DATA_PATH = os.environ.get("FINANCIAL_DATA_PATH")
+
+# Forecast export in the same ledger schema, compared with the actuals (no forecast if unset)
+FORECAST_DATA_PATH = os.environ.get("FORECAST_DATA_PATH")
+
+# FX rate table export (Period, Currency, Average_Rate, Closing_Rate) the ledgers are
+# translated with (sample rates over the ledger periods if unset)
+FX_RATES_PATH = os.environ.get("FX_RATES_PATH")
+
+# Intercompany export (ledger columns plus Counterparty) whose matched balances are
+# eliminated in consolidation (sample transactions for the sample data if unset)
+INTERCOMPANY_DATA_PATH = os.environ.get("INTERCOMPANY_DATA_PATH")
+
+# Ownership table export (Owner, Entity_ID, Share) of the group (the parent holding
+# every ledger entity outright, or the sample structure for the sample data, if unset)
+OWNERSHIP_DATA_PATH = os.environ.get("OWNERSHIP_DATA_PATH")
+
+# Journal-line exports (CSV, Parquet or Feather in the ledger schema, separated by
+# os.pathsep) rolled up to the ledger grain out of core and added to the consolidation export
+JOURNAL_DATA_PATHS = [path for path in os.environ.get("JOURNAL_DATA_PATHS", "").split(os.pathsep) if path]
+
+# Credit risk workbook attached to every dataset (defaults to the bundled sample)
+CREDIT_RISK_DATA_PATH = os.environ.get(
+    "CREDIT_RISK_DATA_PATH",
+    os.path.join(os.path.dirname(sample_financial_data.__file__), "sample_credit_risk_dataset.xlsx")
+)
+
+# Key columns actual and forecast amounts are compared on, where both frames have them
+VARIANCE_KEYS = ["period", "category", "entity"]
+
+# Subtotal levels of segment reporting (ledger dimensions; [] is the grand total)
+SEGMENT_GROUPING_SETS = [["Entity_ID"], ["Entity_ID", "Account"], ["Account", "Period"], []]
+
+# Default forecast assumptions used when the source has none
+DEFAULT_FORECAST_ASSUMPTIONS = {
+    "revenue_growth": 7.5,  # Forecast 7.5% annual growth
+    "ebitda_margin": 18.0,  # Forecast 18% EBITDA margin
+    "roi": 12.5  # Forecast 12.5% ROI
+}
+
+# Seconds a loaded dataset stays cached before it is reloaded from the source
+DATA_CACHE_TTL = int(os.environ.get("DATA_CACHE_TTL", 3600))
+
+# Dataset version, bumped by refresh_data() and used as part of the cache key
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+def get_data_version():
+    """
+    Get the current dataset version
+    """
+    return _data_version
+
+def get_data_source_signature():
+    """
+    Identify the current data source so that a change to it invalidates the cache
+    Without a configured export, the source is the sample data generator module
+    """
+    source_paths = [FINANCIAL_DATA_PATH or sample_financial_data.__file__, CREDIT_RISK_DATA_PATH]
+    
+    if FINANCIAL_DATA_PATH and FORECAST_DATA_PATH:
+        source_paths.append(FORECAST_DATA_PATH)
+    
+    if FX_RATES_PATH:
+        source_paths.append(FX_RATES_PATH)
+    
+    if INTERCOMPANY_DATA_PATH:
+        source_paths.append(INTERCOMPANY_DATA_PATH)
+    
+    if OWNERSHIP_DATA_PATH:
+        source_paths.append(OWNERSHIP_DATA_PATH)
+    
+    if FINANCIAL_DATA_PATH:
+        source_paths.extend(JOURNAL_DATA_PATHS)
+    
+    signature = []
+    
+    for source_path in source_paths:
+        source_stat = os.stat(source_path)
+        signature.append((source_path, source_stat.st_mtime_ns, source_stat.st_size))
+    
+    return tuple(signature)
+
+@st.cache_resource(ttl=DATA_CACHE_TTL, show_spinner="Loading financial data...")
+def _load_shared_data(data_version, source_signature):
+    """
+    Load the dataset for a given version and source
+    Cached once per process and shared by every session
+    """
+    # Read the configured consolidation export, or generate sample financial data
+    if FINANCIAL_DATA_PATH:
+        ledger = load_consolidation_ledger(FINANCIAL_DATA_PATH)
+        
+        # Journal exports are rolled up to the ledger grain before they join the ledger
+        if JOURNAL_DATA_PATHS:
+            journal_ledgers = [load_journal_ledger(path) for path in JOURNAL_DATA_PATHS]
+            ledger = sort_ledger(pd.concat([conform_ledger(part) for part in [ledger] + journal_ledgers], ignore_index=True))
+        
+        forecast_ledger = load_consolidation_ledger(FORECAST_DATA_PATH) if FORECAST_DATA_PATH else None
+        intercompany_lines = read_intercompany_csv(INTERCOMPANY_DATA_PATH) if INTERCOMPANY_DATA_PATH else None
+        data = build_financial_data(
+            ledger,
+            forecast_ledger,
+            load_fx_rates(ledger, forecast_ledger),
+            intercompany_lines,
+            read_ownership(OWNERSHIP_DATA_PATH) if OWNERSHIP_DATA_PATH else None
+        )
+    else:
+        data = build_sample_financial_data(
+            intercompany_lines=read_intercompany_csv(INTERCOMPANY_DATA_PATH) if INTERCOMPANY_DATA_PATH else None,
+            ownership=read_ownership(OWNERSHIP_DATA_PATH) if OWNERSHIP_DATA_PATH else None
+        )
+    
+    # Attach the credit risk workbook (one DataFrame per sheet), read on first access
+    data.attach_credit_risk(lambda: load_excel_workbook(CREDIT_RISK_DATA_PATH))
+    
+    return data
 
 def load_data():
     """
     Load financial data from the data source
-    For demonstration purposes, this function returns sample data
-    In a real scenario, this would connect to the CPM system
+    Reads the consolidation CSV export set in FINANCIAL_DATA_PATH, or returns
+    sample data for demonstration purposes when no export is configured
+    
+    The dataset is loaded once per process and shared by all sessions, so callers
+    must treat it as read-only and copy any frame they want to modify
     """
-    # Generate sample financial data
-    return generate_sample_financial_data()
+    return _load_shared_data(get_data_version(), get_data_source_signature())
 
-def process_revenue_data(data):
+def refresh_data():
     """
-    Process revenue data for analysis
+    Invalidate the shared dataset so that the next load_data() call reloads it
     """
-    # Extract revenue data
-    revenue_data = data["financial_data"]["revenue"]
+    global _data_version
     
-    # Calculate total revenue by period
-    total_revenue = revenue_data.groupby("period")["amount"].sum().reset_index()
+    with _data_version_lock:
+        _data_version += 1
+        # Drop datasets cached for older versions instead of waiting for the TTL
+        _load_shared_data.clear()
     
-    # Calculate growth rates
-    total_revenue["growth_rate"] = total_revenue["amount"].pct_change() * 100
+    return _data_version
+
+def load_fx_rates(*ledgers):
+    """
+    FX rates to translate ledgers with: the FX_RATES_PATH table, or sample rates
+    over the periods of the ledgers
+    """
+    if FX_RATES_PATH:
+        return read_fx_rates(FX_RATES_PATH)
+    
+    periods = set()
     
-    return total_revenue
+    for ledger in ledgers:
+        if ledger is not None:
+            # Periods present, from a count of the codes (missing periods, code -1, are skipped)
+            present = np.flatnonzero(np.bincount(ledger["Period"].cat.codes.to_numpy() + 1)[1:])
+            periods.update(ledger["Period"].cat.categories[present])
+    
+    return FxRates(generate_sample_fx_rates(periods, REPORTING_CURRENCY), REPORTING_CURRENCY)
 
-def process_cost_data(data):
+def _summarize_dimension(cube, column, current_period, previous_period):
     """
-    Process cost data for analysis
+    Sum revenue and costs of the current and previous period for each value of a dimension
     """
-    # Extract cost data
-    cost_data = data["financial_data"]["costs"]
+    lines = cube.aggregate(
+        [column, "Account", "Period"],
+        {"Period": [current_period, previous_period], "Account": [REVENUE_ACCOUNT] + COST_ACCOUNTS}
+    )
     
-    # Calculate total costs by period and category
-    total_costs_by_category = cost_data.groupby(["period", "category"])["amount"].sum().reset_index()
+    is_revenue = lines["Account"] == REVENUE_ACCOUNT
+    is_current = lines["Period"] == current_period
+    measure = pd.Series(
+        np.select(
+            [is_revenue & is_current, is_current, is_revenue],
+            ["revenue", "cost", "previous_revenue"],
+            "previous_cost"
+        ),
+        index=lines.index,
+        name="measure"
+    )
     
-    # Calculate total costs by period
-    total_costs = cost_data.groupby("period")["amount"].sum().reset_index()
+    summary = sum_amounts(lines["amount"], [lines[column], measure]).unstack(fill_value=0)
     
-    return {
-        "total_costs": total_costs,
-        "by_category": total_costs_by_category
-    }
+    return summary.reindex(columns=["revenue", "cost", "previous_revenue", "previous_cost"], fill_value=0)
 
-def calculate_profitability(data):
+def _revenue_by_category(cube):
     """
-    Calculate profitability metrics
+    Revenue of a ledger cube by period, product (as category) and entity
     """
-    # Process revenue and cost data
-    revenue_data = process_revenue_data(data)
-    cost_data = process_cost_data(data)
+    return (
+        cube.aggregate(["Period", "Product", "Entity_ID"], {"Account": REVENUE_ACCOUNT})
+        .rename(columns={"Period": "period", "Product": "category", "Entity_ID": "entity"})
+    )
+
+def build_financial_data(ledger, forecast_ledger=None, fx_rates=None, intercompany_lines=None, ownership=None):
+    """
+    Build the dataset structure the dashboards expect from a consolidation ledger
+    Revenue is broken down by product and entity, costs into COGS and operating
+    expenses by cost center, and each entity is reported as a region
+    Forecast lines come from the revenue of an optional forecast ledger
+    
+    With intercompany_lines the matched intercompany balances are first eliminated
+    (in the booking currency, before translation); unmatched ones stay in and are
+    reported by the data quality checks
+    
+    With fx_rates the ledgers are then translated to the reporting currency and
+    the cumulative translation adjustment is computed; without, their amounts are
+    taken to be in the reporting currency already. Lines without a rate are left
+    out and reported by the data quality checks
+    
+    The group is held as in ownership (an OwnershipStructure); without, the parent
+    is taken to hold every entity of the ledger outright
     
-    # Merge revenue and cost data by period
-    profitability = pd.merge(
-        revenue_data,
-        cost_data["total_costs"],
-        on="period",
-        suffixes=("_revenue", "_cost")
+    Every table is a query on the ledger's OLAP cube, which the dataset keeps
+    The ledger is kept in ledger sort order for the dataset's lookup index
+    """
+    booked_ledger = ledger = sort_ledger(ledger)
+    translation_adjustment = None
+    intercompany = None
+    
+    # Elimination stage: matched intercompany balances are reversed in the ledger
+    if intercompany_lines is not None:
+        intercompany = eliminate_intercompany(intercompany_lines)
+        ledger = apply_eliminations(ledger, intercompany)
+    
+    # FX translation stage: everything below is in the reporting currency. Lines
+    # without a rate are left out and reported by the Currency Translation check
+    if fx_rates is not None:
+        translation_adjustment = calculate_translation_adjustment(ledger, fx_rates)
+        ledger = translate_ledger(ledger, fx_rates, drop_missing=True)
+        
+        if forecast_ledger is not None:
+            forecast_ledger = translate_ledger(forecast_ledger, fx_rates, drop_missing=True)
+    
+    cube = LedgerCube(ledger)
+    
+    periods = list(cube.aggregate(["Period"])["Period"].dropna())
+    current_period = periods[-1]
+    previous_period = comparison_period(periods)
+    
+    # Revenue by period, product and entity
+    revenue_df = _revenue_by_category(cube)
+    
+    if forecast_ledger is not None:
+        forecast_df = _revenue_by_category(LedgerCube(forecast_ledger))
+    else:
+        forecast_df = pd.DataFrame({
+            "period": pd.Categorical([], dtype=PERIOD_DTYPE),
+            "category": pd.Categorical([]),
+            "entity": pd.Categorical([]),
+            "amount": np.array([], dtype=np.float64)
+        })
+    
+    # Costs by period: COGS as one category, operating expenses by cost center
+    cost_lines = cube.aggregate(["Period", "Account", "Cost_Center"], {"Account": COST_ACCOUNTS})
+    cost_category = pd.Series(
+        np.where(cost_lines["Account"] == "COGS", "COGS", cost_lines["Cost_Center"].astype(str)),
+        index=cost_lines.index,
+        name="category"
+    )
+    cost_df = (
+        sum_amounts(cost_lines["amount"], [cost_lines["Period"], cost_category])
+        .reset_index()
+        .rename(columns={"Period": "period"})
+        .astype({"category": "category"})
     )
     
+    # Product performance in the latest period
+    product_summary = _summarize_dimension(cube, "Product", current_period, previous_period)
+    product_margin = (product_summary["revenue"] - product_summary["cost"]) / product_summary["revenue"] * 100
+    product_cost_growth = (product_summary["cost"] / product_summary["previous_cost"] - 1) * 100
+    
+    product_df = pd.DataFrame({
+        "id": np.arange(1, len(product_summary) + 1),
+        "name": product_summary.index.astype(str),
+        "revenue": product_summary["revenue"].to_numpy(),
+        "cost": product_summary["cost"].to_numpy(),
+        "profit_margin": product_margin.to_numpy(),
+        "yoy_growth": ((product_summary["revenue"] / product_summary["previous_revenue"] - 1) * 100).to_numpy(),
+        "market_share": (product_summary["revenue"] / product_summary["revenue"].sum() * 100).to_numpy(),
+        "customer_satisfaction": np.nan,  # Not part of the consolidation export
+        "raw_material_increase": np.where(product_margin < 15, product_cost_growth, 0)
+    })
+    
+    # Entity performance in the latest period
+    entity_summary = _summarize_dimension(cube, "Entity_ID", current_period, previous_period)
+    
+    geo_df = pd.DataFrame({
+        "region": entity_summary.index.astype(str),
+        "revenue": entity_summary["revenue"].to_numpy(),
+        "cost": entity_summary["cost"].to_numpy(),
+        "growth": ((entity_summary["revenue"] / entity_summary["previous_revenue"] - 1) * 100).to_numpy()
+    })
+    
+    # Data quality is assessed lazily on the ledger as booked: before translation and
+    # without the elimination entries, which would read as duplicate lines
+    return FinancialDataset(
+        revenue=revenue_df,
+        costs=cost_df,
+        products=product_df,
+        geographic=geo_df,
+        forecast_lines=forecast_df,
+        forecast_assumptions=dict(DEFAULT_FORECAST_ASSUMPTIONS),
+        data_quality=lambda: assess_ledger_quality(booked_ledger, intercompany=intercompany, fx_rates=fx_rates),
+        ledger=ledger,
+        tables_from_ledger=True,
+        cube=cube,
+        fx_rates=fx_rates,
+        translation_adjustment=translation_adjustment,
+        intercompany=intercompany,
+        ownership=ownership if ownership is not None else wholly_owned(entity_summary.index.astype(str))
+    )
+
+def build_sample_financial_data(seed=42, intercompany_lines=None, ownership=None):
+    """
+    Build the sample dataset for demonstration purposes (no export configured)
+    In a real scenario, this data would come from the CPM system
+    
+    Every table is built from the synthetic consolidation ledger by
+    build_financial_data, exactly as for an export, so the KPIs, tables and
+    ledger views describe the same data. The sample ledger comes with a
+    forecast ledger, intercompany transactions (unless intercompany_lines are
+    given) and the sample ownership structure (unless ownership is given); it
+    is translated with the FX_RATES_PATH table or sample rates
+    
+    The intercompany lines are booked into the ledger first, so eliminating
+    the matched balances removes amounts the ledger actually contains
+    
+    The sample generators return plain frames in the export schemas, which are
+    normalized here like exports
+    """
+    if intercompany_lines is None:
+        intercompany_lines = normalize_intercompany_lines(generate_sample_intercompany_lines(seed=seed))
+    
+    ledger = book_intercompany_lines(normalize_ledger(generate_sample_ledger(seed=seed)), intercompany_lines)
+    
+    # The forecast is a group forecast: drawn on the ledger after the eliminations
+    # build_financial_data applies, in currency units
+    group_ledger = apply_eliminations(ledger, eliminate_intercompany(intercompany_lines))
+    actuals = group_ledger.assign(Amount=amount_values(group_ledger["Amount"]))
+    forecast_ledger = normalize_ledger(generate_sample_forecast_ledger(actuals, seed=seed))
+    
+    return build_financial_data(
+        ledger,
+        forecast_ledger,
+        load_fx_rates(ledger, forecast_ledger),
+        intercompany_lines,
+        ownership if ownership is not None else OwnershipStructure(generate_sample_ownership())
+    )
+
+@dataset_cache()
+def calculate_performance_metrics(data):
+    """
+    Calculate every performance aggregate in one grouped pass per table
+    
+    Revenue is grouped by period and costs by period and category once; cost by
+    period, gross profit, margins and growth rates are all derived from those
+    aggregates. Memoized per dataset, so the views below share one computation
+    """
+    revenue = data["financial_data"]["revenue"]
+    costs = data["financial_data"]["costs"]
+    
+    # The only passes over the source rows (exact fixed-point sums, see sum_amounts)
+    revenue_by_period = sum_amounts(revenue["amount"], revenue["period"])
+    cost_by_category = sum_amounts(costs["amount"], [costs["period"], costs["category"]])
+    
+    # Cost by period from the (small) per-category aggregate
+    cost_by_period = sum_amounts(cost_by_category, cost_by_category.index.get_level_values("period"))
+    
+    total_revenue = revenue_by_period.reset_index()
+    total_revenue["growth_rate"] = total_revenue["amount"].pct_change() * 100
+    
+    total_costs = cost_by_period.rename_axis("period").reset_index()
+    total_costs["growth_rate"] = total_costs["amount"].pct_change() * 100
+    
+    # Align revenue and costs by period
+    aligned = pd.concat(
+        [revenue_by_period.rename("amount_revenue"), cost_by_period.rename("amount_cost")],
+        axis=1,
+        join="inner"
+    )
+    
+    profitability = aligned.rename_axis("period").reset_index()
+    profitability.insert(2, "growth_rate", (revenue_by_period.pct_change() * 100).reindex(aligned.index).to_numpy())
+    
     # Calculate gross profit and margin
     profitability["gross_profit"] = profitability["amount_revenue"] - profitability["amount_cost"]
     profitability["gross_margin"] = (profitability["gross_profit"] / profitability["amount_revenue"]) * 100
     
-    return profitability
+    return {
+        "revenue_by_period": total_revenue,
+        "cost_by_period": total_costs,
+        "cost_by_category": cost_by_category.reset_index(),
+        "profitability": profitability
+    }
 
-def get_product_performance(data):
+def process_revenue_data(data):
     """
-    Get product performance metrics
+    Process revenue data for analysis: total revenue and growth rate by period
+    """
+    return calculate_performance_metrics(data)["revenue_by_period"]
+
+def process_cost_data(data):
+    """
+    Process cost data for analysis: total costs by period and by period and category
+    """
+    metrics = calculate_performance_metrics(data)
+    
+    return {
+        "total_costs": metrics["cost_by_period"],
+        "by_category": metrics["cost_by_category"]
+    }
+
+def calculate_profitability(data):
+    """
+    Calculate profitability metrics: gross profit and margin by period
+    """
+    return calculate_performance_metrics(data)["profitability"]
+
+def rollup_sets(dimensions):
+    """
+    Grouping sets of ROLLUP(dimensions): every prefix of the hierarchy, down to the grand total
+    """
+    return [list(dimensions[:n]) for n in range(len(dimensions), -1, -1)]
+
+def cube_sets(dimensions):
+    """
+    Grouping sets of CUBE(dimensions): every combination of the dimensions
+    """
+    return [
+        list(combination)
+        for n in range(len(dimensions), -1, -1)
+        for combination in itertools.combinations(dimensions, n)
+    ]
+
+@dataset_cache()
+def aggregate_grouping_sets(data, grouping_sets=None, filters=None):
+    """
+    Ledger amounts subtotaled at several levels at once (GROUPING SETS)
+    
+    The ledger cube is queried once at the finest grain the sets need (the union
+    of their dimensions) and every level is summed from that aggregate, so the
+    ledger rows are scanned at most once whatever the number of levels. Use
+    rollup_sets or cube_sets for ROLLUP and CUBE. Defaults to the segment
+    reporting levels; filters maps ledger dimensions to the values to keep.
+    
+    Returns one tidy frame with a column per dimension (missing where the level
+    rolls it up), the amount and two level indicators:
+    - level: dimensions of the set joined with "+", "Total" for the grand total
+    - grouping_id: bit mask of the rolled-up dimensions, as SQL GROUPING_ID
+    """
+    grouping_sets = [list(dimensions) for dimensions in (grouping_sets or SEGMENT_GROUPING_SETS)]
+    dimensions = list(dict.fromkeys(itertools.chain.from_iterable(grouping_sets)))
+    
+    if data.cube is None:
+        return pd.DataFrame(columns=dimensions + ["amount", "level", "grouping_id"])
+    
+    # The only query on the cube, at the finest grain requested
+    finest = data.cube.aggregate(dimensions, filters)
+    levels = []
+    
+    for grouping_set in grouping_sets:
+        if grouping_set:
+            level = sum_amounts(finest["amount"], [finest[dimension] for dimension in grouping_set]).reset_index()
+        else:
+            level = pd.DataFrame({"amount": [sum_amounts(finest["amount"])]})
+        
+        # Rolled-up dimensions are missing, with the dtype of the detailed rows
+        for dimension in dimensions:
+            if dimension not in grouping_set:
+                level[dimension] = pd.Categorical([None] * len(level), dtype=finest[dimension].dtype)
+        
+        level["level"] = "+".join(grouping_set) or "Total"
+        level["grouping_id"] = sum(
+            1 << (len(dimensions) - 1 - i)
+            for i, dimension in enumerate(dimensions)
+            if dimension not in grouping_set
+        )
+        levels.append(level[dimensions + ["amount", "level", "grouping_id"]])
+    
+    return pd.concat(levels, ignore_index=True)
+
+def select_top_k(frame, k, metric, largest=True):
+    """
+    Select the k rows with the largest (or smallest) metric, in ranked order
+    
+    Uses partial selection (argpartition), so only the k selected rows are sorted
+    instead of the whole frame. Rows with a missing metric rank last
     """
-    # Extract product data
-    products = data["products"]
+    values = frame[metric].to_numpy(dtype=np.float64)
+    
+    # Rank on a key where the best rows are the smallest and missing values the largest
+    keys = -values if largest else values.copy()
+    keys[np.isnan(keys)] = np.inf
+    
+    k = max(min(k, len(keys)), 0)
+    
+    if k == 0:
+        return frame.iloc[:0]
+    
+    candidates = np.argpartition(keys, k - 1)[:k] if k < len(keys) else np.arange(len(keys))
+    order = candidates[np.argsort(keys[candidates], kind="stable")]
+    
+    return frame.iloc[order]
+
+@dataset_cache()
+def get_product_metrics(data):
+    """
+    Products with their profit and profit margin, computed once per dataset
+    """
+    # Copied, as the shared dataset is read-only
+    products = data["products"].copy()
     
     # Calculate profitability metrics
     products["profit"] = products["revenue"] - products["cost"]
     products["profit_margin"] = (products["profit"] / products["revenue"]) * 100
     
-    # Sort by profit margin to identify top and bottom performers
-    top_performers = products.sort_values("profit_margin", ascending=False).head(10)
-    bottom_performers = products.sort_values("profit_margin", ascending=True).head(10)
+    return products
+
+@dataset_cache()
+def get_product_ranking(data, metric="profit_margin"):
+    """
+    Ranking index of the products by a metric, sorted once per dataset
+    Returns the row positions in ascending order (missing values last) and the
+    number of rows with a value
+    """
+    values = get_product_metrics(data)[metric].to_numpy(dtype=np.float64)
+    
+    return np.argsort(values, kind="stable"), int(np.count_nonzero(~np.isnan(values)))
+
+def rank_products(data, k=10, metric="profit_margin", bottom=False, use_index=False):
+    """
+    Top (or bottom, with bottom=True) k products by a metric
+    
+    By default the k products are picked by partial selection on every call.
+    With use_index=True they are sliced from the ranking index kept per dataset,
+    which pays for one full sort and then makes every lookup O(k)
+    """
+    products = get_product_metrics(data)
+    
+    if not use_index:
+        return select_top_k(products, k, metric, largest=not bottom)
     
+    order, n_ranked = get_product_ranking(data, metric)
+    
+    if bottom:
+        positions = order[:k]
+    else:
+        # Largest values first, missing values still last
+        positions = np.concatenate([order[:n_ranked][::-1], order[n_ranked:]])[:k]
+    
+    return products.iloc[positions]
+
+@dataset_cache()
+def get_product_performance(data):
+    """
+    Get product performance metrics
+    """
+    products = get_product_metrics(data)
+    
+    # Top and bottom performers by profit margin, without sorting every product
     return {
         "all_products": products,
-        "top_performers": top_performers,
-        "bottom_performers": bottom_performers
+        "top_performers": rank_products(data, k=10),
+        "bottom_performers": rank_products(data, k=10, bottom=True)
     }
 
+@dataset_cache()
 def get_geographic_performance(data):
     """
     Get performance metrics by geographic region
     """
-    # Extract geographic data
-    geo_data = data["geographic"]
+    # Extract geographic data (copied, as the shared dataset is read-only)
+    geo_data = data["geographic"].copy()
     
     # Calculate profitability metrics
     geo_data["profit"] = geo_data["revenue"] - geo_data["cost"]
@@ -109,45 +623,40 @@ def get_geographic_performance(data):
     
     return geo_performance
 
-def get_forecast_data(data):
-    """
-    Get forecast data for analysis
+def calculate_variances(actuals, forecast, keys=None):
     """
-    # Extract forecast data
-    forecast = data["forecast"]
+    Compare actual and forecast amounts for every key combination at once
     
-    # Calculate deviation from actual
-    actuals = data["financial_data"]["revenue"]
+    Both frames are summed by their key columns (by default whichever of period,
+    category and entity they share) and aligned on the resulting index, so the
+    comparison is one hash join instead of a lookup per row. Only combinations
+    present in both frames are returned.
+    """
+    if keys is None:
+        keys = [key for key in VARIANCE_KEYS if key in actuals.columns and key in forecast.columns]
     
-    # Get the most recent period
-    current_period = actuals["period"].max()
+    actual_amounts = sum_amounts(actuals["amount"], [actuals[key] for key in keys]).rename("actual")
+    forecast_amounts = sum_amounts(forecast["amount"], [forecast[key] for key in keys]).rename("forecast")
     
-    # Filter forecast for the current period
-    current_forecast = forecast[forecast["period"] == current_period]
-    current_actuals = actuals[actuals["period"] == current_period]
+    variances = actual_amounts.to_frame().join(forecast_amounts, how="inner")
     
-    # Calculate variances
-    variance_analysis = []
+    # Calculate variances; a zero forecast has no meaningful percentage
+    variances["variance"] = variances["actual"] - variances["forecast"]
+    variances["variance_pct"] = np.divide(
+        variances["variance"] * 100,
+        variances["forecast"],
+        out=np.zeros(len(variances)),
+        where=variances["forecast"].to_numpy() != 0
+    )
     
-    for _, forecast_row in current_forecast.iterrows():
-        category = forecast_row["category"]
-        forecast_amount = forecast_row["amount"]
-        
-        # Find the corresponding actual amount
-        actual_row = current_actuals[current_actuals["category"] == category]
-        
-        if not actual_row.empty:
-            actual_amount = actual_row["amount"].values[0]
-            variance = actual_amount - forecast_amount
-            variance_pct = (variance / forecast_amount) * 100 if forecast_amount != 0 else 0
-            
-            variance_analysis.append({
-                "category": category,
-                "forecast": forecast_amount,
-                "actual": actual_amount,
-                "variance": variance,
-                "variance_pct": variance_pct
-            })
-    
-    return pd.DataFrame(variance_analysis)
+    return variances.reset_index()
 
+@dataset_cache()
+def get_forecast_data(data):
+    """
+    Get forecast data for analysis: actual vs. forecast revenue and the variance
+    for every period, category and (when available) entity
+    """
+    actuals = data["financial_data"]["revenue"]
+    
+    return calculate_variances(actuals, data["forecast_lines"])
@@ -7,6 +7,8 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from utils.fx_translation import untranslatable_lines
+from utils.ledger_schema import LEDGER_DIMENSIONS, amount_values, format_period
 
 def get_data_quality_metrics(data):
     """
@@ -19,7 +21,8 @@ def get_data_quality_metrics(data):
     return {
         "overall_score": quality_metrics["overall_score"],
         "previous_score": quality_metrics["previous_score"],
-        "overall_score_change": quality_metrics["overall_score"] - quality_metrics["previous_score"],
+        "overall_score_change": quality_metrics["overall_score"] - quality_metrics["previous_score"]
+            if quality_metrics["previous_score"] is not None else None,
         "completeness": quality_metrics["completeness"],
         "accuracy": quality_metrics["accuracy"],
         "consistency": quality_metrics["consistency"],
@@ -120,3 +123,156 @@ def get_data_quality_by_department():
     
     return pd.DataFrame(dept_quality)
 
+def _quality_scores(ledger, z_threshold):
+    """
+    Completeness, accuracy, consistency, timeliness and overall scores of a ledger,
+    with the Z-Scores of its amounts within their account and its duplicated lines
+    """
+    n_rows = len(ledger)
+    
+    # Completeness: share of lines with every dimension and the amount filled in
+    complete_rows = ledger.notna().all(axis=1).sum()
+    completeness = round(complete_rows / n_rows * 100) if n_rows else 100
+    
+    # Accuracy: share of amounts that are not Z-Score outliers within their account
+    amounts = amount_values(ledger["Amount"])
+    by_account = amounts.groupby(ledger["Account"], observed=True)
+    z_scores = ((amounts - by_account.transform("mean")) / by_account.transform("std")).fillna(0)
+    outliers = z_scores.abs() > z_threshold
+    accuracy = round((1 - outliers.sum() / n_rows) * 100) if n_rows else 100
+    
+    # Consistency: share of lines whose dimension key is not duplicated
+    key_columns = [column for column in LEDGER_DIMENSIONS if column != "Currency"]
+    duplicated = ledger.duplicated(subset=key_columns, keep=False)
+    consistency = round((1 - duplicated.sum() / n_rows) * 100) if n_rows else 100
+    
+    # Timeliness: share of entities that reported the latest period
+    periods = sorted(ledger["Period"].dropna().unique())
+    entity_count = ledger["Entity_ID"].nunique()
+    
+    if periods and entity_count:
+        reporting_entities = ledger.loc[ledger["Period"] == periods[-1], "Entity_ID"].nunique()
+        timeliness = round(reporting_entities / entity_count * 100)
+    else:
+        timeliness = 100
+    
+    scores = {
+        "overall_score": round(np.mean([completeness, accuracy, consistency, timeliness])),
+        "completeness": completeness,
+        "accuracy": accuracy,
+        "consistency": consistency,
+        "timeliness": timeliness
+    }
+    
+    return scores, z_scores, duplicated
+
+def currency_translation_validation(ledger, fx_rates=None):
+    """
+    Validation result of the translation to the reporting currency: every ledger
+    line needs a positive rate in fx_rates for its period, currency and rate type.
+    Lines without one are left out of the translated ledger and reported here
+    Without an FX rate table, a ledger in more than one currency is flagged as untranslated
+    """
+    pairs = ledger[["Period", "Currency"]].dropna().drop_duplicates()
+    currencies = sorted(pairs["Currency"].unique())
+    
+    if fx_rates is None:
+        return {
+            "check": "Currency Translation",
+            "status": "Passed" if len(currencies) <= 1 else "Warning",
+            "description": f"Ledger amounts are in {', '.join(currencies)} and were not translated (no FX rate table)."
+        }
+    
+    # Lines without a valid rate are left out of the translated ledger
+    untranslated = untranslatable_lines(ledger, fx_rates)
+    missing = ledger.loc[untranslated, ["Period", "Currency"]].dropna().drop_duplicates()
+    foreign = [currency for currency in currencies if currency != fx_rates.reporting_currency]
+    
+    if untranslated.any():
+        return {
+            "check": "Currency Translation",
+            "status": "Failed",
+            "description": f"{untranslated.sum():,} lines left out of the translation to "
+                + f"{fx_rates.reporting_currency}, no valid FX rate for: "
+                + ", ".join(f"{format_period(row.Period)} {row.Currency}" for row in missing.itertuples())
+                + "."
+        }
+    
+    return {
+        "check": "Currency Translation",
+        "status": "Passed",
+        "description": f"{', '.join(foreign)} translated to {fx_rates.reporting_currency} at average and closing rates for every period."
+            if foreign else f"Ledger amounts are in the reporting currency {fx_rates.reporting_currency}."
+    }
+
+def assess_ledger_quality(ledger, z_threshold=3.0, max_anomalies=10, intercompany=None, fx_rates=None):
+    """
+    Assess the quality of a consolidation ledger
+    Scores are measured on the ledger itself and previous_score on its lines up to
+    the previous period (None for a single period); anomalies use Z-Score logic
+    within each account
+    With an intercompany matching result, its unmatched balances are validated too;
+    with the FX rates the ledger is translated with, so is the translation
+    """
+    scores, z_scores, duplicated = _quality_scores(ledger, z_threshold)
+    outliers = z_scores.abs() > z_threshold
+    
+    amounts = amount_values(ledger["Amount"])
+    by_account = amounts.groupby(ledger["Account"], observed=True)
+    periods = sorted(ledger["Period"].dropna().unique())
+    entity_count = ledger["Entity_ID"].nunique()
+    
+    # Trend: the overall score of the ledger as it stood at the previous period
+    if len(periods) > 1:
+        previous_score = _quality_scores(ledger[ledger["Period"] < periods[-1]], z_threshold)[0]["overall_score"]
+    else:
+        previous_score = None
+    
+    # Largest outliers become anomalies
+    anomalies = []
+    
+    for index in z_scores[outliers].abs().nlargest(max_anomalies).index:
+        row = ledger.loc[index]
+        z_score = z_scores.loc[index]
+        
+        anomalies.append({
+            "entity": f"{row['Entity_ID']} / {row['Account']}",
+            "field": "Amount",
+            "value": f"{amounts.loc[index]:,.0f} {row['Currency']}",
+            "expected": f"{by_account.mean()[row['Account']]:,.0f}",
+            "severity": "High" if abs(z_score) > 2 * z_threshold else "Medium",
+            "description": f"Amount is {z_score:.1f} standard deviations from the {row['Account']} mean ({format_period(row['Period'])}, {row['Product']})."
+        })
+    
+    # Validation checks that can be run on the ledger
+    revenue_lines = ledger[ledger["Account"] == "Revenue"]
+    revenue_pairs = revenue_lines.groupby(["Entity_ID", "Period"], observed=True).size()
+    revenue_complete = len(revenue_pairs) == entity_count * len(periods)
+    
+    validation_results = [
+        {
+            "check": "Revenue Completeness",
+            "status": "Passed" if revenue_complete else "Failed",
+            "description": "All entities report revenue for every period." if revenue_complete
+                else "Some entities are missing revenue for at least one period."
+        },
+        {
+            "check": "Duplicate Lines",
+            "status": "Passed" if not duplicated.any() else "Warning",
+            "description": f"{duplicated.sum()} lines share the same entity, account, period, cost center and product."
+        },
+        currency_translation_validation(ledger, fx_rates)
+    ]
+    
+    if intercompany is not None:
+        from utils.intercompany import intercompany_validation
+        validation_results.append(intercompany_validation(intercompany))
+    
+    return {
+        **scores,
+        "previous_score": previous_score,
+        "critical_issues": sum(result["status"] == "Failed" for result in validation_results),
+        "data_sources": ["Consolidation export"],
+        "anomalies": anomalies,
+        "validation_results": validation_results
+    }
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import copy
+import hashlib
+from functools import cached_property
+from utils.bitmap_index import BitmapIndex
+from utils.cache import value_fingerprint
+from utils.data_quality import assess_ledger_quality
+from utils.fx_translation import REPORTING_CURRENCY
+from utils.ledger_index import LedgerIndex
+from utils.ledger_schema import COST_ACCOUNTS, REVENUE_ACCOUNT, parse_periods, sum_amounts
+from utils.olap_cube import LedgerCube
+
+# Dict-style keys used by the dashboards, mapped to dataset members
+DATASET_KEYS = {
+    "financial_data": "financial_data",
+    "products": "products",
+    "geographic": "geographic",
+    "forecast": "forecast_assumptions",
+    "forecast_lines": "forecast_lines",
+    "data_quality": "data_quality",
+    "metrics": "metrics",
+    "credit_risk": "credit_risk"
+}
+
+# Members that depend on the reporting period, recomputed by at_period
+REPORTING_PERIOD_MEMBERS = ["fingerprint", "current_period", "previous_period", "metrics"]
+
+class shared_member(cached_property):
+    """
+    Memoized member that does not depend on the reporting period: at_period views
+    read it from the full dataset, so it is computed once and kept there
+    """
+    
+    def __get__(self, instance, owner=None):
+        if instance is not None and instance._base is not None:
+            return getattr(instance._base, self.attrname)
+        
+        return super().__get__(instance, owner)
+
+def comparison_period(periods):
+    """
+    Pick the period to compare the latest one with: the same quarter a year
+    earlier when available, otherwise the preceding period
+    Periods are quarterly pandas Periods in chronological order
+    """
+    current_period = periods[-1]
+    year_ago_period = current_period - 4  # Quarterly periods
+    
+    if year_ago_period in periods:
+        return year_ago_period
+    
+    return periods[-2] if len(periods) > 1 else current_period
+
+def calculate_key_metrics(revenue_df, cost_df, product_df, current_period, previous_period, ledger_index=None,
+                          fx_rates=None, translation_adjustment=None):
+    """
+    Calculate the headline metrics shown on the dashboards
+    With a ledger index, revenue and costs are summed from binary-search slices
+    of the ledger instead of masks over the revenue and cost tables; pass one
+    only when the tables were built from that ledger, so both give the same totals
+    The EUR/USD rate and the cumulative translation adjustment come from the FX
+    translation of the ledger (None without an FX rate table)
+    """
+    if ledger_index is not None:
+        current_revenue = ledger_index.sum(period=current_period, account=REVENUE_ACCOUNT)
+        previous_revenue = ledger_index.sum(period=previous_period, account=REVENUE_ACCOUNT)
+        
+        current_costs = ledger_index.sum(period=current_period, account=COST_ACCOUNTS)
+        previous_costs = ledger_index.sum(period=previous_period, account=COST_ACCOUNTS)
+    else:
+        current_revenue = sum_amounts(revenue_df.loc[revenue_df["period"] == current_period, "amount"])
+        previous_revenue = sum_amounts(revenue_df.loc[revenue_df["period"] == previous_period, "amount"])
+        
+        current_costs = sum_amounts(cost_df.loc[cost_df["period"] == current_period, "amount"])
+        previous_costs = sum_amounts(cost_df.loc[cost_df["period"] == previous_period, "amount"])
+    
+    current_ebitda = current_revenue - current_costs
+    previous_ebitda = previous_revenue - previous_costs
+    
+    fx_rate = fx_rates.cross_rate("EUR", "USD", current_period) if fx_rates is not None else None
+    
+    if translation_adjustment is not None:
+        current_adjustment = translation_adjustment[translation_adjustment["period"] == current_period]
+        cumulative_translation_adjustment = current_adjustment["cumulative_cta"].sum()
+    else:
+        cumulative_translation_adjustment = None
+    
+    return {
+        "revenue": current_revenue,
+        "previous_revenue": previous_revenue,
+        "ebitda": current_ebitda,
+        "previous_ebitda": previous_ebitda,
+        "yoy_revenue_growth": ((current_revenue - previous_revenue) / previous_revenue) * 100,
+        "ebitda_margin": (current_ebitda / current_revenue) * 100,
+        "previous_ebitda_margin": (previous_ebitda / previous_revenue) * 100,
+        "top_product": product_df.loc[product_df["profit_margin"].idxmax(), "name"],
+        "bottom_product": product_df.loc[product_df["profit_margin"].idxmin(), "name"],
+        "operating_cash_flow": current_ebitda * 0.8,  # Estimated as 80% of EBITDA
+        "previous_cash_flow": previous_ebitda * 0.8,
+        "net_income": current_ebitda * 0.65,  # Estimated as 65% of EBITDA
+        "previous_net_income": previous_ebitda * 0.65,
+        "tax_rate": 25.0,  # Assumed tax rate
+        "fx_rate": fx_rate,  # Average EUR/USD rate of the period
+        "cumulative_translation_adjustment": cumulative_translation_adjustment,
+        "market_conditions": "Moderate growth with inflationary pressure"
+    }
+
+class FinancialDataset:
+    """
+    Financial dataset shared by the dashboards
+    
+    Members:
+    - revenue, costs: DataFrames of amount by period and category
+    - products: DataFrame of product performance
+    - geographic: DataFrame of regional performance
+    - forecast_lines: DataFrame of forecast amount by period and category
+    - forecast_assumptions: dict with revenue_growth, ebitda_margin and roi
+    - data_quality: dict of quality scores, anomalies and validation results
+    - credit_risk: dict of sheet name to DataFrame
+    - ledger: consolidation ledger, in the reporting currency
+    - tables_from_ledger: True when revenue and costs were built from the ledger
+      (build_financial_data); only then are the metrics read from the ledger index
+    - fx_rates: FxRates the ledger was translated with (None if it was not translated)
+    - translation_adjustment: DataFrame of the CTA by period, entity and currency
+    - intercompany: intercompany matching result (eliminations, reconciliation and
+      residuals, see eliminate_intercompany); its eliminations are in the ledger
+    - ownership: OwnershipStructure of the group (direct and effective holdings, control)
+    - cube: pre-aggregated OLAP cube over the ledger (built on first access)
+    - ledger_index: binary-search lookup index over the sorted ledger
+    - bitmap_index: bitmap index of the ledger dimension values for multi-filter queries
+    
+    Derived members (metrics, profitability, product and geographic performance)
+    are computed on first access and memoized, so a page only pays for what it uses.
+    Dict-style access (data["metrics"]) is kept for the dashboards.
+    
+    fingerprint is a content hash of the dataset that every cache in the app keys on.
+    
+    at_period gives a view reported as of an earlier period (the sidebar's
+    Reporting Period). Views are kept per period on the full dataset and read
+    the tables and every period-independent member (cube, indexes, data quality,
+    credit risk, content hash) from it, so they are only computed once.
+    """
+    
+    def __init__(self, revenue, costs, products, geographic, forecast_lines=None,
+                 forecast_assumptions=None, data_quality=None, credit_risk=None, ledger=None, cube=None,
+                 fx_rates=None, translation_adjustment=None, intercompany=None, ownership=None,
+                 tables_from_ledger=False):
+        self.revenue = revenue
+        self.costs = costs
+        self.products = products
+        self.geographic = geographic
+        self.forecast_lines = forecast_lines
+        self.forecast_assumptions = forecast_assumptions or {}
+        self.ledger = ledger
+        self.tables_from_ledger = tables_from_ledger
+        self.fx_rates = fx_rates
+        self.translation_adjustment = translation_adjustment
+        self.intercompany = intercompany
+        self.ownership = ownership
+        self._cube = cube
+        self._reporting_period = None
+        
+        # Full dataset of an at_period view (None for the full dataset) and its views by period
+        self._base = None
+        self._period_views = {}
+        
+        # Either a value or a zero-argument callable that loads it on first access
+        self._data_quality_source = data_quality
+        self._credit_risk_source = credit_risk
+    
+    def __getitem__(self, key):
+        if key not in DATASET_KEYS:
+            raise KeyError(key)
+        
+        return getattr(self, DATASET_KEYS[key])
+    
+    def __contains__(self, key):
+        return key in DATASET_KEYS
+    
+    def keys(self):
+        return DATASET_KEYS.keys()
+    
+    def at_period(self, period):
+        """
+        View of the dataset reported as of period ("2023-Q2" label or Period):
+        metrics, defaults of the analyses and the comparison period follow it
+        The view of a period is built once and returned on every later call
+        """
+        if self._base is not None:
+            return self._base.at_period(period)
+        
+        period = parse_periods([str(period)])[0]
+        view = self._period_views.get(period)
+        
+        if view is not None:
+            return view
+        
+        if period not in self.periods:
+            raise ValueError(f"No data for reporting period {period}")
+        
+        view = copy.copy(self)
+        view.__dict__ = {
+            name: value for name, value in self.__dict__.items()
+            if name not in REPORTING_PERIOD_MEMBERS
+        }
+        view._base = self
+        view._reporting_period = period if period != self.periods[-1] else None
+        
+        return self._period_views.setdefault(period, view)
+    
+    def attach_credit_risk(self, credit_risk):
+        """
+        Attach credit risk data, or a zero-argument callable that loads it on first access
+        """
+        self._credit_risk_source = credit_risk
+        self.__dict__.pop("credit_risk", None)
+    
+    @property
+    def financial_data(self):
+        return {
+            "revenue": self.revenue,
+            "costs": self.costs
+        }
+    
+    @cached_property
+    def fingerprint(self):
+        """
+        Cache key of the dataset: its content hash, combined with the reporting
+        period of an at_period view
+        """
+        if self._reporting_period is None:
+            return self.content_fingerprint
+        
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.content_fingerprint.encode())
+        digest.update(str(self._reporting_period).encode())
+        
+        return digest.hexdigest()
+    
+    @shared_member
+    def content_fingerprint(self):
+        """
+        Stable content hash over the buffers of every column of the source tables
+        The credit risk workbook is keyed separately by its file content hash
+        """
+        members = [
+            self.revenue,
+            self.costs,
+            self.products,
+            self.geographic,
+            self.forecast_lines,
+            self.forecast_assumptions,
+            self.ledger,
+            self.translation_adjustment,
+            self.intercompany,
+            self.ownership
+        ]
+        
+        # Data quality derived from the ledger is already covered by the ledger
+        if not callable(self._data_quality_source):
+            members.append(self._data_quality_source)
+        
+        digest = hashlib.blake2b(digest_size=16)
+        
+        for member in members:
+            digest.update(value_fingerprint(member).encode())
+        
+        return digest.hexdigest()
+    
+    @property
+    def reporting_currency(self):
+        """
+        Currency the amounts are reported in
+        """
+        if self.fx_rates is not None:
+            return self.fx_rates.reporting_currency
+        
+        return REPORTING_CURRENCY
+    
+    @shared_member
+    def periods(self):
+        """
+        Reporting periods in chronological order
+        """
+        return sorted(self.revenue["period"].unique())
+    
+    @cached_property
+    def current_period(self):
+        if self._reporting_period is not None:
+            return self._reporting_period
+        
+        return self.periods[-1]
+    
+    @cached_property
+    def previous_period(self):
+        return comparison_period([period for period in self.periods if period <= self.current_period])
+    
+    @shared_member
+    def cube(self):
+        if self._cube is None and self.ledger is not None:
+            return LedgerCube(self.ledger)
+        
+        return self._cube
+    
+    @shared_member
+    def ledger_index(self):
+        if self.ledger is None:
+            return None
+        
+        return LedgerIndex(self.ledger)
+    
+    @shared_member
+    def bitmap_index(self):
+        if self.ledger is None:
+            return None
+        
+        return BitmapIndex(self.ledger)
+    
+    @shared_member
+    def data_quality(self):
+        source = self._data_quality_source
+        
+        if callable(source):
+            return source()
+        
+        if source is None and self.ledger is not None:
+            return assess_ledger_quality(self.ledger, intercompany=self.intercompany, fx_rates=self.fx_rates)
+        
+        return source
+    
+    @shared_member
+    def credit_risk(self):
+        source = self._credit_risk_source
+        
+        if callable(source):
+            return source()
+        
+        return source if source is not None else {}
+    
+    @cached_property
+    def metrics(self):
+        return calculate_key_metrics(
+            self.revenue,
+            self.costs,
+            self.products,
+            self.current_period,
+            self.previous_period,
+            self.ledger_index if self.tables_from_ledger else None,
+            self.fx_rates,
+            self.translation_adjustment
+        )
+    
+    # Derived views computed by data_processor, which builds datasets and so imports this module
+    @cached_property
+    def profitability(self):
+        from utils.data_processor import calculate_profitability
+        return calculate_profitability(self)
+    
+    @cached_property
+    def product_performance(self):
+        from utils.data_processor import get_product_performance
+        return get_product_performance(self)
+    
+    @cached_property
+    def geographic_performance(self):
+        from utils.data_processor import get_geographic_performance
+        return get_geographic_performance(self)
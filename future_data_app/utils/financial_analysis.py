@@ -6,157 +6,347 @@
 
 import pandas as pd
 import numpy as np
+from utils.cache import dataset_cache
+from utils.ledger_schema import COST_ACCOUNTS, PERIOD_DTYPE, PERIOD_FREQUENCY, REVENUE_ACCOUNT, encode_dimension, sum_amounts
+from utils.data_processor import calculate_variances, rank_products
 
-def calculate_yoy_performance(data):
+# Comparisons computed by default, as name: lag in quarters
+COMPARISON_LAGS = {"qoq": 1, "yoy": 4}
+
+# Actual vs. forecast variances beyond this percentage are explained and reported
+SIGNIFICANT_VARIANCE_PCT = 5
+
+# Revenue dimensions that come from the ledger rather than the revenue table
+LEDGER_COMPARISON_DIMENSIONS = ["Entity_ID", "Product", "Cost_Center"]
+
+def compare_periods(frame, dimension, lags=None, period_column="period", amount_column="amount"):
     """
-    Calculate year-over-year performance metrics
+    Compare every period with earlier periods for each member of a dimension
+    
+    Amounts are pivoted once into a period x member matrix over a gap-free range
+    of quarters, so a lag of n is a shift of n rows and every lag is computed for
+    all periods in one vectorized pass. Returns one row per period and member
+    with the amount and, for each lag name, previous_<name>, change_<name> and
+    percent_change_<name> (NaN where the earlier period has no amount)
     """
-    # Get revenue data for current and previous years
-    revenue_current = data["financial_data"]["revenue"]
+    lags = lags or COMPARISON_LAGS
+    matrix = sum_amounts(frame[amount_column], [frame[period_column], frame[dimension]]).unstack()
     
-    # Group by category and calculate totals
-    current_year = revenue_current[revenue_current["period"] == "2023-Q2"].groupby("category")["amount"].sum().reset_index()
-    previous_year = revenue_current[revenue_current["period"] == "2022-Q2"].groupby("category")["amount"].sum().reset_index()
+    columns = {
+        "period": pd.Categorical([], dtype=PERIOD_DTYPE),
+        dimension: matrix.columns[:0],
+        "amount": np.array([], dtype=np.float64)
+    }
     
-    # Merge current and previous year data
-    yoy_comparison = pd.merge(
-        current_year,
-        previous_year,
-        on="category",
-        suffixes=("_current", "_previous")
-    )
+    for name in lags:
+        for measure in ["previous", "change", "percent_change"]:
+            columns[f"{measure}_{name}"] = np.array([], dtype=np.float64)
     
-    # Calculate changes
-    yoy_comparison["change"] = yoy_comparison["amount_current"] - yoy_comparison["amount_previous"]
-    yoy_comparison["percent_change"] = (yoy_comparison["change"] / yoy_comparison["amount_previous"]) * 100
+    if matrix.empty:
+        return pd.DataFrame(columns)
     
-    # Rename columns for clarity
-    yoy_comparison = yoy_comparison.rename(columns={
-        "amount_current": "current_year",
-        "amount_previous": "previous_year"
-    })
+    # Gap-free quarterly index, so that shifting by n rows is going back n quarters
+    periods = pd.PeriodIndex(matrix.index)
+    matrix.index = periods
+    matrix = matrix.reindex(pd.period_range(periods.min(), periods.max(), freq=PERIOD_FREQUENCY))
     
-    return yoy_comparison
-
-def calculate_actual_vs_forecast(data):
-    """
-    Calculate actual vs forecast performance
-    """
-    # Get actual revenue data
-    actuals = data["financial_data"]["revenue"]
+    n_periods, n_members = matrix.shape
+    amounts = matrix.to_numpy(dtype=np.float64)
     
-    # Get the most recent period
-    current_period = "2023-Q2"
+    # Flatten period-major into one row per period and member
+    columns["period"] = encode_dimension(matrix.index.repeat(n_members), "Period")
+    columns[dimension] = matrix.columns.take(np.tile(np.arange(n_members), n_periods))
+    columns["amount"] = amounts.reshape(-1)
     
-    # Filter actuals for the current period
-    current_actuals = actuals[actuals["period"] == current_period].groupby("category")["amount"].sum().reset_index()
+    for name, lag in lags.items():
+        previous = np.full_like(amounts, np.nan)
+        previous[lag:] = amounts[:n_periods - lag]
+        change = amounts - previous
+        
+        columns[f"previous_{name}"] = previous.reshape(-1)
+        columns[f"change_{name}"] = change.reshape(-1)
+        columns[f"percent_change_{name}"] = np.divide(
+            change * 100,
+            previous,
+            out=np.full_like(change, np.nan),
+            where=(previous != 0) & ~np.isnan(previous)
+        ).reshape(-1)
     
-    # Create forecast data based on actuals with variance
-    np.random.seed(42)  # For reproducibility
-    current_forecast = current_actuals.copy()
-    # Add variation to create realistic forecast differences
-    current_forecast["amount"] = current_forecast["amount"] * np.random.uniform(0.9, 1.1, len(current_forecast))
+    comparison = pd.DataFrame(columns)
     
-    # Merge actual and forecast data
-    comparison = pd.merge(
-        current_actuals,
-        current_forecast,
-        on="category",
-        suffixes=("_actual", "_forecast")
-    )
+    # Periods that were only added to fill gaps have no amount
+    return comparison[comparison["amount"].notna()].reset_index(drop=True)
+
+@dataset_cache()
+def get_period_comparison(data, dimension="category", lags=None):
+    """
+    Revenue comparison of every period with earlier ones (QoQ and YoY by default)
+    for any dimension: category or entity of the revenue table, or Entity_ID,
+    Product or Cost_Center of the ledger. Cached, so period pickers only slice it
+    """
+    if dimension in LEDGER_COMPARISON_DIMENSIONS:
+        revenue_lines = data.cube.aggregate(["Period", dimension], {"Account": REVENUE_ACCOUNT})
+        
+        return compare_periods(revenue_lines, dimension, lags, period_column="Period")
     
-    # Calculate variances
-    comparison["variance"] = comparison["amount_actual"] - comparison["amount_forecast"]
-    comparison["variance_pct"] = (comparison["variance"] / comparison["amount_forecast"]) * 100
+    return compare_periods(data["financial_data"]["revenue"], dimension, lags)
+
+@dataset_cache()
+def calculate_yoy_performance(data, period=None, dimension="category"):
+    """
+    Calculate year-over-year performance metrics
+    Compares the given period (the latest one by default) with the same quarter a year earlier
+    """
+    comparison = get_period_comparison(data, dimension)
+    period = period if period is not None else data.current_period
+    
+    # Slice the period from the precomputed comparison; members without a year-ago amount are left out
+    selected = comparison[(comparison["period"] == period) & comparison["previous_yoy"].notna()]
     
     # Rename columns for clarity
-    comparison = comparison.rename(columns={
-        "amount_actual": "actual",
-        "amount_forecast": "forecast"
+    yoy_comparison = selected[[dimension, "amount", "previous_yoy", "change_yoy", "percent_change_yoy"]].rename(columns={
+        "amount": "current_year",
+        "previous_yoy": "previous_year",
+        "change_yoy": "change",
+        "percent_change_yoy": "percent_change"
     })
     
-    # Add explanation for significant variances
-    explanations = {
-        "Product A": "Higher than expected market demand and successful promotional campaign",
-        "Product B": "Supply chain disruptions delayed product release by 3 weeks",
-        "Product C": "Expected seasonality in line with forecast",
-        "Product D": "Price increases implemented ahead of schedule",
-        "Product E": "Competitor promotional activity impacted sales volumes",
-        "Services": "New service offering exceeded expectations with strong client adoption",
-        "Maintenance": "Contract renewals higher than forecast due to customer retention initiatives",
-        "Licensing": "Delay in new license release impacted revenue",
-        "Consulting": "Resource constraints limited project capacity"
-    }
+    return yoy_comparison.reset_index(drop=True)
+
+@dataset_cache()
+def calculate_actual_vs_forecast(data):
+    """
+    Calculate actual vs forecast performance
+    """
+    # Variances by category for the most recent period, from the shared variance engine
+    variances = calculate_variances(
+        data["financial_data"]["revenue"],
+        data["forecast_lines"],
+        keys=["period", "category"]
+    )
+    comparison = variances[variances["period"] == data.current_period].reset_index(drop=True)
     
-    # Ensure all categories have explanations using a default for missing ones
-    comparison["explanation"] = comparison["category"].apply(
-        lambda x: explanations.get(x, "Variance under investigation by finance team")
+    # Explain every significant variance by the entity that contributes most to it
+    by_entity = calculate_variances(
+        data["financial_data"]["revenue"],
+        data["forecast_lines"],
+        keys=["period", "category", "entity"]
     )
+    by_entity = by_entity[by_entity["period"] == data.current_period]
+    drivers = by_entity.loc[by_entity["variance"].abs().groupby(by_entity["category"], observed=True).idxmax()]
+    drivers = drivers.set_index("category")[["entity", "variance"]]
+    
+    explanations = []
+    for row in comparison.itertuples():
+        if abs(row.variance_pct) <= SIGNIFICANT_VARIANCE_PCT:
+            explanations.append("In line with forecast")
+        elif row.category in drivers.index:
+            driver = drivers.loc[row.category]
+            explanations.append(
+                f"{'Above' if row.variance > 0 else 'Below'} forecast by {abs(row.variance_pct):.1f}%, "
+                + f"largest entity variance: {driver['entity']} ({driver['variance']:+,.0f})"
+            )
+        else:
+            explanations.append(f"{'Above' if row.variance > 0 else 'Below'} forecast by {abs(row.variance_pct):.1f}%")
+    
+    comparison["explanation"] = explanations
     
     return comparison
 
-def identify_top_performers(data, top=5, reverse=False):
+@dataset_cache()
+def identify_top_performers(data, top=5, reverse=False, metric="profit_margin"):
     """
-    Identify top or bottom performing products based on profit margin
+    Identify top or bottom performing products based on profit margin (or another metric)
     """
-    # Get product data
-    products = data["products"].copy()
-    
-    # Sort by profit margin
-    if reverse:
-        # Bottom performers (ascending order)
-        performers = products.sort_values("profit_margin", ascending=True).head(top)
-    else:
-        # Top performers (descending order)
-        performers = products.sort_values("profit_margin", ascending=False).head(top)
-    
-    return performers
+    # Partial selection of the top (or, with reverse, bottom) products
+    return rank_products(data, k=top, metric=metric, bottom=reverse)
 
-def get_profitability_analysis(data):
+@dataset_cache()
+def get_profitability_analysis(data, second_axis="Entity_ID", period=None, filters=None, max_categories=20):
     """
     Generate profitability analysis data for visualization
+    
+    Profit margin by product category and region (entity), or cost center with
+    second_axis="Cost_Center", queried from the ledger cube: revenue and costs of
+    every (category, second axis) cell come from one aggregate and are placed on
+    a grid by their dictionary codes. Covers the latest period unless another
+    period is given; filters maps further ledger dimensions to the values to keep.
+    Only the max_categories categories with the most revenue are returned.
+    Cached per dataset and selection
     """
-    # Product categories and regions for the heatmap
-    categories = ["Hardware", "Software", "Services", "Cloud", "Consulting"]
-    regions = ["Europe", "North America", "Asia Pacific", "Latin America", "Middle East"]
+    if data.ledger is None:
+        return {"categories": [], "regions": [], "heatmap_data": np.empty((0, 0))}
+    
+    period = period if period is not None else data.current_period
+    
+    # Revenue and cost lines of the selection, one row per (category, second axis, account)
+    selection = dict(filters or {})
+    selection["Period"] = period
+    selection["Account"] = [REVENUE_ACCOUNT] + COST_ACCOUNTS
+    lines = data.cube.aggregate(["Product", second_axis, "Account"], selection)
+    
+    # One cell index per row: category code x second axis code
+    categories = lines["Product"].cat.categories
+    regions = lines[second_axis].cat.categories
+    cells = lines["Product"].cat.codes.to_numpy().astype(np.int64) * len(regions) + lines[second_axis].cat.codes.to_numpy()
+    
+    amounts = lines["amount"].to_numpy()
+    is_revenue = (lines["Account"] == REVENUE_ACCOUNT).to_numpy()
+    n_cells = len(categories) * len(regions)
     
-    # Create synthetic profitability data for the heatmap
-    # In a real scenario, this would be calculated from actual data
-    np.random.seed(42)  # For reproducibility
+    revenue = np.bincount(cells[is_revenue], weights=amounts[is_revenue], minlength=n_cells)
+    cost = np.bincount(cells[~is_revenue], weights=amounts[~is_revenue], minlength=n_cells)
     
-    # Generate a heatmap matrix of profit margins
-    heatmap_data = np.random.normal(loc=15, scale=5, size=(len(categories), len(regions)))
+    revenue = revenue.reshape(len(categories), len(regions))
+    cost = cost.reshape(len(categories), len(regions))
     
-    # Adjust some values to create interesting patterns
-    heatmap_data[0, 0] = 22  # High profitability for Hardware in Europe
-    heatmap_data[2, 1] = 25  # High profitability for Services in North America
-    heatmap_data[3, 2] = 26  # High profitability for Cloud in Asia Pacific
-    heatmap_data[1, 3] = 8   # Low profitability for Software in Latin America
-    heatmap_data[4, 4] = 7   # Low profitability for Consulting in Middle East
+    # Keep the categories with the most revenue and the regions that have any line
+    category_revenue = revenue.sum(axis=1)
+    category_rows = np.flatnonzero((category_revenue != 0) | (cost.sum(axis=1) != 0))
+    
+    if len(category_rows) > max_categories:
+        top = np.argpartition(-category_revenue[category_rows], max_categories - 1)[:max_categories]
+        category_rows = category_rows[top]
+    
+    category_rows = category_rows[np.argsort(-category_revenue[category_rows], kind="stable")]
+    region_columns = np.flatnonzero((revenue != 0).any(axis=0) | (cost != 0).any(axis=0))
+    
+    revenue = revenue[np.ix_(category_rows, region_columns)]
+    cost = cost[np.ix_(category_rows, region_columns)]
+    
+    heatmap_data = np.divide(
+        (revenue - cost) * 100,
+        revenue,
+        out=np.full(revenue.shape, np.nan),
+        where=revenue != 0
+    )
     
     return {
-        "categories": categories,
-        "regions": regions,
-        "heatmap_data": heatmap_data
+        "categories": [str(category) for category in categories[category_rows]],
+        "regions": [str(region) for region in regions[region_columns]],
+        "heatmap_data": heatmap_data,
+        "revenue": revenue,
+        "cost": cost
     }
 
-def analyze_product_margin_drivers(data, product_id):
+@dataset_cache()
+def calculate_margin_bridge(data, lag=1):
+    """
+    Price/volume/mix bridge of gross profit for every product and period
+    
+    The change in each product's gross profit against the period lag quarters
+    earlier is split into:
+    - volume_effect: change in total revenue at the earlier mix and margin
+    - mix_effect: change in the product's share of revenue at the earlier margin
+    - price_effect: change in the product's margin rate on current revenue
+      (the ledger has no quantities, so price is measured as margin rate), plus
+      the change in costs booked without revenue: a product with no revenue in
+      a period has no margin rate, so its profit there is its cost alone
+    The three effects add up to profit_change, also for products without revenue
+    in one or both periods. Revenue and cost of every
+    (period, product) cell come from one query on the ledger cube and all
+    effects are computed on period x product matrices, so the whole bridge is
+    one vectorized pass. Cached, so per-product views are lookups
+    """
+    ledger = data.ledger
+    columns = [
+        "period", "product", "revenue", "previous_revenue", "gross_profit", "previous_gross_profit",
+        "margin", "previous_margin", "profit_change", "volume_effect", "mix_effect", "price_effect"
+    ]
+    
+    if ledger is None or ledger.empty:
+        return pd.DataFrame(columns=columns)
+    
+    lines = data.cube.aggregate(["Period", "Product", "Account"], {"Account": [REVENUE_ACCOUNT] + COST_ACCOUNTS})
+    
+    # Period codes index a gap-free range of quarters, so code arithmetic is quarter arithmetic
+    period_codes = lines["Period"].cat.codes.to_numpy().astype(np.int64)
+    product_codes = lines["Product"].cat.codes.to_numpy()
+    first_period = period_codes.min()
+    n_periods = period_codes.max() - first_period + 1
+    n_products = len(lines["Product"].cat.categories)
+    
+    cells = (period_codes - first_period) * n_products + product_codes
+    amounts = lines["amount"].to_numpy()
+    signs = np.where(lines["Account"] == REVENUE_ACCOUNT, 1.0, -1.0)
+    
+    revenue = np.bincount(cells, weights=amounts * (signs > 0), minlength=n_periods * n_products)
+    profit = np.bincount(cells, weights=amounts * signs, minlength=n_periods * n_products)
+    revenue = revenue.reshape(n_periods, n_products)
+    profit = profit.reshape(n_periods, n_products)
+    
+    observed_periods = np.bincount(period_codes - first_period, minlength=n_periods) > 0
+    
+    # Margin rate and revenue share; products without revenue have a zero margin and
+    # their profit (costs only) is kept apart, as it does not scale with revenue
+    margin = np.divide(profit, revenue, out=np.zeros_like(profit), where=revenue != 0)
+    cost_only_profit = np.where(revenue != 0, 0.0, profit)
+    total_revenue = revenue.sum(axis=1, keepdims=True)
+    share = np.divide(revenue, total_revenue, out=np.zeros_like(revenue), where=total_revenue != 0)
+    
+    # Values of the comparison period, aligned on the current period rows
+    def shifted(values):
+        earlier = np.full_like(values, np.nan)
+        earlier[lag:] = values[:n_periods - lag]
+        return earlier
+    
+    previous_revenue = shifted(revenue)
+    previous_profit = shifted(profit)
+    previous_margin = shifted(margin)
+    previous_share = shifted(share)
+    previous_total = shifted(total_revenue)
+    
+    volume_effect = (total_revenue - previous_total) * previous_share * previous_margin
+    mix_effect = (share - previous_share) * total_revenue * previous_margin
+    price_effect = revenue * (margin - previous_margin) + cost_only_profit - shifted(cost_only_profit)
+    
+    # Keep periods whose comparison period is in the data, and products with lines in either
+    comparable = observed_periods & (shifted(observed_periods.astype(np.float64)) == 1)
+    period_rows, product_columns = np.nonzero(
+        comparable[:, None] & ((revenue != 0) | (profit != 0) | (previous_revenue != 0) | (previous_profit != 0))
+    )
+    
+    def cells_of(values):
+        return values[period_rows, product_columns]
+    
+    return pd.DataFrame({
+        "period": pd.Categorical.from_codes(period_rows + first_period, dtype=lines["Period"].dtype),
+        "product": pd.Categorical.from_codes(product_columns, dtype=lines["Product"].dtype),
+        "revenue": cells_of(revenue),
+        "previous_revenue": cells_of(previous_revenue),
+        "gross_profit": cells_of(profit),
+        "previous_gross_profit": cells_of(previous_profit),
+        "margin": cells_of(margin) * 100,
+        "previous_margin": cells_of(previous_margin) * 100,
+        "profit_change": cells_of(profit - previous_profit),
+        "volume_effect": cells_of(volume_effect),
+        "mix_effect": cells_of(mix_effect),
+        "price_effect": cells_of(price_effect)
+    })
+
+@dataset_cache()
+def analyze_product_margin_drivers(data, product, period=None):
     """
     Analyze drivers of product margin performance
+    Looks the product (a value of the ledger's Product dimension, as in the
+    products table's name) up in the cached price/volume/mix bridge (latest
+    period by default); impacts are gross profit changes against the previous quarter
     """
-    # Get product data
-    product = data["products"][data["products"]["id"] == product_id].iloc[0]
+    bridge = calculate_margin_bridge(data)
+    period = period if period is not None else data.current_period
+    
+    row = bridge[(bridge["period"] == period) & (bridge["product"] == product)]
+    
+    if row.empty:
+        return pd.DataFrame(columns=["name", "impact", "controllable"])
+    
+    row = row.iloc[0]
     
     # Define drivers of margin performance
     drivers = [
-        {"name": "Raw Materials", "impact": -2.5, "controllable": "Medium"},
-        {"name": "Labor Cost", "impact": -1.2, "controllable": "Medium"},
-        {"name": "Pricing Strategy", "impact": 3.8, "controllable": "High"},
-        {"name": "Volume/Scale", "impact": 1.5, "controllable": "Medium"},
-        {"name": "Product Mix", "impact": 2.2, "controllable": "High"},
-        {"name": "Operational Efficiency", "impact": 0.8, "controllable": "High"},
-        {"name": "Currency Effects", "impact": -0.6, "controllable": "Low"}
+        {"name": "Volume/Scale", "impact": row["volume_effect"], "controllable": "Medium"},
+        {"name": "Product Mix", "impact": row["mix_effect"], "controllable": "High"},
+        {"name": "Pricing Strategy", "impact": row["price_effect"], "controllable": "High"}
     ]
     
     return pd.DataFrame(drivers)
-
@@ -7,8 +7,11 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from utils.cache import dataset_cache
+from utils.ledger_schema import format_period, parse_periods
 from utils.openai_helper import generate_forecast_recommendations
 
+@dataset_cache()
 def generate_forecast_data(data, forecast_period, growth_override=None, margin_override=None):
     """
     Generate forecast data for the dashboard
@@ -51,19 +54,9 @@ def generate_forecast_data(data, forecast_period, growth_override=None, margin_o
         "net_income": historical_net_income
     }
     
-    # Generate forecast periods
-    last_period = historical_periods[-1]
-    year = int(last_period.split("-")[0])
-    quarter = int(last_period.split("-Q")[1])
-    
-    forecast_period_list = []
-    
-    for i in range(forecast_periods):
-        quarter = quarter + 1
-        if quarter > 4:
-            quarter = 1
-            year += 1
-        forecast_period_list.append(f"{year}-Q{quarter}")
+    # Generate forecast periods by quarterly period arithmetic
+    last_period = parse_periods(historical_periods[-1:])[0]
+    forecast_period_list = [format_period(last_period + i + 1) for i in range(forecast_periods)]
     
     # Use provided growth rate or default to the one in data
     growth_rate = growth_override if growth_override is not None else data["forecast"]["revenue_growth"]
@@ -142,9 +135,11 @@ def generate_forecast_data(data, forecast_period, growth_override=None, margin_o
         "forecast": forecast_data
     }
 
-def calculate_impact_scenarios(data, price_change=0, volume_change=0, cost_change=0, fx_rate=1.10, tax_rate=25):
+@dataset_cache()
+def calculate_impact_scenarios(data, price_change=0, volume_change=0, cost_change=0, fx_rate=None, tax_rate=25):
     """
     Calculate impact of parameter changes on financial projections
+    fx_rate is the EUR/USD rate to simulate, against the rate of the period
     """
     # Base financial metrics
     base_revenue = data["metrics"]["revenue"]
@@ -164,9 +159,13 @@ def calculate_impact_scenarios(data, price_change=0, volume_change=0, cost_chang
     # Cost impact: direct effect on EBITDA and net income
     cost_impact = -(base_revenue * (cost_change / 100))
     
-    # FX impact: calculated based on international exposure
+    # FX impact: calculated based on international exposure (none without an FX rate table)
     international_exposure = base_revenue * 0.40  # Assume 40% international exposure
-    fx_impact = international_exposure * ((fx_rate - base_fx_rate) / base_fx_rate)
+    
+    if fx_rate is not None and base_fx_rate:
+        fx_impact = international_exposure * ((fx_rate - base_fx_rate) / base_fx_rate)
+    else:
+        fx_impact = 0.0
     
     # Tax impact: affects only net income
     tax_impact = -((base_ebitda + price_impact + volume_impact + cost_impact) * (tax_rate - base_tax_rate) / 100)
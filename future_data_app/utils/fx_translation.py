@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import numpy as np
+import pandas as pd
+from utils.ledger_schema import PERIOD_CATEGORIES, PERIOD_FREQUENCY, dimension_dtype, encode_dimension, format_period
+
+# Currency every amount is translated to before consolidation
+REPORTING_CURRENCY = os.environ.get("REPORTING_CURRENCY", "EUR")
+
+# Symbols used to label amounts on the dashboards
+CURRENCY_SYMBOLS = {"EUR": "€", "GBP": "£", "USD": "$"}
+
+# Balance sheet accounts are translated at the closing rate, every other
+# (income statement) account at the average rate of the period
+CLOSING_RATE_ACCOUNTS = ["Assets", "Liabilities", "Equity"]
+
+# Columns of an FX rate table: units of the reporting currency per unit of Currency
+FX_RATE_COLUMNS = ["Period", "Currency", "Average_Rate", "Closing_Rate"]
+
+def currency_symbol(currency):
+    """
+    Symbol of a currency, or its code when it has none
+    """
+    return CURRENCY_SYMBOLS.get(currency, f"{currency} ")
+
+class FxRates:
+    """
+    Average and closing rates to the reporting currency by period and currency
+    
+    Rates are held in one (rate type x period x currency) array indexed by the
+    shared dictionary codes, so the rate of every ledger row is a single gather
+    on its Period and Currency codes. Rates are quoted as units of the reporting
+    currency per unit of the foreign currency; the reporting currency itself is 1.
+    """
+    
+    def __init__(self, rates, reporting_currency=REPORTING_CURRENCY):
+        self.reporting_currency = reporting_currency
+        
+        period_codes = encode_dimension(rates["Period"], "Period").codes
+        currency_codes = encode_dimension(rates["Currency"], "Currency").codes
+        reporting_code = encode_dimension([reporting_currency], "Currency").codes[0]
+        
+        self.currencies = dimension_dtype("Currency").categories
+        self.rates = np.full((2, len(PERIOD_CATEGORIES), len(self.currencies)), np.nan)
+        self.rates[0, period_codes, currency_codes] = rates["Average_Rate"].to_numpy(dtype=np.float64)
+        self.rates[1, period_codes, currency_codes] = rates["Closing_Rate"].to_numpy(dtype=np.float64)
+        self.rates[:, :, reporting_code] = 1.0
+    
+    def lookup(self, period_codes, currency_codes, closing):
+        """
+        Rate of every row given its Period and Currency codes, the closing rate
+        where closing is True and the average rate elsewhere (NaN when missing)
+        """
+        n_periods, n_currencies = self.rates.shape[1:]
+        
+        # Currencies added to the dictionary after the table was built have no rate
+        known = (period_codes >= 0) & (currency_codes >= 0) & (currency_codes < n_currencies)
+        cells = (
+            np.asarray(closing, dtype=np.int64) * (n_periods * n_currencies)
+            + period_codes.astype(np.int64) * n_currencies
+            + currency_codes
+        )
+        
+        return np.where(known, self.rates.reshape(-1)[np.where(known, cells, 0)], np.nan)
+    
+    def rate(self, period, currency, kind="average"):
+        """
+        Rate of one currency in one period ("2023-Q2" label or Period)
+        """
+        period_codes = encode_dimension([str(period)], "Period").codes
+        currency_codes = self.currencies.get_indexer([currency])
+        
+        return float(self.lookup(period_codes, currency_codes, kind == "closing")[0])
+    
+    def cross_rate(self, base, quote, period, kind="average"):
+        """
+        Units of quote per unit of base in a period, e.g. cross_rate("EUR", "USD", p)
+        for the EUR/USD rate
+        """
+        return self.rate(period, base, kind) / self.rate(period, quote, kind)
+
+def read_fx_rates(path, reporting_currency=REPORTING_CURRENCY):
+    """
+    Read an FX rate table export (Period, Currency, Average_Rate, Closing_Rate)
+    """
+    rates = pd.read_csv(
+        path,
+        usecols=FX_RATE_COLUMNS,
+        dtype={"Period": "category", "Currency": "category", "Average_Rate": "float64", "Closing_Rate": "float64"}
+    )
+    
+    return FxRates(rates, reporting_currency)
+
+def _closing_rate_lines(ledger):
+    """
+    Boolean mask of the ledger lines translated at the closing rate
+    """
+    accounts = ledger["Account"].cat.categories
+    
+    return np.isin(ledger["Account"].cat.codes.to_numpy(), accounts.get_indexer(CLOSING_RATE_ACCOUNTS))
+
+def _line_rates(ledger, fx_rates):
+    """
+    Rate of every ledger line, from one vectorized lookup on its Period and Currency codes
+    """
+    period_codes = ledger["Period"].cat.codes.to_numpy()
+    currency_codes = ledger["Currency"].cat.codes.to_numpy()
+    
+    return fx_rates.lookup(period_codes, currency_codes, _closing_rate_lines(ledger))
+
+def untranslatable_lines(ledger, fx_rates):
+    """
+    Boolean mask of the ledger lines without a valid (positive) rate for their
+    period, currency and rate type
+    """
+    return ~(_line_rates(ledger, fx_rates) > 0)
+
+def translate_ledger(ledger, fx_rates, drop_missing=False):
+    """
+    Translate the ledger amounts to the reporting currency
+    Every row's rate comes from one vectorized lookup on its Period and Currency
+    codes. Amount keeps its representation (int64 minor units are rounded to the
+    nearest minor unit); Currency keeps the currency the line was booked in
+    Lines without a valid rate raise a ValueError, or with drop_missing are left
+    out of the translated ledger (see untranslatable_lines to report them)
+    """
+    rates = _line_rates(ledger, fx_rates)
+    missing = ~(rates > 0)
+    
+    if missing.any():
+        if not drop_missing:
+            pairs = pd.DataFrame({"Period": ledger["Period"][missing], "Currency": ledger["Currency"][missing]}).drop_duplicates()
+            raise ValueError(
+                "No FX rate for: "
+                + ", ".join(f"{format_period(row.Period)} {row.Currency}" for row in pairs.itertuples() if pd.notna(row.Period))
+            )
+        
+        ledger = ledger[~missing].reset_index(drop=True)
+        rates = rates[~missing]
+    
+    amounts = ledger["Amount"].to_numpy()
+    translated = amounts * rates
+    
+    if np.issubdtype(amounts.dtype, np.integer):
+        translated = np.rint(translated).astype(amounts.dtype)
+    
+    translated_ledger = ledger.copy(deep=False)
+    translated_ledger["Amount"] = translated
+    
+    return translated_ledger
+
+def calculate_translation_adjustment(ledger, fx_rates):
+    """
+    Cumulative translation adjustment (CTA) of every entity and currency
+    
+    Under the current rate method the balance sheet is translated at the closing
+    rate and the income statement at the average rate. The difference goes to
+    the CTA, and each quarter it moves by:
+    - the opening net assets (assets less liabilities) times the change in the closing rate
+    - the net income times the difference between the closing and the average rate
+    Net assets and net income are summed per entity, currency and period in one
+    grouped pass over the local-currency ledger. Movements are computed for every
+    series at once on (series x period) matrices and accumulated from the first
+    period. Amounts are in the reporting currency, net_assets and net_income in
+    the local currency
+    """
+    from utils.olap_cube import LedgerCube
+    
+    columns = ["period", "entity", "currency", "net_assets", "net_income", "average_rate", "closing_rate", "cta", "cumulative_cta"]
+    lines = LedgerCube(ledger).aggregate(
+        ["Entity_ID", "Currency", "Period", "Account"],
+        {"Account": ["Assets", "Liabilities", "Net Income"]}
+    )
+    
+    if lines.empty:
+        return pd.DataFrame(columns=columns)
+    
+    # Net assets and net income per (entity, currency) series and period
+    sign = np.select([lines["Account"] == "Liabilities"], [-1.0], 1.0)
+    measure = np.where(lines["Account"] == "Net Income", "net_income", "net_assets")
+    matrix = (
+        pd.DataFrame({
+            "entity": lines["Entity_ID"].astype(str),
+            "currency": lines["Currency"].astype(str),
+            "period": pd.PeriodIndex(lines["Period"]),
+            "measure": measure,
+            "amount": lines["amount"].to_numpy() * sign
+        })
+        .groupby(["measure", "entity", "currency", "period"])["amount"].sum()
+        .unstack("period")
+    )
+    
+    # Gap-free quarters, so the previous column is the previous quarter
+    periods = pd.period_range(matrix.columns.min(), matrix.columns.max(), freq=PERIOD_FREQUENCY)
+    series = matrix.index.droplevel("measure").unique()
+    net_assets = matrix.reindex(pd.MultiIndex.from_tuples([("net_assets",) + key for key in series]), columns=periods).fillna(0).to_numpy()
+    net_income = matrix.reindex(pd.MultiIndex.from_tuples([("net_income",) + key for key in series]), columns=periods).fillna(0).to_numpy()
+    
+    # Rates of every (series, period) cell in one lookup
+    period_codes = np.tile(encode_dimension(periods, "Period").codes, len(series))
+    currency_codes = np.repeat(fx_rates.currencies.get_indexer(series.get_level_values(1)), len(periods))
+    average = fx_rates.lookup(period_codes, currency_codes, False).reshape(len(series), len(periods))
+    closing = fx_rates.lookup(period_codes, currency_codes, True).reshape(len(series), len(periods))
+    
+    # Opening net assets and closing rate: the previous quarter's (none before the first)
+    opening_net_assets = np.zeros_like(net_assets)
+    opening_net_assets[:, 1:] = net_assets[:, :-1]
+    opening_closing = closing.copy()
+    opening_closing[:, 1:] = closing[:, :-1]
+    
+    movement = opening_net_assets * (closing - opening_closing) + net_income * (closing - average)
+    
+    return pd.DataFrame({
+        "period": encode_dimension(np.tile(periods, len(series)), "Period"),
+        "entity": series.get_level_values(0).repeat(len(periods)),
+        "currency": series.get_level_values(1).repeat(len(periods)),
+        "net_assets": net_assets.reshape(-1),
+        "net_income": net_income.reshape(-1),
+        "average_rate": average.reshape(-1),
+        "closing_rate": closing.reshape(-1),
+        "cta": movement.reshape(-1),
+        "cumulative_cta": np.cumsum(movement, axis=1).reshape(-1)
+    })
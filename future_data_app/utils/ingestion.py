@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import json
+import shutil
+import hashlib
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
+from utils.intercompany import INTERCOMPANY_COLUMNS, normalize_intercompany_lines
+from utils.ledger_schema import (
+    LEDGER_DIMENSIONS,
+    LEDGER_COLUMNS,
+    dimension_dtype,
+    encode_amounts,
+    encode_dimension,
+    normalize_ledger,
+    sort_ledger,
+    to_storage_frame
+)
+
+# Explicit dtypes so that pandas never has to infer types or build object columns
+LEDGER_CSV_DTYPES = {column: "category" for column in LEDGER_DIMENSIONS}
+LEDGER_CSV_DTYPES["Amount"] = "float64"
+INTERCOMPANY_CSV_DTYPES = dict(LEDGER_CSV_DTYPES, Counterparty="category")
+
+# Rows parsed per chunk; bounds the memory used by the CSV tokenizer
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+# Columnar copies of parsed exports, keyed by the content hash of the source file
+LEDGER_CACHE_DIR = os.environ.get(
+    "LEDGER_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "ledgers")
+)
+
+# Bump when the parsed ledger layout changes so that older cache files are ignored
+LEDGER_CACHE_FORMAT = 4
+
+# Bump when the cached workbook layout (sheet files and manifest) changes
+WORKBOOK_CACHE_FORMAT = 1
+
+# Bytes read at a time when hashing a source file
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Text columns of a workbook with at most this share of distinct values are stored as categoricals
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+
+# Content hashes already computed in this process, keyed by (path, size, mtime)
+_content_hashes = {}
+
+def read_consolidation_csv(path, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Read a consolidation CSV export into a typed ledger DataFrame
+    
+    The file is streamed in chunks with explicit dtypes: dimension columns are
+    parsed as categoricals, encoded against the shared ledger dictionaries and only
+    their integer codes are kept between chunks, Amount is parsed as float64 and
+    converted to int64 minor units at the end (see ledger_schema.encode_amounts).
+    Peak memory is one chunk plus the compact ledger
+    """
+    codes = {column: [] for column in LEDGER_DIMENSIONS}
+    amounts = []
+    
+    chunks = pd.read_csv(
+        path,
+        usecols=LEDGER_COLUMNS,
+        dtype=LEDGER_CSV_DTYPES,
+        chunksize=chunksize
+    )
+    
+    for chunk in chunks:
+        for column in LEDGER_DIMENSIONS:
+            codes[column].append(encode_dimension(chunk[column], column).codes)
+        
+        amounts.append(chunk["Amount"].to_numpy(dtype=np.float64))
+    
+    # Assemble the ledger in export column order; shared dictionaries only grow
+    # by appending, so codes from earlier chunks are valid in the final dictionary
+    ledger = {}
+    
+    for column in LEDGER_COLUMNS:
+        if column == "Amount":
+            ledger[column] = encode_amounts(np.concatenate(amounts) if amounts else np.array([], dtype=np.float64))
+        else:
+            column_codes = np.concatenate(codes[column]) if codes[column] else np.array([], dtype=np.int16)
+            ledger[column] = pd.Categorical.from_codes(column_codes, dtype=dimension_dtype(column))
+    
+    return pd.DataFrame(ledger)
+
+def read_intercompany_csv(path):
+    """
+    Read an intercompany export (the ledger columns plus the Counterparty entity)
+    into canonical intercompany lines
+    """
+    lines = pd.read_csv(path, usecols=INTERCOMPANY_COLUMNS, dtype=INTERCOMPANY_CSV_DTYPES)
+    
+    return normalize_intercompany_lines(lines)
+
+def file_content_hash(path):
+    """
+    Hash the content of a file with BLAKE2b
+    The hash is remembered per process until the file's size or modification time changes
+    """
+    file_stat = os.stat(path)
+    memo_key = (os.path.abspath(path), file_stat.st_size, file_stat.st_mtime_ns)
+    
+    if memo_key not in _content_hashes:
+        digest = hashlib.blake2b(digest_size=20)
+        
+        with open(path, "rb") as source:
+            for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        
+        _content_hashes[memo_key] = digest.hexdigest()
+    
+    return _content_hashes[memo_key]
+
+def write_ledger_cache(ledger, cache_path):
+    """
+    Write a ledger as an uncompressed Arrow IPC (Feather) file so that it can be memory-mapped
+    """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    
+    # Write to a temporary file first so that concurrent workers never see a partial file
+    # One record batch keeps every column contiguous, which lets reads avoid copying it
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    feather.write_feather(
+        ledger,
+        temporary_path,
+        compression="uncompressed",
+        chunksize=max(len(ledger), 1)
+    )
+    os.replace(temporary_path, cache_path)
+
+def read_ledger_cache(cache_path):
+    """
+    Memory-map a cached ledger
+    Amount stays backed by the page cache instead of being copied onto the heap
+    """
+    table = feather.read_table(cache_path, memory_map=True)
+    
+    return table.to_pandas(split_blocks=True)
+
+def load_consolidation_ledger(path, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Load a consolidation CSV export through the columnar cache
+    The CSV is only parsed the first time its content is seen; later loads memory-map the cache
+    and re-encode the dimensions against the shared dictionaries (only their codes are touched)
+    Rows are cached in ledger sort order, so sorting the loaded ledger is a no-op
+    """
+    cache_name = f"{file_content_hash(path)}-v{LEDGER_CACHE_FORMAT}.feather"
+    cache_path = os.path.join(LEDGER_CACHE_DIR, cache_name)
+    
+    if not os.path.exists(cache_path):
+        write_ledger_cache(to_storage_frame(sort_ledger(read_consolidation_csv(path, chunksize))), cache_path)
+    
+    # Always hand out the memory-mapped copy so the parsed one can be freed
+    return normalize_ledger(read_ledger_cache(cache_path))
+
+def _read_worksheet(path, sheet_name):
+    """
+    Parse one worksheet in openpyxl's read-only streaming mode
+    The first row holds the column names
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        
+        if header is None:
+            return pd.DataFrame()
+        
+        columns = [
+            str(name) if name is not None else f"column_{i + 1}"
+            for i, name in enumerate(header)
+        ]
+        
+        sheet = pd.DataFrame.from_records(rows, columns=columns)
+    finally:
+        workbook.close()
+    
+    # Let pandas pick numeric dtypes, then dictionary-encode repetitive text columns
+    sheet = sheet.infer_objects()
+    
+    for column in sheet.columns:
+        values = sheet[column]
+        
+        if not pd.api.types.is_numeric_dtype(values) and values.nunique() <= len(values) * CATEGORICAL_MAX_UNIQUE_RATIO:
+            sheet[column] = values.astype("category")
+    
+    return sheet
+
+def read_excel_workbook(path, max_workers=None):
+    """
+    Read every worksheet of an .xlsx workbook, one worker process per sheet
+    Returns a dict of sheet name to DataFrame, in workbook order
+    Workers are spawned rather than forked: the app runs inside Streamlit's
+    multi-threaded server, which a forked child would copy mid-flight
+    """
+    workbook = load_workbook(path, read_only=True)
+    sheet_names = workbook.sheetnames
+    workbook.close()
+    
+    # openpyxl parsing is pure Python, so sheets are spread over processes rather than threads
+    if len(sheet_names) > 1 and max_workers != 1:
+        workers = min(len(sheet_names), max_workers or os.cpu_count() or 1)
+        
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            sheets = list(executor.map(_read_worksheet, [path] * len(sheet_names), sheet_names))
+    else:
+        sheets = [_read_worksheet(path, sheet_name) for sheet_name in sheet_names]
+    
+    return dict(zip(sheet_names, sheets))
+
+def load_excel_workbook(path, max_workers=None):
+    """
+    Load an .xlsx workbook through the columnar cache
+    The workbook is only parsed the first time its content is seen; later loads
+    memory-map one cached file per sheet
+    """
+    cache_dir = os.path.join(LEDGER_CACHE_DIR, f"{file_content_hash(path)}-sheets-v{WORKBOOK_CACHE_FORMAT}")
+    manifest_path = os.path.join(cache_dir, "sheets.json")
+    
+    if not os.path.exists(manifest_path):
+        sheets = read_excel_workbook(path, max_workers)
+        
+        # Build the cache in a temporary directory and move it into place in one step
+        temporary_dir = f"{cache_dir}.{os.getpid()}.tmp"
+        
+        for i, sheet in enumerate(sheets.values()):
+            write_ledger_cache(sheet, os.path.join(temporary_dir, f"sheet_{i}.feather"))
+        
+        with open(os.path.join(temporary_dir, "sheets.json"), "w") as manifest:
+            json.dump(list(sheets), manifest)
+        
+        try:
+            os.rename(temporary_dir, cache_dir)
+        except OSError:
+            # Another worker cached the same workbook first
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+    
+    with open(manifest_path) as manifest:
+        sheet_names = json.load(manifest)
+    
+    return {
+        sheet_name: read_ledger_cache(os.path.join(cache_dir, f"sheet_{i}.feather"))
+        for i, sheet_name in enumerate(sheet_names)
+    }
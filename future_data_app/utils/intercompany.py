@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import numpy as np
+import pandas as pd
+from utils.ledger_schema import (
+    LEDGER_COLUMNS,
+    PERIOD_DTYPE,
+    amount_values,
+    conform_ledger,
+    dimension_dtype,
+    encode_dimension,
+    normalize_ledger,
+    sort_ledger
+)
+
+# Columns of an intercompany export: ledger lines with the entity each line was booked against
+INTERCOMPANY_COLUMNS = LEDGER_COLUMNS + ["Counterparty"]
+
+# Seller-side account of each intercompany pair and the buyer-side account it is
+# matched against: receivables are booked to Assets and payables to Liabilities
+INTERCOMPANY_ACCOUNT_PAIRS = {"Assets": "Liabilities", "Revenue": "COGS"}
+
+# Largest difference between the two sides of a balance that is still eliminated, in currency units
+INTERCOMPANY_TOLERANCE = float(os.environ.get("INTERCOMPANY_TOLERANCE", 5.0))
+
+def normalize_intercompany_lines(lines, fixed_point=None):
+    """
+    Convert intercompany lines to the canonical ledger schema plus Counterparty,
+    which is encoded against the entity dictionary so that it compares with Entity_ID
+    """
+    normalized = normalize_ledger(lines, fixed_point)
+    normalized["Counterparty"] = encode_dimension(lines["Counterparty"], "Entity_ID")
+    
+    return normalized
+
+def book_intercompany_lines(ledger, lines):
+    """
+    Ledger with intercompany lines booked in, as the entities submit it: every
+    line is added to the ledger balance it belongs to (same entity, account,
+    period, cost center, product and currency) or opens a new one; lines with a
+    missing dimension are kept, for the data quality checks to report
+    Returned in ledger sort order
+    """
+    # Both on the current dictionaries, so the categoricals concatenate as categoricals
+    booked = pd.concat([conform_ledger(ledger), conform_ledger(lines[LEDGER_COLUMNS])], ignore_index=True)
+    dimensions = [column for column in LEDGER_COLUMNS if column != "Amount"]
+    
+    balances = booked.groupby(dimensions, observed=True, sort=False, dropna=False)["Amount"].sum().reset_index()
+    
+    return sort_ledger(balances[LEDGER_COLUMNS])
+
+def _matching_keys(lines):
+    """
+    Matching key of every line, packed into one int64: (seller, buyer, account pair,
+    period, currency). Seller-side lines are keyed on (entity, counterparty) and
+    buyer-side lines on (counterparty, entity), so both sides of a balance share a key
+    Returns the keys, the side of each line (0 seller, 1 buyer, -1 not matchable)
+    and the size of each packed field
+    """
+    accounts = lines["Account"].cat.categories
+    
+    # Account pair and side by account code; the extra last slot is for missing accounts (code -1)
+    pair_of = np.zeros(len(accounts) + 1, dtype=np.int64)
+    side_of = np.full(len(accounts) + 1, -1, dtype=np.int64)
+    
+    for pair, (seller_account, buyer_account) in enumerate(INTERCOMPANY_ACCOUNT_PAIRS.items()):
+        for side, account in enumerate([seller_account, buyer_account]):
+            code = accounts.get_indexer([account])[0]
+            
+            if code >= 0:
+                pair_of[code] = pair
+                side_of[code] = side
+    
+    account_codes = lines["Account"].cat.codes.to_numpy()
+    entity = lines["Entity_ID"].cat.codes.to_numpy().astype(np.int64)
+    counterparty = lines["Counterparty"].cat.codes.to_numpy().astype(np.int64)
+    period = lines["Period"].cat.codes.to_numpy().astype(np.int64)
+    currency = lines["Currency"].cat.codes.to_numpy().astype(np.int64)
+    side = side_of[account_codes]
+    
+    # Lines with a missing key or booked against their own entity cannot be matched
+    side[(entity < 0) | (counterparty < 0) | (period < 0) | (currency < 0) | (entity == counterparty)] = -1
+    
+    seller = np.where(side == 0, entity, counterparty)
+    buyer = np.where(side == 0, counterparty, entity)
+    
+    n_entities = max(len(lines["Entity_ID"].cat.categories), len(lines["Counterparty"].cat.categories))
+    sizes = [n_entities, n_entities, len(INTERCOMPANY_ACCOUNT_PAIRS), len(PERIOD_DTYPE.categories), len(lines["Currency"].cat.categories)]
+    
+    keys = np.zeros(len(lines), dtype=np.int64)
+    
+    for field, size in zip([seller, buyer, pair_of[account_codes], period, currency], sizes):
+        keys = keys * size + np.maximum(field, 0)
+    
+    return keys, side, sizes
+
+def eliminate_intercompany(lines, tolerance=INTERCOMPANY_TOLERANCE):
+    """
+    Match intercompany balances and build their elimination entries
+    
+    Receivables are matched with the counterparty's payables and revenue with its
+    COGS on (seller, buyer, account pair, period, currency). Both sides are hashed
+    into one table in a single pass over the lines (a hash join of the seller and
+    buyer lines on the key) and summed per key, so millions of lines match in
+    seconds. A balance is eliminated when both sides exist and differ by at most
+    tolerance (currency units); its elimination entries reverse every line of
+    both sides, in the ledger schema, ready to be added to the ledger. Anything
+    else is left in the consolidation and reported as a residual.
+    
+    Returns a dict:
+    - eliminations: elimination entries (ledger lines with the amounts reversed)
+    - reconciliation: one row per balance with both sides, the difference and a
+      status (Matched, Difference or Missing Counterpart)
+    - residuals: the reconciliation rows that were not eliminated
+    """
+    keys, side, sizes = _matching_keys(lines)
+    matchable = side >= 0
+    amounts = lines["Amount"].to_numpy()
+    
+    # Build and probe in one hash table: every line gets the slot of its balance
+    slots, balance_keys = pd.factorize(keys[matchable])
+    n_balances = len(balance_keys)
+    is_seller = side[matchable] == 0
+    matchable_amounts = amounts[matchable]
+    
+    sides = []
+    
+    for side_mask in [is_seller, ~is_seller]:
+        counts = np.bincount(slots[side_mask], minlength=n_balances)
+        sums = np.bincount(slots[side_mask], weights=matchable_amounts[side_mask], minlength=n_balances)
+        
+        # Minor-unit sums are exact in the bincount below 2**53 minor units
+        if np.issubdtype(amounts.dtype, np.integer):
+            sums = np.rint(sums).astype(amounts.dtype)
+        
+        sides.append((counts > 0, sums))
+    
+    (has_seller, seller_amount), (has_buyer, buyer_amount) = sides
+    difference = amount_values(pd.Series(seller_amount - buyer_amount)).to_numpy()
+    status = np.select(
+        [~(has_seller & has_buyer), np.abs(difference) <= tolerance],
+        ["Missing Counterpart", "Matched"],
+        "Difference"
+    )
+    
+    # Elimination entries: every line of a matched balance, reversed
+    eliminated = np.zeros(len(lines), dtype=bool)
+    eliminated[matchable] = (status == "Matched")[slots]
+    eliminations = lines.loc[eliminated, LEDGER_COLUMNS].reset_index(drop=True)
+    eliminations["Amount"] = -eliminations["Amount"].to_numpy()
+    
+    # Reconciliation in key order
+    order = np.argsort(balance_keys, kind="stable")
+    seller, buyer, pair, period, currency = np.unravel_index(balance_keys[order], sizes)
+    seller_accounts = pd.Index(list(INTERCOMPANY_ACCOUNT_PAIRS))
+    buyer_accounts = pd.Index(list(INTERCOMPANY_ACCOUNT_PAIRS.values()))
+    
+    reconciliation = pd.DataFrame({
+        "seller": pd.Categorical.from_codes(seller, dtype=dimension_dtype("Entity_ID")),
+        "buyer": pd.Categorical.from_codes(buyer, dtype=dimension_dtype("Entity_ID")),
+        "account": seller_accounts.take(pair),
+        "counter_account": buyer_accounts.take(pair),
+        "period": pd.Categorical.from_codes(period, dtype=PERIOD_DTYPE),
+        "currency": pd.Categorical.from_codes(currency, dtype=dimension_dtype("Currency")),
+        "seller_amount": amount_values(pd.Series(seller_amount[order])).to_numpy(),
+        "buyer_amount": amount_values(pd.Series(buyer_amount[order])).to_numpy(),
+        "difference": difference[order],
+        "status": status[order]
+    })
+    
+    return {
+        "eliminations": eliminations,
+        "reconciliation": reconciliation,
+        "residuals": reconciliation[reconciliation["status"] != "Matched"].reset_index(drop=True)
+    }
+
+def apply_eliminations(ledger, intercompany):
+    """
+    Add the elimination entries of eliminate_intercompany to a ledger, in ledger sort order
+    """
+    eliminations = intercompany["eliminations"]
+    
+    if eliminations.empty:
+        return sort_ledger(ledger)
+    
+    # Both on the current dictionaries, so the categoricals concatenate as categoricals
+    combined = pd.concat([conform_ledger(ledger), conform_ledger(eliminations)], ignore_index=True)
+    
+    return sort_ledger(combined)
+
+def intercompany_validation(intercompany):
+    """
+    Intercompany Eliminations validation check of an eliminate_intercompany result
+    """
+    reconciliation = intercompany["reconciliation"]
+    residuals = intercompany["residuals"]
+    
+    if residuals.empty:
+        return {
+            "check": "Intercompany Eliminations",
+            "status": "Passed",
+            "description": f"All {len(reconciliation)} intercompany balances matched and eliminated."
+        }
+    
+    missing = (residuals["status"] == "Missing Counterpart").sum()
+    
+    return {
+        "check": "Intercompany Eliminations",
+        "status": "Failed",
+        "description": (
+            f"{len(residuals)} of {len(reconciliation)} intercompany balances not eliminated "
+            f"({missing} without a counterpart booking); unmatched residuals total "
+            f"{residuals['difference'].abs().sum():,.0f}."
+        )
+    }
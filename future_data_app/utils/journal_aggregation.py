@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from utils.ingestion import (
+    DEFAULT_CHUNK_SIZE,
+    LEDGER_CACHE_DIR,
+    LEDGER_CACHE_FORMAT,
+    LEDGER_CSV_DTYPES,
+    file_content_hash,
+    read_ledger_cache,
+    write_ledger_cache
+)
+from utils.ledger_schema import (
+    FIXED_POINT_AMOUNTS,
+    LEDGER_COLUMNS,
+    LEDGER_DIMENSIONS,
+    dimension_dtype,
+    encode_dimension,
+    normalize_ledger,
+    sort_ledger,
+    to_minor_units,
+    to_storage_frame
+)
+
+# Bytes of partial aggregates held in memory before they are spilled to disk
+JOURNAL_MEMORY_BUDGET = int(os.environ.get("JOURNAL_MEMORY_BUDGET", 512 * 1024 * 1024))
+
+# Hash partitions partial aggregates are spilled into; each is rolled up on its own
+SPILL_PARTITIONS = 16
+
+# Directory spill files are written to (removed once the roll-up is done)
+SPILL_DIR = os.environ.get("SPILL_DIR", os.path.join(LEDGER_CACHE_DIR, "spill"))
+
+# Levels of re-partitioning before a partition is rolled up in memory whatever its size
+MAX_SPILL_LEVELS = 4
+
+# Columnar formats read in record batches, by file extension
+COLUMNAR_FORMATS = {".parquet": "parquet", ".pq": "parquet", ".feather": "ipc", ".arrow": "ipc", ".ipc": "ipc"}
+
+# Bytes per partial aggregate row: int32 codes of the dimensions and the amount,
+# doubled for the hash table of the roll-up
+AGGREGATE_ROW_BYTES = 2 * (4 * len(LEDGER_DIMENSIONS) + 8)
+
+def _rollup(codes, amounts):
+    """
+    Sum amounts by the combination of dimension codes (a hash aggregation)
+    codes is a (dimension x row) int32 array; returns the rolled-up codes and amounts
+    """
+    if amounts.size == 0:
+        return codes, amounts
+    
+    # Pack the codes into one int64 key over the codes present (-1, missing, included)
+    lows = codes.min(axis=1).astype(np.int64)
+    sizes = codes.max(axis=1).astype(np.int64) - lows + 1
+    keys = np.zeros(amounts.size, dtype=np.int64)
+    
+    for dimension_codes, low, size in zip(codes, lows, sizes):
+        keys = keys * size + (dimension_codes - low)
+    
+    grouped = pd.Series(amounts).groupby(keys, sort=False).sum()
+    unpacked = np.unravel_index(grouped.index.to_numpy(), sizes)
+    
+    return np.stack(unpacked).astype(np.int32) + lows[:, None].astype(np.int32), grouped.to_numpy()
+
+def _partition_of(codes, n_partitions, level):
+    """
+    Hash partition of every row; each level hashes with another seed so that a
+    partition that is spilled again splits further
+    """
+    hashes = np.full(codes.shape[1], 0x9E3779B97F4A7C15 + level, dtype=np.uint64)
+    
+    with np.errstate(over="ignore"):
+        for dimension_codes in codes:
+            hashes = (hashes ^ dimension_codes.astype(np.uint64)) * np.uint64(0x100000001B3)
+    
+    return (hashes >> np.uint64(32)) % np.uint64(n_partitions)
+
+class SpillingAggregator:
+    """
+    Hash aggregation of ledger lines to the ledger grain in bounded memory
+    
+    Batches of (codes, amounts) are rolled up as they arrive and the partial
+    aggregates are kept in memory. When they pass the memory budget they are
+    rolled up together once more; if that does not bring them under half the
+    budget (too many distinct keys), they are hash-partitioned by key into spill
+    files and memory is released. Every key lands in the same partition each
+    time, so each partition is then rolled up on its own, itself within the
+    budget, re-partitioned with a new hash seed when it is still too large.
+    """
+    
+    def __init__(self, memory_budget=JOURNAL_MEMORY_BUDGET, spill_dir=None, n_partitions=SPILL_PARTITIONS, level=0):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.n_partitions = n_partitions
+        self.level = level
+        
+        self._codes = []
+        self._amounts = []
+        self._rows = 0
+        self._writers = None
+        self.spilled_rows = 0
+    
+    def add(self, codes, amounts):
+        """
+        Add a batch of lines: a (dimension x row) code array and the amounts
+        """
+        codes, amounts = _rollup(codes, amounts)
+        self._codes.append(codes)
+        self._amounts.append(amounts)
+        self._rows += amounts.size
+        
+        if self._rows * AGGREGATE_ROW_BYTES > self.memory_budget:
+            self._compact()
+            
+            if self._rows * AGGREGATE_ROW_BYTES > self.memory_budget / 2 and self.level < MAX_SPILL_LEVELS:
+                self._spill()
+    
+    def _compact(self):
+        codes, amounts = _rollup(np.concatenate(self._codes, axis=1), np.concatenate(self._amounts))
+        self._codes, self._amounts, self._rows = [codes], [amounts], amounts.size
+    
+    def _spill(self):
+        """
+        Append the partial aggregates to the spill file of their hash partition
+        """
+        if self._writers is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._directory = tempfile.mkdtemp(prefix=f"level{self.level}-", dir=self.spill_dir)
+            self._paths = [os.path.join(self._directory, f"partition_{i}.arrow") for i in range(self.n_partitions)]
+            self._sinks = [pa.OSFile(path, "wb") for path in self._paths]
+            self._writers = []
+        
+        codes = np.concatenate(self._codes, axis=1)
+        amounts = np.concatenate(self._amounts)
+        partitions = _partition_of(codes, self.n_partitions, self.level)
+        
+        for i, path in enumerate(self._paths):
+            rows = partitions == i
+            batch = pa.record_batch(
+                [pa.array(dimension_codes[rows]) for dimension_codes in codes] + [pa.array(amounts[rows])],
+                names=LEDGER_DIMENSIONS + ["Amount"]
+            )
+            
+            if i == len(self._writers):
+                self._writers.append(pa.ipc.new_stream(self._sinks[i], batch.schema))
+            
+            self._writers[i].write_batch(batch)
+        
+        self.spilled_rows += amounts.size
+        self._codes, self._amounts, self._rows = [], [], 0
+    
+    def results(self):
+        """
+        Rolled-up (codes, amounts) blocks; together they hold every key exactly once
+        """
+        if self._writers is None:
+            if self._codes:
+                self._compact()
+                yield self._codes[0], self._amounts[0]
+            
+            return
+        
+        if self._codes:
+            self._spill()
+        
+        for writer, sink in zip(self._writers, self._sinks):
+            writer.close()
+            sink.close()
+        
+        try:
+            for path in self._paths:
+                partition = SpillingAggregator(self.memory_budget, self.spill_dir, self.n_partitions, self.level + 1)
+                
+                with pa.OSFile(path, "rb") as source:
+                    for batch in pa.ipc.open_stream(source):
+                        columns = [batch.column(i).to_numpy() for i in range(batch.num_columns)]
+                        partition.add(np.stack(columns[:-1]), columns[-1])
+                
+                yield from partition.results()
+                self.spilled_rows += partition.spilled_rows
+        finally:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+def _journal_batches(path, chunksize):
+    """
+    Chunks of a journal export as DataFrames of the ledger columns: CSV read in
+    chunks with the loader's dtypes, Parquet and Feather in record batches
+    """
+    file_format = COLUMNAR_FORMATS.get(os.path.splitext(path)[1].lower())
+    
+    if file_format is None:
+        yield from pd.read_csv(path, usecols=LEDGER_COLUMNS, dtype=LEDGER_CSV_DTYPES, chunksize=chunksize)
+        return
+    
+    dataset = ds.dataset(path, format=file_format)
+    
+    for batch in dataset.to_batches(columns=LEDGER_COLUMNS, batch_size=chunksize):
+        yield batch.to_pandas()
+
+def aggregate_journal(path, memory_budget=JOURNAL_MEMORY_BUDGET, chunksize=DEFAULT_CHUNK_SIZE, spill_dir=SPILL_DIR):
+    """
+    Roll journal lines up to the ledger grain (one line per combination of the
+    ledger dimensions) with a streaming hash aggregation
+    
+    The export is read one chunk at a time; each chunk is dictionary-encoded
+    against the shared dictionaries and rolled up into a SpillingAggregator,
+    which spills partial aggregates to disk past memory_budget bytes. Peak memory
+    is one chunk plus the budget (plus the rolled-up ledger), whatever the
+    number of journal lines. Amounts are summed in minor units (see
+    ledger_schema.FIXED_POINT_AMOUNTS); missing amounts count as zero.
+    Returns a ledger in the loader's schema and sort order
+    """
+    aggregator = SpillingAggregator(memory_budget, spill_dir)
+    
+    for chunk in _journal_batches(path, chunksize):
+        codes = np.stack([encode_dimension(chunk[column], column).codes.astype(np.int32) for column in LEDGER_DIMENSIONS])
+        amounts = np.nan_to_num(chunk["Amount"].to_numpy(dtype=np.float64))
+        aggregator.add(codes, to_minor_units(amounts) if FIXED_POINT_AMOUNTS else amounts)
+    
+    blocks = list(aggregator.results())
+    codes = np.concatenate([block[0] for block in blocks], axis=1) if blocks else np.zeros((len(LEDGER_DIMENSIONS), 0), dtype=np.int32)
+    amounts = np.concatenate([block[1] for block in blocks]) if blocks else np.zeros(0, dtype=np.int64 if FIXED_POINT_AMOUNTS else np.float64)
+    
+    ledger = {}
+    
+    for column in LEDGER_COLUMNS:
+        if column == "Amount":
+            ledger[column] = amounts
+        else:
+            ledger[column] = pd.Categorical.from_codes(codes[LEDGER_DIMENSIONS.index(column)], dtype=dimension_dtype(column))
+    
+    return sort_ledger(pd.DataFrame(ledger))
+
+def load_journal_ledger(path, memory_budget=JOURNAL_MEMORY_BUDGET, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Load a journal export rolled up to the ledger grain through the columnar cache
+    (see ingestion.load_consolidation_ledger); the journal is only aggregated the
+    first time its content is seen
+    """
+    cache_name = f"{file_content_hash(path)}-v{LEDGER_CACHE_FORMAT}-journal.feather"
+    cache_path = os.path.join(LEDGER_CACHE_DIR, cache_name)
+    
+    if not os.path.exists(cache_path):
+        write_ledger_cache(to_storage_frame(aggregate_journal(path, memory_budget, chunksize)), cache_path)
+    
+    return normalize_ledger(read_ledger_cache(cache_path))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import numpy as np
+import pandas as pd
+from utils.ledger_schema import LEDGER_SORT_KEYS, parse_periods, sum_amounts
+
+class LedgerIndex:
+    """
+    Lookup index over a ledger in LEDGER_SORT_KEYS order (see sort_ledger)
+    
+    The ledger is sorted by entity, period and account codes, so every selection
+    on those keys is a set of contiguous row ranges found by binary search:
+    one range for an entity or an entity-period, one range per entity for a
+    period. Selections never scan the rows and return views of the ledger
+    columns rather than masked copies.
+    
+    Selections take the key values as keyword arguments (a value or a list of
+    values, None for all): entity, period, account
+    """
+    
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.codes = {column: ledger[column].cat.codes.to_numpy() for column in LEDGER_SORT_KEYS}
+        self.categories = {column: ledger[column].cat.categories for column in LEDGER_SORT_KEYS}
+    
+    def _wanted_codes(self, column, values):
+        """
+        Sorted codes of the selected values of a key (values not in the ledger are ignored)
+        """
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        
+        if column == "Period":
+            wanted = self.categories[column].get_indexer(parse_periods([str(value) for value in values]))
+        else:
+            wanted = self.categories[column].get_indexer(list(values))
+        
+        return np.unique(wanted[wanted >= 0])
+    
+    def row_ranges(self, entity=None, period=None, account=None):
+        """
+        (start, stop) row ranges of the selection, in row order
+        """
+        selection = [entity, period, account]
+        ranges = [(0, len(self.ledger))]
+        
+        # Only split down to the deepest key that is selected on
+        depth = max((level + 1 for level, values in enumerate(selection) if values is not None), default=0)
+        
+        for column, values in zip(LEDGER_SORT_KEYS[:depth], selection):
+            codes = self.codes[column]
+            wanted = self._wanted_codes(column, values) if values is not None else None
+            refined = []
+            
+            for start, stop in ranges:
+                if start == stop:
+                    continue
+                
+                # Within a range of the previous keys this key is sorted; the keys
+                # take the code dtype so that searchsorted does not cast the block
+                block = codes[start:stop]
+                keys = wanted if wanted is not None else np.arange(block[0], block[-1] + 1)
+                keys = keys.astype(block.dtype)
+                lefts = start + np.searchsorted(block, keys, side="left")
+                rights = start + np.searchsorted(block, keys, side="right")
+                found = lefts < rights
+                
+                refined.extend(zip(lefts[found].tolist(), rights[found].tolist()))
+            
+            ranges = refined
+        
+        # Merge ranges that touch, e.g. consecutive periods of an entity
+        merged = []
+        
+        for start, stop in ranges:
+            if merged and merged[-1][1] == start:
+                merged[-1] = (merged[-1][0], stop)
+            else:
+                merged.append((start, stop))
+        
+        return merged
+    
+    def select(self, entity=None, period=None, account=None):
+        """
+        Ledger rows of the selection (a slice when the selection is one range)
+        """
+        ranges = self.row_ranges(entity, period, account)
+        
+        if len(ranges) == 1:
+            return self.ledger.iloc[ranges[0][0]:ranges[0][1]]
+        
+        rows = np.concatenate([np.arange(start, stop) for start, stop in ranges]) if ranges else []
+        
+        return self.ledger.iloc[rows]
+    
+    def sum(self, entity=None, period=None, account=None):
+        """
+        Total amount of the selection in currency units, summed slice by slice
+        """
+        amounts = self.ledger["Amount"].to_numpy()
+        partials = pd.Series(
+            [amounts[start:stop].sum() for start, stop in self.row_ranges(entity, period, account)],
+            dtype=amounts.dtype
+        )
+        
+        return sum_amounts(partials)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# Columns of the canonical ledger (the consolidation export schema)
+LEDGER_DIMENSIONS = ["Entity_ID", "Account", "Period", "Cost_Center", "Product", "Currency"]
+LEDGER_COLUMNS = ["Entity_ID", "Account", "Period", "Cost_Center", "Product", "Amount", "Currency"]
+
+# Ledger accounts feeding the revenue and cost views of the dashboards
+REVENUE_ACCOUNT = "Revenue"
+COST_ACCOUNTS = ["COGS", "Operating Expenses"]
+
+# Physical row order of a ledger (by dictionary code): the rows of an entity, of an
+# entity-period and of an entity-period-account are contiguous ranges
+LEDGER_SORT_KEYS = ["Entity_ID", "Period", "Account"]
+
+# Quarterly periods, calendar-year quarters
+PERIOD_FREQUENCY = "Q-DEC"
+
+# Periods are encoded against one fixed, ordered range of quarters, so every
+# ledger shares the same codes and sorting by code is sorting by time
+PERIOD_CATEGORIES = pd.period_range("2000Q1", "2049Q4", freq=PERIOD_FREQUENCY)
+PERIOD_DTYPE = pd.CategoricalDtype(PERIOD_CATEGORIES, ordered=True)
+
+# Amounts are held as int64 minor units (cents) unless disabled: integer sums are
+# exact, so totals do not depend on summation order, partitioning or parallelism
+AMOUNT_MINOR_UNITS = 100
+FIXED_POINT_AMOUNTS = os.environ.get("FIXED_POINT_AMOUNTS", "1") != "0"
+
+# Shared dictionaries of the other dimensions, seeded with the values of the
+# consolidation export. They only ever grow by appending, so the codes of a
+# value never change and ledgers loaded from different files stay compatible
+_shared_dictionaries = {
+    "Entity_ID": pd.Index(["ParentCo", "Subsidiary A", "Subsidiary B", "Subsidiary C"], dtype=object),
+    "Account": pd.Index(["Revenue", "COGS", "Operating Expenses", "Net Income", "Assets", "Liabilities", "Equity"], dtype=object),
+    "Cost_Center": pd.Index(["Sales", "Marketing", "R&D", "Finance", "Operations"], dtype=object),
+    "Product": pd.Index(["Product A", "Product B", "Product C", "Service X", "Service Y"], dtype=object),
+    "Currency": pd.Index(["EUR", "GBP", "USD"], dtype=object)
+}
+_dictionary_lock = threading.Lock()
+
+def parse_periods(labels):
+    """
+    Parse "2023-Q2" style labels into a quarterly PeriodIndex
+    """
+    labels = pd.Index(labels).astype(str).str.replace("-", "", regex=False)
+    
+    return pd.PeriodIndex(labels, freq=PERIOD_FREQUENCY)
+
+def format_period(period):
+    """
+    Format a quarterly period as a "2023-Q2" style label
+    """
+    return f"{period.year}-Q{period.quarter}"
+
+def dimension_dtype(column):
+    """
+    Current shared categorical dtype of a ledger dimension
+    """
+    if column == "Period":
+        return PERIOD_DTYPE
+    
+    return pd.CategoricalDtype(_shared_dictionaries[column])
+
+def _encode_categories(categories, column):
+    """
+    Map the categories of a categorical onto the shared dictionary of a dimension
+    Unseen values are appended to the dictionary
+    """
+    if column == "Period":
+        if not isinstance(categories, pd.PeriodIndex):
+            categories = parse_periods(categories)
+        
+        mapping = PERIOD_CATEGORIES.get_indexer(categories)
+        
+        if (mapping < 0).any():
+            raise ValueError(f"Periods outside {PERIOD_CATEGORIES[0]}-{PERIOD_CATEGORIES[-1]}: {list(categories[mapping < 0])}")
+        
+        return mapping, PERIOD_DTYPE
+    
+    categories = pd.Index(categories, dtype=object)
+    
+    with _dictionary_lock:
+        dictionary = _shared_dictionaries[column]
+        new_values = categories.difference(dictionary, sort=False)
+        
+        if len(new_values) > 0:
+            dictionary = dictionary.append(new_values).astype(object)
+            _shared_dictionaries[column] = dictionary
+    
+    return dictionary.get_indexer(categories), pd.CategoricalDtype(dictionary)
+
+def encode_dimension(values, column):
+    """
+    Dictionary-encode the values of a ledger dimension against its shared dictionary
+    Only the distinct values are looked up; rows are re-coded with one take
+    """
+    values = pd.Categorical(values)
+    mapping, dtype = _encode_categories(values.categories, column)
+    
+    # Missing values keep code -1
+    codes = np.where(values.codes >= 0, mapping[values.codes], -1)
+    
+    return pd.Categorical.from_codes(codes, dtype=dtype)
+
+def to_minor_units(amounts):
+    """
+    Convert amounts in currency units to int64 minor units, rounding to the nearest cent
+    """
+    return np.rint(np.asarray(amounts, dtype=np.float64) * AMOUNT_MINOR_UNITS).astype(np.int64)
+
+def amount_values(amounts):
+    """
+    Amounts in currency units, for display and ratios
+    Integer amounts are minor units; float amounts are returned unchanged
+    """
+    if pd.api.types.is_integer_dtype(amounts.dtype):
+        return amounts / AMOUNT_MINOR_UNITS
+    
+    return amounts
+
+def encode_amounts(amounts, fixed_point=None):
+    """
+    Convert ledger amounts to their canonical representation: int64 minor units
+    when fixed point is enabled, float64 otherwise
+    Amounts with missing values stay float64, as int64 has no missing value
+    """
+    fixed_point = FIXED_POINT_AMOUNTS if fixed_point is None else fixed_point
+    
+    if pd.api.types.is_integer_dtype(amounts.dtype):
+        return amounts if fixed_point else amount_values(amounts)
+    
+    amounts = np.asarray(amounts, dtype=np.float64)
+    
+    if fixed_point and not np.isnan(amounts).any():
+        return to_minor_units(amounts)
+    
+    return amounts
+
+def sum_amounts(amounts, by=None):
+    """
+    Sum amounts, in total or per group, returning currency units
+    With fixed point enabled the sum runs on int64 minor units, so it is exact and
+    gives bit-identical totals whatever the row order or partitioning
+    """
+    if FIXED_POINT_AMOUNTS and not pd.api.types.is_integer_dtype(amounts.dtype) and not amounts.isna().any():
+        amounts = pd.Series(to_minor_units(amounts), index=amounts.index, name=amounts.name)
+    
+    if by is not None:
+        return amount_values(amounts.groupby(by, observed=True).sum())
+    
+    total = amounts.sum()
+    
+    return total / AMOUNT_MINOR_UNITS if pd.api.types.is_integer_dtype(amounts.dtype) else total
+
+def normalize_ledger(ledger, fixed_point=None):
+    """
+    Convert a ledger-like frame (strings, objects or categoricals) to the canonical schema:
+    dimensions encoded against the shared dictionaries, Period as quarterly periods,
+    Amount as int64 minor units (float64 with fixed point disabled)
+    """
+    normalized = {}
+    
+    for column in LEDGER_COLUMNS:
+        if column == "Amount":
+            normalized[column] = encode_amounts(ledger[column], fixed_point)
+        else:
+            normalized[column] = encode_dimension(ledger[column], column)
+    
+    return pd.DataFrame(normalized, index=ledger.index, copy=False)
+
+def conform_ledger(ledger):
+    """
+    Bring a canonical ledger up to the current shared dictionaries
+    Dictionaries only grow by appending, so the codes stay valid and are not rewritten
+    """
+    conformed = ledger.copy(deep=False)
+    
+    for column in LEDGER_DIMENSIONS:
+        conformed[column] = pd.Categorical.from_codes(ledger[column].cat.codes, dtype=dimension_dtype(column))
+    
+    return conformed
+
+def is_ledger_sorted(ledger):
+    """
+    Whether the ledger rows are in LEDGER_SORT_KEYS order
+    """
+    codes = [ledger[column].cat.codes.to_numpy().astype(np.int64) for column in LEDGER_SORT_KEYS]
+    
+    # Each row must not be lower than the previous one on the first key that differs
+    in_order = np.ones(max(len(ledger) - 1, 0), dtype=bool)
+    tied = np.ones(max(len(ledger) - 1, 0), dtype=bool)
+    
+    for key in codes:
+        step = np.diff(key)
+        in_order &= ~tied | (step >= 0)
+        tied &= step == 0
+    
+    return bool(in_order.all())
+
+def sort_ledger(ledger):
+    """
+    Order the ledger rows by LEDGER_SORT_KEYS codes (a stable sort, so rows of the
+    same key keep their order); sorted ledgers are returned as they are
+    """
+    if is_ledger_sorted(ledger):
+        return ledger
+    
+    order = np.lexsort([ledger[column].cat.codes.to_numpy() for column in reversed(LEDGER_SORT_KEYS)])
+    
+    return ledger.take(order).reset_index(drop=True)
+
+def to_storage_frame(ledger):
+    """
+    Prepare a canonical ledger for columnar storage
+    Periods are written as "2023-Q2" labels because Arrow has no categorical-of-period type
+    """
+    stored = ledger.copy(deep=False)
+    periods = ledger["Period"].cat.remove_unused_categories()
+    stored["Period"] = periods.cat.rename_categories([format_period(p) for p in periods.cat.categories])
+    
+    return stored
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import threading
+import numpy as np
+import pandas as pd
+from utils.ledger_schema import LEDGER_DIMENSIONS, amount_values, parse_periods
+
+# Dimension sets whose packed key space is at most this many cells per row (or
+# DENSE_MIN_CELLS) are aggregated with a dense bincount instead of hashing
+DENSE_MAX_CELLS_PER_ROW = 4
+DENSE_MIN_CELLS = 1 << 20
+
+class LedgerCube:
+    """
+    Pre-aggregated cube over the ledger dimensions
+    (Entity_ID x Account x Period x Cost_Center x Product x Currency)
+    
+    The base cuboid is the ledger itself at its finest grain (its dimension codes
+    and amounts). A query is answered from the smallest materialized cuboid that
+    covers its dimensions and filters; cuboids for new dimension sets are rolled
+    up from the smallest materialized superset on first use and kept, so only the
+    first query of a dimension set scans the ledger rows and repeated and
+    drill-down queries answer from aggregates.
+    
+    Query API (dimensions are the ledger column names):
+    - aggregate(dimensions, filters): amount by dimensions, filters as {dimension: value(s)}
+    - slice(dimension, value, dimensions): fix one dimension to one value
+    - dice(filters, dimensions): keep a sub-cube of several dimension values
+    - rollup(dimensions, dimension): remove a level of detail
+    - drilldown(dimensions, dimension): add a level of detail
+    Every query returns one row per combination, dimensions as categoricals and
+    the amount in currency units
+    """
+    
+    def __init__(self, ledger):
+        self.dtypes = {dimension: ledger[dimension].dtype for dimension in LEDGER_DIMENSIONS}
+        
+        base = {dimension: ledger[dimension].cat.codes.to_numpy() for dimension in LEDGER_DIMENSIONS}
+        base["amount"] = ledger["Amount"].to_numpy()
+        
+        self._cuboids = {frozenset(LEDGER_DIMENSIONS): base}
+        self._lock = threading.Lock()
+    
+    def _group(self, codes, amounts, dimensions):
+        """
+        Sum amounts by the combination of the given dimension codes
+        
+        The codes are packed into one int64 key over the range of codes present
+        (missing values, code -1, form their own group). When the key space is not much
+        larger than the number of rows the sums are a dense bincount, otherwise a
+        hash aggregation. Minor-unit amounts stay exact in the bincount as long as
+        the sums stay below 2**53 minor units
+        """
+        # Only the range of codes present is packed, e.g. the few quarters in the
+        # ledger rather than the whole period dictionary
+        lows = [int(codes[dimension].min()) if len(amounts) else 0 for dimension in dimensions]
+        sizes = [
+            int(codes[dimension].max()) - low + 1 if len(amounts) else 1
+            for dimension, low in zip(dimensions, lows)
+        ]
+        
+        keys = np.zeros(len(amounts), dtype=np.int64)
+        
+        for dimension, low, size in zip(dimensions, lows, sizes):
+            keys = keys * size + (codes[dimension].astype(np.int64) - low)
+        
+        n_cells = int(np.prod(sizes, dtype=np.float64))
+        
+        if n_cells <= max(DENSE_MAX_CELLS_PER_ROW * len(amounts), DENSE_MIN_CELLS):
+            present = np.flatnonzero(np.bincount(keys, minlength=n_cells))
+            sums = np.bincount(keys, weights=amounts, minlength=n_cells)[present]
+            
+            if np.issubdtype(amounts.dtype, np.integer):
+                sums = np.rint(sums).astype(amounts.dtype)
+        else:
+            grouped = pd.Series(amounts).groupby(keys, sort=True).sum()
+            present = grouped.index.to_numpy()
+            sums = grouped.to_numpy()
+        
+        unpacked = np.unravel_index(present, sizes) if dimensions else []
+        
+        cuboid = {
+            dimension: (unpacked[i] + lows[i]).astype(np.int32)
+            for i, dimension in enumerate(dimensions)
+        }
+        cuboid["amount"] = sums
+        
+        return cuboid
+    
+    def cuboid(self, dimensions):
+        """
+        Materialized cuboid for a set of dimensions (dict of code arrays and amounts)
+        """
+        key = frozenset(dimensions)
+        
+        with self._lock:
+            if key in self._cuboids:
+                return self._cuboids[key]
+            
+            # Roll up from the smallest materialized cuboid that has every dimension
+            source = min(
+                (cuboid for dimensions_, cuboid in self._cuboids.items() if key <= dimensions_),
+                key=lambda cuboid: len(cuboid["amount"])
+            )
+        
+        ordered = [dimension for dimension in LEDGER_DIMENSIONS if dimension in key]
+        cuboid = self._group(source, source["amount"], ordered)
+        
+        with self._lock:
+            return self._cuboids.setdefault(key, cuboid)
+    
+    def _filter_codes(self, dimension, values):
+        """
+        Codes of the filter values of a dimension (values not in the cube are ignored)
+        """
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        categories = self.dtypes[dimension].categories
+        
+        if dimension == "Period":
+            wanted = categories.get_indexer(parse_periods([str(value) for value in values]))
+        else:
+            wanted = categories.get_indexer(list(values))
+        
+        return wanted[wanted >= 0]
+    
+    def aggregate(self, dimensions=(), filters=None):
+        """
+        Amount by the given dimensions over the rows matching filters
+        """
+        dimensions = list(dimensions)
+        filters = filters or {}
+        cuboid = self.cuboid(set(dimensions) | set(filters))
+        
+        selected = np.ones(len(cuboid["amount"]), dtype=bool)
+        
+        for dimension, values in filters.items():
+            selected &= np.isin(cuboid[dimension], self._filter_codes(dimension, values))
+        
+        codes = {dimension: cuboid[dimension][selected] for dimension in dimensions}
+        amounts = cuboid["amount"][selected]
+        
+        # Filter-only dimensions are summed out of the (small) selection
+        if len(dimensions) < len(set(dimensions) | set(filters)):
+            ordered = [dimension for dimension in LEDGER_DIMENSIONS if dimension in dimensions]
+            grouped = self._group(codes, amounts, ordered)
+            codes = {dimension: grouped[dimension] for dimension in dimensions}
+            amounts = grouped["amount"]
+        
+        result = {
+            dimension: pd.Categorical.from_codes(codes[dimension], dtype=self.dtypes[dimension])
+            for dimension in dimensions
+        }
+        result["amount"] = amount_values(pd.Series(amounts)).to_numpy(dtype=np.float64)
+        
+        return pd.DataFrame(result)
+    
+    def slice(self, dimension, value, dimensions=(), filters=None):
+        """
+        Fix one dimension to one value
+        """
+        filters = dict(filters or {})
+        filters[dimension] = value
+        
+        return self.aggregate([d for d in dimensions if d != dimension], filters)
+    
+    def dice(self, filters, dimensions=()):
+        """
+        Keep the sub-cube where each filtered dimension takes one of the given values
+        """
+        return self.aggregate(dimensions, filters)
+    
+    def rollup(self, dimensions, dimension, filters=None):
+        """
+        Remove one level of detail from a query
+        """
+        return self.aggregate([d for d in dimensions if d != dimension], filters)
+    
+    def drilldown(self, dimensions, dimension, filters=None):
+        """
+        Add one level of detail to a query
+        """
+        dimensions = list(dimensions)
+        
+        if dimension not in dimensions:
+            dimensions.append(dimension)
+        
+        return self.aggregate(dimensions, filters)
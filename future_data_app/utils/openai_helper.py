@@ -8,6 +8,7 @@ import os
 import json
 import streamlit as st
 from openai import OpenAI
+from utils.cache import dataset_cache
 
 # The newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # Do not change this unless explicitly requested by the user
@@ -18,6 +19,20 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "your-api-key-here")
 # Initialize OpenAI client
 openai = OpenAI(api_key=OPENAI_API_KEY)
 
+@dataset_cache(maxsize=64, persist=True)
+def _request_analysis(data, prompt):
+    """
+    Send a prompt about a dataset to the OpenAI API and parse the JSON response
+    Responses are cached on the dataset fingerprint and the prompt; failures are not cached
+    """
+    response = openai.chat.completions.create(
+        model="gpt-4o",
+        messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"}
+    )
+    
+    return json.loads(response.choices[0].message.content)
+
 def generate_performance_explanation(data):
     """
     Generate AI-powered explanation of financial performance using OpenAI
@@ -61,15 +76,8 @@ def generate_performance_explanation(data):
         }}
         """
         
-        # Call the OpenAI API
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        
-        # Parse the response
-        analysis = json.loads(response.choices[0].message.content)
+        # Call the OpenAI API (cached per dataset fingerprint and prompt)
+        analysis = _request_analysis(data, prompt)
         
         return analysis
     except Exception as e:
@@ -139,15 +147,8 @@ def generate_data_quality_analysis(data):
         }}
         """
         
-        # Call the OpenAI API
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        
-        # Parse the response
-        analysis = json.loads(response.choices[0].message.content)
+        # Call the OpenAI API (cached per dataset fingerprint and prompt)
+        analysis = _request_analysis(data, prompt)
         
         return analysis
     except Exception as e:
@@ -282,15 +283,8 @@ def generate_forecast_recommendations(data, simulation_params=None):
         }}
         """
         
-        # Call the OpenAI API
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-        
-        # Parse the response
-        analysis = json.loads(response.choices[0].message.content)
+        # Call the OpenAI API (cached per dataset fingerprint and prompt)
+        analysis = _request_analysis(data, prompt)
         
         return analysis
     except Exception as e:
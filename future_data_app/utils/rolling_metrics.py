@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# In[ ]:
+
+
+import copy
+import hashlib
+from functools import cached_property
+import numpy as np
+import pandas as pd
+from utils.cache import dataset_cache
+from utils.ledger_schema import AMOUNT_MINOR_UNITS, COST_ACCOUNTS, REVENUE_ACCOUNT, encode_dimension, to_minor_units
+from utils.data_processor import process_cost_data, process_revenue_data
+
+# Quarters in a trailing window: four quarters make the trailing twelve months (TTM)
+ROLLING_WINDOW = 4
+
+# Quarterly measures of every series, rolled over the window
+ROLLING_MEASURES = ["revenue", "ebitda"]
+
+class RollingWindows:
+    """
+    Trailing window sums of many series (entities, products or the total) over
+    consecutive quarters
+    
+    The history is built for every series at once: per-quarter values are kept as
+    int64 minor units and window sums are differences of a cumulative sum, so
+    they are exact. A new quarter is added with with_quarter(), which moves each
+    window by one quarter (the new value in, the value leaving the window out)
+    instead of recomputing the history.
+    
+    Windows are immutable: with_quarter() returns new windows that share the
+    history arrays, so windows handed out by the cache are never changed.
+    Values are stored one quarter at a time as (measure x series) arrays, so a
+    new quarter only appends; series first seen in a later quarter are zero before it.
+    """
+    
+    def __init__(self, periods, series, values, window=ROLLING_WINDOW):
+        """
+        periods: consecutive quarterly periods; series: Index of series labels;
+        values: int64 minor units of shape (measure, series, period)
+        """
+        self.window = window
+        self.periods = list(periods)
+        self.series = pd.Index(series)
+        
+        # Window sums: cumulative sum minus the cumulative sum window quarters earlier
+        cumulative = np.cumsum(values, axis=2)
+        sums = cumulative.copy()
+        sums[:, :, window:] -= cumulative[:, :, :-window]
+        
+        self._values = [values[:, :, i] for i in range(values.shape[2])]
+        self._sums = [sums[:, :, i] for i in range(values.shape[2])]
+    
+    def _padded(self, column):
+        """
+        Quarter column extended with zeros to the current number of series
+        """
+        missing = len(self.series) - column.shape[1]
+        
+        return np.pad(column, ((0, 0), (0, missing))) if missing else column
+    
+    @cached_property
+    def fingerprint(self):
+        """
+        Content hash of the windows, so that windows with an added quarter key
+        caches apart from the windows they were built from
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((self.window, [str(period) for period in self.periods], list(self.series))).encode())
+        
+        for column in self._values:
+            digest.update(np.ascontiguousarray(column).data)
+        
+        return digest.hexdigest()
+    
+    def with_quarter(self, period, quarter):
+        """
+        Windows with the next quarter added: quarter is a frame indexed by series
+        label with a column per measure, in currency units. Only the windows move;
+        the history is not recomputed, and these windows are left unchanged
+        """
+        if self.periods and period != self.periods[-1] + 1:
+            raise ValueError(f"Expected the quarter after {self.periods[-1]}, got {period}")
+        
+        # Series seen for the first time are added with an empty history
+        series = self.series.append(quarter.index.difference(self.series))
+        quarter = quarter.reindex(series, fill_value=0)
+        
+        values = to_minor_units(quarter[ROLLING_MEASURES].to_numpy().T)
+        updated = copy.copy(self)
+        updated.__dict__.pop("fingerprint", None)
+        updated.series = series
+        
+        previous = updated._padded(self._sums[-1]) if self._sums else np.zeros_like(values)
+        leaving = updated._padded(self._values[-self.window]) if len(self._values) >= self.window else np.zeros_like(values)
+        
+        # New lists over the shared history arrays, which are never written to
+        updated.periods = self.periods + [period]
+        updated._values = self._values + [values]
+        updated._sums = self._sums + [previous + values - leaving]
+        
+        return updated
+    
+    def frame(self, dimension="series"):
+        """
+        Tidy frame of one row per period and series: the quarter's measures,
+        their trailing window sums (ttm_) and window averages (rolling_avg_),
+        NaN until window quarters of history exist
+        """
+        n_periods = len(self.periods)
+        n_series = len(self.series)
+        
+        if n_periods == 0:
+            columns = ["period", dimension] + ROLLING_MEASURES
+            columns += [f"{prefix}_{measure}" for measure in ROLLING_MEASURES for prefix in ["ttm", "rolling_avg"]]
+            
+            return pd.DataFrame(columns=columns)
+        
+        values = np.stack([self._padded(column) for column in self._values], axis=2) / AMOUNT_MINOR_UNITS
+        sums = np.stack([self._padded(column) for column in self._sums], axis=2) / AMOUNT_MINOR_UNITS
+        sums[:, :, :self.window - 1] = np.nan
+        
+        # Period-major rows, one per period and series
+        columns = {
+            "period": encode_dimension(pd.PeriodIndex(self.periods).repeat(n_series), "Period"),
+            dimension: self.series.take(np.tile(np.arange(n_series), n_periods))
+        }
+        
+        for i, measure in enumerate(ROLLING_MEASURES):
+            columns[measure] = values[i].T.reshape(-1)
+        
+        for i, measure in enumerate(ROLLING_MEASURES):
+            columns[f"ttm_{measure}"] = sums[i].T.reshape(-1)
+            columns[f"rolling_avg_{measure}"] = sums[i].T.reshape(-1) / self.window
+        
+        return pd.DataFrame(columns)
+
+def _quarterly_measures(data, dimension):
+    """
+    Revenue and EBITDA (revenue less COGS and operating expenses) by period and,
+    with a ledger dimension, by member, as a (period, member) x measure frame
+    """
+    if dimension is None:
+        # Totals: the period aggregates of process_revenue_data and process_cost_data
+        revenue = process_revenue_data(data).set_index("period")["amount"]
+        costs = process_cost_data(data)["total_costs"].set_index("period")["amount"]
+        measures = pd.DataFrame({"revenue": revenue, "ebitda": revenue - costs.reindex(revenue.index, fill_value=0)})
+        measures.index = pd.MultiIndex.from_arrays([measures.index, ["Total"] * len(measures)])
+        
+        return measures
+    
+    lines = data.cube.aggregate(["Period", dimension, "Account"], {"Account": [REVENUE_ACCOUNT] + COST_ACCOUNTS})
+    is_revenue = (lines["Account"] == REVENUE_ACCOUNT).to_numpy()
+    lines["revenue"] = np.where(is_revenue, lines["amount"], 0.0)
+    lines["ebitda"] = np.where(is_revenue, lines["amount"], -lines["amount"])
+    
+    return lines.groupby(["Period", dimension], observed=True)[ROLLING_MEASURES].sum()
+
+@dataset_cache()
+def get_rolling_windows(data, dimension="Entity_ID", window=ROLLING_WINDOW):
+    """
+    Rolling windows of revenue and EBITDA for every member of a ledger dimension
+    (Entity_ID, Product, ...) or, with dimension=None, for the total
+    Cached per dataset. load_data() and refresh_data() rebuild the dataset from
+    the full export, so these windows are recomputed with it. with_quarter() is for
+    callers that hold windows and receive a quarter's figures on their own; it
+    gives the same windows as a rebuild (the cached windows are not changed)
+    """
+    measures = _quarterly_measures(data, dimension)
+    
+    if measures.empty:
+        return RollingWindows([], pd.Index([]), np.zeros((len(ROLLING_MEASURES), 0, 0), dtype=np.int64), window)
+    
+    # Gap-free quarters from the first to the last period, zero where a series has no lines
+    period_labels = pd.PeriodIndex(measures.index.get_level_values(0))
+    periods = pd.period_range(period_labels.min(), period_labels.max(), freq=period_labels.freq)
+    series = measures.index.get_level_values(1).unique()
+    
+    grid = pd.MultiIndex.from_product([periods, series])
+    measures.index = pd.MultiIndex.from_arrays([period_labels, measures.index.get_level_values(1)])
+    measures = measures.reindex(grid, fill_value=0)
+    
+    # (measure, series, period) minor units
+    values = to_minor_units(measures.to_numpy().T).reshape(len(ROLLING_MEASURES), len(periods), len(series))
+    
+    return RollingWindows(periods, series, values.transpose(0, 2, 1), window)
+
+def calculate_rolling_metrics(data, dimension="Entity_ID", window=ROLLING_WINDOW):
+    """
+    TTM revenue, TTM EBITDA and rolling 4-quarter averages for every period and
+    member of a ledger dimension, or for the total with dimension=None
+    """
+    return get_rolling_windows(data, dimension, window).frame(dimension or "series")